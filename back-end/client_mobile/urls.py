@@ -1,5 +1,6 @@
 from django.urls import path
 from core.views import client_signup_step1, client_signup_step2, client_signup_step3, client_signup_step4, client_signup_step5, client_login
+from core import client_views
 from . import views
 
 
@@ -35,11 +36,16 @@ urlpatterns = [
     path('tables/available/', views.get_available_tables, name='get_available_tables'),
     
     # Menu endpoints
+    path('catalog/', views.get_catalog, name='get_catalog'),
     path('menus/', views.get_menus, name='get_menus'),
     path('categories/', views.get_categories, name='get_categories'),
     path('categories/<str:category_id>/sub-categories/', views.get_subcategories, name='get_subcategories'),
+    path('plats/search/', views.search_plats, name='search_plats'),
+    path('plats/trending/', client_views.get_trending_plats, name='get_trending_plats'),
     path('plats/<str:plat_id>/', views.get_plat_details, name='get_plat_details'),
     path('plats/<str:plat_id>/similar/', views.get_similar_dishes, name='get_similar_dishes'),
+    path('plats/<str:plat_id>/images/', views.get_plat_images, name='get_plat_images'),
+    path('plats/<str:plat_id>/images/<str:filename>', views.get_plat_image_file, name='get_plat_image_file'),
    
     
     # Preferences endpoints
@@ -56,6 +62,9 @@ urlpatterns = [
     
     # Notifications endpoints
     path('notifications/', views.get_notifications, name='get_notifications'),
+    path('notifications/unread-count/', views.get_unread_notifications_count, name='get_unread_notifications_count'),
+    path('notifications/poll/', client_views.poll_notifications, name='poll_notifications'),
+    path('notifications/stream/', client_views.stream_notifications, name='stream_notifications'),
     path('notifications/<str:notification_id>/', views.get_notification_details, name='get_notification_details'),
     path('notifications/<str:id>/mark_as_read/', views.mark_notification_as_read, name='mark_notification_as_read'),
     
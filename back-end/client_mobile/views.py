@@ -1,15 +1,27 @@
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
 from rest_framework import status
+from django.views.decorators.http import condition
 from django.utils import timezone
 from datetime import datetime
 from core.permissions import IsClient
 from core.firebase_crud import firebase_crud
+from core.popularity import popularity_tracker
+from core.catalog import catalog
+from core.allergens import filter_safe_dishes, safe_recommendations
+from core import catalog_bundle, client_views, notifications, preference_recommender, reservation_booking, reservation_index
+from core.table_availability import table_availability
+from core.floor_plan import floor_plan
+from core.conditional import inbox_condition
 from firebase_admin import firestore
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Upcoming reservations read for the dashboard, the cancelled ones are skipped
+UPCOMING_RESERVATIONS_SCAN = 5
+CANCELLED_RESERVATION_STATES = ('cancelled', 'annulee')
+
 # ==================
 # Profile Endpoints
 # ==================
@@ -86,17 +98,21 @@ def get_recommendations(request):
         current_preferences = current_client.get('preferences', [])
         if not current_preferences:
             logger.info(f"Client {client_id} has no preferences set - using fallback")
-            return _get_fallback_recommendations('no_preferences')
+            return _get_fallback_recommendations('no_preferences', current_client)
         
         logger.info(f"Client {client_id} preferences: {current_preferences}")
         
         # Generate preference-based recommendations
         recommendations = _generate_preference_based_recommendations(current_preferences, client_id)
         
+        # Exclude dishes unsafe for the client's allergies and restrictions
+        popular_ids = [dish_id for dish_id, _ in popularity_tracker.top_k(30)]
+        dish_ids = safe_recommendations(recommendations['dish_ids'], current_client, padding=popular_ids)
+        
         return Response({
-            'dish_ids': recommendations['dish_ids'],
+            'dish_ids': dish_ids,
             'source': 'preference_based',
-            'count': len(recommendations['dish_ids']),
+            'count': len(dish_ids),
             'based_on_preferences': current_preferences,
             'subcategories_used': recommendations['subcategories_used']
         })
@@ -114,212 +130,38 @@ def _generate_preference_based_recommendations(preferences, client_id):
     """
     Generate recommendations based on user preferences mapped to subcategories
     Returns exactly 8 recommendations distributed based on number of preferences
+    (core.preference_recommender, dishes from the catalog replica)
     """
-    import random
-    from datetime import datetime
-    
-    # Preference to subcategory mapping (using actual idSousCat values)
-    PREFERENCE_MAPPING = {
-        'Soupes et Potages': ['scat_soupe'],
-        'Salades et Crudités': ['scat_salade'],
-        'Poissons et Fruits de mer': ['scat_poisson'],
-        'Cuisine traditionnelle': ['scat_couscous', 'scat_tagine'],
-        'Viandes': ['scat_viande'],
-        'Sandwichs et burgers': ['scat_feuillete'],
-        'Végétariens': ['scat_vegetarien'],
-        'Crémes et Mousses': ['scat_gateau'],
-        'Pâtisseries': ['scat_patisserie'],
-        'Fruits et Sorbets': ['scat_froid']
-    }
-    
-    # Determine distribution based on number of preferences
-    num_preferences = len(preferences)
-    if num_preferences == 1:
-        distribution = [8]
-    elif num_preferences == 2:
-        distribution = [4, 4]
-    else:  # 3 or more preferences
-        distribution = [3, 3, 2]
-        preferences = preferences[:3]  # Only use first 3 preferences
-    
-    recommended_dish_ids = []
-    subcategories_used = []
-    
-    # Use client_id and current time to create seed for randomization
-    # This ensures different results for same client on different calls
-    random_seed = hash(f"{client_id}_{datetime.now().strftime('%Y%m%d%H')}") % 10000
-    random.seed(random_seed)
-    
-    for i, preference in enumerate(preferences):
-        if i >= len(distribution):
-            break
-            
-        needed_count = distribution[i]
-        subcategories = PREFERENCE_MAPPING.get(preference, [])
-        
-        if not subcategories:
-            logger.warning(f"No subcategory mapping found for preference: {preference}")
-            continue
-        
-        # Handle special case for 'Cuisine traditionnelle' with multiple subcategories
-        if len(subcategories) > 1 and preference == 'Cuisine traditionnelle':
-            # Split between Couscous and Tagine (2 each for most cases)
-            couscous_count = needed_count // 2
-            tagine_count = needed_count - couscous_count
-            
-            # Get dishes from Couscous
-            couscous_dishes = _get_dishes_from_subcategory('scat_couscous', couscous_count)
-            recommended_dish_ids.extend(couscous_dishes)
-            if couscous_dishes:
-                subcategories_used.append('scat_couscous')
-            
-            # Get dishes from Tagine
-            tagine_dishes = _get_dishes_from_subcategory('scat_tagine', tagine_count)
-            recommended_dish_ids.extend(tagine_dishes)
-            if tagine_dishes:
-                subcategories_used.append('scat_tagine')
-        else:
-            # Single subcategory
-            subcat = subcategories[0]
-            dishes = _get_dishes_from_subcategory(subcat, needed_count)
-            recommended_dish_ids.extend(dishes)
-            if dishes:
-                subcategories_used.append(subcat)
-    
-    # Remove duplicates while preserving order
-    seen = set()
-    unique_dish_ids = []
-    for dish_id in recommended_dish_ids:
-        if dish_id not in seen:
-            seen.add(dish_id)
-            unique_dish_ids.append(dish_id)
-    
-    # If we don't have enough recommendations (less than 8), pad with random dishes
-    if len(unique_dish_ids) < 8:
-        logger.info(f"Only found {len(unique_dish_ids)} recommendations, padding with random dishes")
-        remaining_needed = 8 - len(unique_dish_ids)
-        additional_dishes = _get_random_dishes(remaining_needed, exclude_ids=set(unique_dish_ids))
-        unique_dish_ids.extend(additional_dishes)
-    
-    # Ensure we have exactly 8 recommendations
-    unique_dish_ids = unique_dish_ids[:8]
-    
-    logger.info(f"Generated {len(unique_dish_ids)} preference-based recommendations")
-    
-    return {
-        'dish_ids': unique_dish_ids,
-        'subcategories_used': subcategories_used
-    }
+    recommendations = preference_recommender.recommend(
+        preferences,
+        catalog.derived('subcategory_dishes', preference_recommender.subcategory_dishes),
+        catalog.snapshot().plats.keys(),
+        preference_recommender.client_rng(client_id)
+    )
+    logger.info(f"Generated {len(recommendations['dish_ids'])} preference-based recommendations")
+    return recommendations
 
 
-def _get_dishes_from_subcategory(subcategory, count):
-    """
-    Get random dishes from a specific subcategory
-    """
-    import random
-    
-    try:
-        logger.info(f"Fetching {count} dishes from subcategory: {subcategory}")
-        
-        # Query dishes from 'plats' collection by 'idSousCat'
-        dishes = firebase_crud.query_collection(
-            'plats',
-            'idSousCat',
-            '==',
-            subcategory
-        )
-        
-        if not dishes:
-            logger.warning(f"No dishes found for subcategory: {subcategory}")
-            return []
-        
-        # Extract dish IDs
-        dish_ids = []
-        for dish in dishes:
-            dish_id = dish.get('id')
-            if dish_id:
-                dish_ids.append(str(dish_id))
-        
-        if not dish_ids:
-            logger.warning(f"No valid dish IDs found for subcategory: {subcategory}")
-            return []
-        
-        # Randomly select the requested number of dishes
-        selected_count = min(count, len(dish_ids))
-        selected_dishes = random.sample(dish_ids, selected_count)
-        
-        logger.info(f"Selected {len(selected_dishes)} dishes from {len(dish_ids)} available in {subcategory}")
-        return selected_dishes
-        
-    except Exception as e:
-        logger.error(f"Error fetching dishes from subcategory {subcategory}: {str(e)}")
-        return []
-
-
-def _get_random_dishes(count, exclude_ids=None):
-    """
-    Get random dishes from any category to pad recommendations
-    """
-    import random
-    
-    if exclude_ids is None:
-        exclude_ids = set()
-    
-    try:
-        logger.info(f"Fetching {count} random dishes for padding")
-        
-        # Get all dishes
-        all_dishes = firebase_crud.get_all_docs('plats')
-        
-        if not all_dishes:
-            return []
-        
-        # Extract dish IDs, excluding already selected ones
-        available_dish_ids = []
-        for dish in all_dishes:
-            dish_id = dish.get('id')
-            if dish_id and str(dish_id) not in exclude_ids:
-                available_dish_ids.append(str(dish_id))
-        
-        if not available_dish_ids:
-            return []
-        
-        # Randomly select dishes
-        selected_count = min(count, len(available_dish_ids))
-        selected_dishes = random.sample(available_dish_ids, selected_count)
-        
-        logger.info(f"Selected {len(selected_dishes)} random padding dishes")
-        return selected_dishes
-        
-    except Exception as e:
-        logger.error(f"Error fetching random dishes: {str(e)}")
-        return []
-
-
-def _get_fallback_recommendations(reason):
+def _get_fallback_recommendations(reason, client=None):
     """
     Provide fallback recommendations when no preferences are available
+    Dishes unsafe for the client's allergies and restrictions are left out
     """
     try:
         logger.info(f"Using fallback recommendations due to: {reason}")
         
-        # Get 8 random dishes from popular categories
-        fallback_subcategories = ['scat_viande', 'scat_salade', 'scat_poisson', 'scat_couscous']
-        fallback_dishes = []
-        
-        for subcat in fallback_subcategories:
-            dishes = _get_dishes_from_subcategory(subcat, 2)
-            fallback_dishes.extend(dishes)
-        
-        # Remove duplicates and ensure we have 8
-        fallback_dishes = list(set(fallback_dishes))[:8]
+        # Get the 8 most popular dishes (time-decayed order counts, read from memory)
+        popular_ids = [dish_id for dish_id, _ in popularity_tracker.top_k(30)]
+        fallback_dishes = filter_safe_dishes(popular_ids, client)[:8]
         
         # If still not enough, pad with random dishes
         if len(fallback_dishes) < 8:
-            additional_dishes = _get_random_dishes(8 - len(fallback_dishes), exclude_ids=set(fallback_dishes))
+            additional_dishes = preference_recommender.random_dishes(
+                catalog.snapshot().plats.keys(), 8 - len(fallback_dishes), exclude_ids=fallback_dishes
+            )
             fallback_dishes.extend(additional_dishes)
         
-        fallback_dishes = fallback_dishes[:8]
+        fallback_dishes = safe_recommendations(fallback_dishes, client)
         
         return Response({
             'dish_ids': fallback_dishes,
@@ -730,44 +572,49 @@ def create_reservation(request):
         if party_size <= 0 or party_size > 8:
             return Response({'error': 'Party size must be between 1 and 8'}, status=status.HTTP_400_BAD_REQUEST)
         
-        # Check if table exists
-        table = firebase_crud.get_doc('tables', table_id)
-        if not table:
-            print(f"ERREUR: Table {table_id} non trouvée dans Firestore")
-            return Response({'error': 'Table not found'}, status=status.HTTP_404_NOT_FOUND)
-        else:
-            print(f"Table trouvée: {table}")
-        
-        # NOUVELLE VERIFICATION : Vérifier si la table est déjà réservée
-        table_state = table.get('etatTable', '').lower()
-        if table_state == 'reservee':
-            print(f"ERREUR: Table {table_id} est déjà réservée (état: {table_state})")
+        # Format date_time for Firestore
+        date_time = f"{date}T{time}"
+        try:
+            slot_start = reservation_index.parse_slot(date_time)
+        except ValueError:
+            return Response({'error': 'Invalid date or time format'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        # Pré-vérification en mémoire du créneau (core.table_availability)
+        if not table_availability.is_free(table_id, slot_start):
+            print(f"ERREUR: Table {table_id} déjà réservée sur le créneau {date_time}")
             return Response({
                 'error': 'Table déjà réservée', 
-                'message': 'Cette table est déjà réservée. Veuillez choisir une autre table.'
+                'message': 'Cette table est déjà réservée sur ce créneau. Veuillez choisir une autre table ou un autre horaire.'
             }, status=status.HTTP_409_CONFLICT)
         
-        # Check if table capacity is sufficient
-        if table.get('nbrPersonne', 0) < party_size:
-            return Response({'error': 'Table capacity is insufficient for the party size'}, status=status.HTTP_400_BAD_REQUEST)
-        
-        # Format date_time for Firestore
-        date_time = f"{date}T{time}"
-        
-        # Create reservation
+        # Create reservation, claim its slots and mark the table in one transaction
         reservation_data = {
             'client_id': client_id,
-            'table_id': table_id,
             'date_time': date_time,
             'party_size': party_size,
             'status': 'en_attente',
             'created_at': firestore.SERVER_TIMESTAMP
         }
+        try:
+            reservation_id = reservation_booking.book_table(
+                firebase_crud.db, table_id, reservation_data, party_size,
+                table_update={'etatTable': 'reservee'}
+            )
+        except reservation_booking.TableNotFound:
+            print(f"ERREUR: Table {table_id} non trouvée dans Firestore")
+            return Response({'error': 'Table not found'}, status=status.HTTP_404_NOT_FOUND)
+        except reservation_booking.SlotUnavailable:
+            return Response({
+                'error': 'Table déjà réservée', 
+                'message': 'Cette table est déjà réservée sur ce créneau. Veuillez choisir une autre table ou un autre horaire.'
+            }, status=status.HTTP_409_CONFLICT)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
         
-        reservation_id = firebase_crud.create_doc('reservations', reservation_data)
-        
-        # Update table status to 'reservee'
-        firebase_crud.update_doc('tables', table_id, {'etatTable': 'reservee'})
+        table_availability.apply_reservation(reservation_id, dict(
+            reservation_data, table_id=table_id, slot_start=slot_start
+        ))
+        floor_plan.invalidate()
         
         print(f"Réservation créée avec succès: {reservation_id}")
         return Response({
@@ -791,12 +638,17 @@ def cancel_reservation(request, reservation_id):
         if not reservation or reservation.get('client_id') != client_id:
             return Response({'error': 'Reservation not found'}, status=status.HTTP_404_NOT_FOUND)
         
-        # Check if reservation is still pending/confirmed
-        if reservation.get('status') not in ['confirmed', 'pending']:
+        # Update reservation status and release its slots, if it is still pending/confirmed
+        try:
+            reservation_booking.cancel_reservation(
+                firebase_crud.db, reservation_id, cancellable=('confirmed', 'pending')
+            )
+        except reservation_booking.ReservationNotFound:
+            return Response({'error': 'Reservation not found'}, status=status.HTTP_404_NOT_FOUND)
+        except reservation_booking.ReservationNotCancellable:
             return Response({'error': 'Only pending reservations can be cancelled'}, status=status.HTTP_400_BAD_REQUEST)
-        
-        # Update reservation status
-        firebase_crud.update_doc('reservations', reservation_id, {'status': 'cancelled'})
+        table_availability.apply_reservation(reservation_id, None)
+        floor_plan.invalidate()
         
         return Response({'message': 'Reservation cancelled successfully'})
     except Exception as e:
@@ -806,8 +658,30 @@ def cancel_reservation(request, reservation_id):
 @api_view(['GET'])
 @permission_classes([IsClient])
 def get_available_tables(request):
-    """Get available tables for reservation"""
+    """
+    Get available tables for reservation.
+    Query params (optional): date (YYYY-MM-DD), time (HH:MM), party_size.
+    With date and time, returns the tables free for the whole slot, best fit first.
+    """
     try:
+        date = request.query_params.get('date')
+        time = request.query_params.get('time')
+        if date and time:
+            try:
+                slot_start = reservation_index.parse_slot(f"{date}T{time}")
+                party_size = int(request.query_params.get('party_size', 1))
+            except ValueError:
+                return Response({'error': 'Invalid date, time or party_size'}, status=status.HTTP_400_BAD_REQUEST)
+            
+            available_tables = [{
+                'id': table['id'],
+                'number': table.get('number'),
+                'capacity': table['capacity'],
+                'type': table.get('type', 'Standard'),
+                'status': 'libre'
+            } for table in table_availability.find_tables(slot_start, party_size)]
+            return Response({'tables': available_tables})
+        
         # Get all tables from Firebase
         tables = firebase_crud.get_all_docs('tables')
         
@@ -833,39 +707,46 @@ def get_available_tables(request):
 # Menu Endpoints
 # ==================
 
+@api_view(['GET'])
+@permission_classes([IsClient])
+@condition(etag_func=catalog_bundle.etag)
+def get_catalog(request):
+    """
+    Whole catalog (categories, sous-categories, dishes with ingredients, menus) in one response
+    Query params: since (version of the catalog the app already has) for only the changes
+    """
+    try:
+        return catalog_bundle.catalog_response(request)
+    except Exception as e:
+        logger.error(f"Error getting catalog: {str(e)}")
+        return Response({'error': 'Failed to retrieve catalog'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
 @api_view(['GET'])
 @permission_classes([IsClient])
 def get_menus(request):
-    """Get all menus"""
+    """Get all menus, without the dishes unsafe for the client's allergies and restrictions"""
     try:
-        menus = firebase_crud.get_all_docs('menus')
+        snapshot = catalog.snapshot()
+        client = firebase_crud.get_doc('clients', request.user.uid)
         
         # Get dishes for each menu
         menu_list = []
-        for menu in menus:
-            # Get menu-plat relations
-            menu_plats = firebase_crud.query_collection(
-                'menu_plat',
-                'idM',
-                '==',
-                menu['id']
-            )
+        for menu_id, menu in snapshot.menus.items():
+            plat_ids = [p for p in snapshot.menu_plats.get(menu_id, []) if p in snapshot.plats]
             
             # Get plat details
             dishes = []
-            for mp in menu_plats:
-                plat_id = mp.get('idP')
-                plat = firebase_crud.get_doc('plats', plat_id)
-                if plat:
-                    dishes.append({
-                        'id': plat_id,
-                        'nom': plat.get('nom', ''),
-                        'description': plat.get('description', ''),
-                        'prix': plat.get('prix', 0)  
-                    })
+            for plat_id in filter_safe_dishes(plat_ids, client):
+                plat = snapshot.plats[plat_id]
+                dishes.append({
+                    'id': plat_id,
+                    'nom': plat.get('nom', ''),
+                    'description': plat.get('description', ''),
+                    'prix': plat.get('prix', 0)  
+                })
             
             menu_list.append({
-                'id': menu['id'],
+                'id': menu_id,
                 'nomMenu': menu.get('nomMenu', ''),
                 'dishes': dishes
             })
@@ -877,14 +758,15 @@ def get_menus(request):
 
 @api_view(['GET'])
 @permission_classes([IsClient])
+@condition(etag_func=catalog.etag)
 def get_categories(request):
-    """Get all dish categories"""
+    """Get all dish categories (catalog replica)"""
     try:
-        categories = firebase_crud.get_all_docs('categories')
+        categories = catalog.snapshot().categories
         category_list = [{
-            'id': cat['id'],
+            'id': cat_id,
             'nomCat': cat.get('nomCat', '')
-        } for cat in categories]
+        } for cat_id, cat in categories.items()]
         
         return Response(category_list)
     except Exception as e:
@@ -916,10 +798,11 @@ def get_subcategories(request, category_id):
 
 @api_view(['GET'])
 @permission_classes([IsClient])
+@condition(etag_func=catalog.etag)
 def get_plat_details(request, plat_id):
-    """Get detailed information for a specific dish"""
+    """Get detailed information for a specific dish (catalog replica)"""
     try:
-        plat = firebase_crud.get_doc('plats', plat_id)
+        plat = catalog.snapshot().plats.get(plat_id)
         if not plat:
             return Response({'error': 'Dish not found'}, status=status.HTTP_404_NOT_FOUND)
         
@@ -1143,26 +1026,32 @@ def get_recommendation_details(request, recommendation_id):
 
 @api_view(['GET'])
 @permission_classes([IsClient])
+@inbox_condition(lambda request: [notifications.inbox_id('client', request.user.uid)])
 def get_notifications(request):
-    """Get client's notifications"""
+    """
+    Get client's notifications, most recent first, one page at a time
+    Query params: page_size (default 50), cursor (X-Next-Cursor of the previous page), unread=true
+    """
     try:
         client_id = request.user.uid
-
-        # Update this query to match your database structure
-        notifications = firebase_crud.query_collection(
-            'notifications',
-            'recipient_id',  # Change from 'client_id' to match setup_firebase_db.py
-            '==',
-            client_id,
-            order_by='created_at',
-            desc=True
+        try:
+            page_size, cursor, unread_only = notifications.page_params(request.query_params)
+        except ValueError:
+            return Response({'error': 'page_size must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+
+        items, next_cursor = notifications.list_notifications(
+            firebase_crud.db,
+            notifications.inbox_id('client', client_id),
+            page_size=page_size,
+            cursor=cursor,
+            unread_only=unread_only
         )
 
         # Format the response
         notifications_list = []
-        for notification in notifications:
+        for notification in items:
             notifications_list.append({
-                'id': notification['id'],  # Changé de .id à ['id']
+                'id': notification['id'],
                 'title': notification.get('title', ''),
                 'message': notification.get('message', ''),
                 'created_at': notification.get('created_at', ''),
@@ -1170,31 +1059,35 @@ def get_notifications(request):
                 'type': notification.get('type', 'general')
             })
 
-        return Response(notifications_list)
+        response = Response(notifications_list)
+        if next_cursor:
+            response['X-Next-Cursor'] = next_cursor
+        return response
     except Exception as e:
         logger.error(f"Error getting notifications: {str(e)}")  # This will show the actual error
         return Response({'error': f'Failed to retrieve notifications: {str(e)}'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+@api_view(['GET'])
+@permission_classes([IsClient])
+def get_unread_notifications_count(request):
+    """Unread badge of the client's inbox"""
+    try:
+        inbox = notifications.inbox_id('client', request.user.uid)
+        return Response({'unread_count': notifications.unread_count(firebase_crud.db, inbox)})
+    except Exception as e:
+        logger.error(f"Error getting unread notifications count: {str(e)}")
+        return Response({'error': 'Failed to retrieve unread notifications count'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
     
 @api_view(['PUT'])
 @permission_classes([IsClient])
 def mark_notification_as_read(request, id):
     """Mark a notification as read"""
     try:
-        client_id = request.user.uid
-        
-        # Get the notification
-        notification = firebase_crud.get_document('notifications', id)
-        
-        if not notification:
+        # Only the client's own inbox is looked up
+        inbox = notifications.inbox_id('client', request.user.uid)
+        if notifications.mark_read(firebase_crud.db, inbox, id) is None:
             return Response({'error': 'Notification not found'}, status=status.HTTP_404_NOT_FOUND)
         
-        # Verify the notification belongs to the client
-        if notification.get('recipient_id') != client_id:
-            return Response({'error': 'Unauthorized'}, status=status.HTTP_403_FORBIDDEN)
-        
-        # Update the notification
-        firebase_crud.update_document('notifications', id, {'read': True})
-        
         return Response({'success': True})
     except Exception as e:
         logger.error(f"Error marking notification as read: {str(e)}")
@@ -1204,23 +1097,14 @@ def mark_notification_as_read(request, id):
 @api_view(['GET'])
 @permission_classes([IsClient])
 def get_notification_details(request, notification_id):
-    """Get detailed information for a specific notification"""
+    """Get detailed information for a specific notification (marks it as read)"""
     try:
-        client_id = request.user.uid
-        
-        # Get notification document
-        notification = firebase_crud.get_doc('notifications', notification_id)
-        if not notification or notification.get('recipient_id') != client_id:  # Changed to recipient_id
+        inbox = notifications.inbox_id('client', request.user.uid)
+        notification = notifications.mark_read(firebase_crud.db, inbox, notification_id)
+        if notification is None:
             return Response({'error': 'Notification not found'}, status=status.HTTP_404_NOT_FOUND)
         
-        # Mark as read
-        if not notification.get('read', False):
-            firebase_crud.update_doc('notifications', notification_id, {'read': True})
-        
-        # Return notification details (this was missing)
-        notification['id'] = notification_id  # Add the ID to the response
-        
-        return Response(notification)  # Return the notification object
+        return Response(notification)
     except Exception as e:
         logger.error(f"Error getting notification details: {str(e)}")
         return Response({'error': 'Failed to retrieve notification details'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
@@ -1238,92 +1122,55 @@ def get_dashboard(request):
         client_id = request.user.uid
         dashboard_data = {}
 
-        # Get top recommended dish without sorting in the query
-        recommendations = firebase_crud.query_collection(
-            'recommandations',
-            'idC',
-            '==',
-            client_id
-        )
-        
-        # Sort in memory
-        recommendations = sorted(recommendations, key=lambda x: x.get('date_generation', ''), reverse=True)
-        
-        if recommendations:
-            recommendation_id = recommendations[0]['id']
-            recommended_plats = firebase_crud.query_collection(
-                'recommandation_plat',
-                'idR',
-                '==',
-                recommendation_id,
-                limit=1
-            )
-
-            if recommended_plats:
-                plat_id = recommended_plats[0].get('idP')
-                plat = firebase_crud.get_doc('plats', plat_id)
+        # Get top recommended dish: the current most popular one (in-memory counters, catalog replica)
+        top_dishes = popularity_tracker.top_k(1)
+        if top_dishes:
+            plat_id = top_dishes[0][0]
+            plat = catalog.snapshot().plats.get(plat_id)
 
-                if plat:
-                    dashboard_data['top_recommendation'] = {
-                        'id': plat_id,
-                        'nom': plat.get('nom', ''),
-                        'description': plat.get('description', ''),
-                        'prix': plat.get('prix', 0),
-                        'note': plat.get('note', 0)
-                    }
+            if plat:
+                dashboard_data['top_recommendation'] = {
+                    'id': plat_id,
+                    'nom': plat.get('nom', ''),
+                    'description': plat.get('description', ''),
+                    'prix': plat.get('prix', 0),
+                    'note': plat.get('note', 0)
+                }
 
-        # Get upcoming reservation without sorting in the query
-        reservations = firebase_crud.query_collection(
-            'reservations',
-            'client_id',
-            '==',
-            client_id
-        )
-        
-        # Sort in memory
-        reservations = sorted(reservations, key=lambda x: x.get('date_time', ''))
+        # Next reservation, filtered, ordered and limited by Firestore (query spec 'client_upcoming_reservations')
+        upcoming = firebase_crud.db.collection('reservations')\
+            .where('client_id', '==', client_id)\
+            .where('slot_start', '>=', timezone.now())\
+            .order_by('slot_start')\
+            .limit(UPCOMING_RESERVATIONS_SCAN)
+        reservations = []
+        for doc in upcoming.stream():
+            reservation = doc.to_dict()
+            reservation['id'] = doc.id
+            # Only include reservation if it's not cancelled
+            if reservation.get('status') not in CANCELLED_RESERVATION_STATES:
+                reservations.append(reservation)
         
         if reservations:
             res = reservations[0]
-            # Only include reservation if it's in the future and not cancelled
-            if res.get('status') != 'cancelled':
-                table_id = res.get('table_id')
-                table = firebase_crud.get_doc('tables', table_id)
-
-                dashboard_data['upcoming_reservation'] = {
-                    'id': res['id'],
-                    'date_time': res.get('date_time', ''),
-                    'party_size': res.get('party_size', 0),
-                    'status': res.get('status', ''),
-                    'table': {
-                        'id': table_id,
-                        'number': table.get('number', 0) if table else None
-                    }
-                }
-
-        # Get unread notifications count
-        notifications = firebase_crud.query_collection(
-            'notifications',
-            'recipient_id',
-            '==',
-            client_id,
-            where_field='read',
-            where_op='==',
-            where_value=False
-        )
+            table_id = res.get('table_id')
+            table = firebase_crud.get_doc('tables', table_id)
 
-        dashboard_data['unread_notifications'] = len(notifications)
+            dashboard_data['upcoming_reservation'] = {
+                'id': res['id'],
+                'date_time': res.get('date_time', ''),
+                'party_size': res.get('party_size', 0),
+                'status': res.get('status', ''),
+                'table': {
+                    'id': table_id,
+                    'number': table.get('number', 0) if table else None
+                }
+            }
 
-        # Get latest 3 notifications without sorting in the query
-        recent_notifications = firebase_crud.query_collection(
-            'notifications',
-            'recipient_id',
-            '==',
-            client_id
-        )
-        
-        # Sort in memory and limit to 3
-        recent_notifications = sorted(recent_notifications, key=lambda x: x.get('created_at', ''), reverse=True)[:3]
+        # Unread badge and latest 3 notifications from the client's inbox
+        inbox = notifications.inbox_id('client', client_id)
+        dashboard_data['unread_notifications'] = notifications.unread_count(firebase_crud.db, inbox)
+        recent_notifications, _ = notifications.list_notifications(firebase_crud.db, inbox, page_size=3)
 
         dashboard_data['recent_notifications'] = [{
             'id': n['id'],
@@ -1343,13 +1190,35 @@ def get_dashboard(request):
         logger.error(f"Error getting dashboard: {str(e)}")
         return Response({'error': 'Failed to retrieve dashboard'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
     
+# ==================
+# Dish Images Endpoints
+# ==================
+
+@api_view(['GET'])
+@permission_classes([IsClient])
+def get_plat_images(request, plat_id):
+    """
+    Resized variants of a dish image (core.dish_images), signed-in clients only, like the catalog
+    Without params: {variant: {width, jpeg, webp}} with the URLs of the files.
+    With variant (thumb / medium / large) and optionally format (jpeg / webp, default from Accept):
+    redirect to that file, usable directly as an image URL
+    """
+    return client_views.plat_images_response(request, plat_id)
+
+@api_view(['GET'])
+@permission_classes([IsClient])
+def get_plat_image_file(request, plat_id, filename):
+    """One image variant; the name holds the content hash, so it is cached for good"""
+    return client_views.plat_image_file_response(request, plat_id, filename)
+
 @api_view(['GET'])
 @permission_classes([IsClient])
 def get_similar_dishes(request, plat_id):
     """Get similar dishes (same sous-category) for a specific plat"""
     try:
-        # Get the current dish details
-        plat = firebase_crud.get_doc('plats', plat_id)
+        # Get the current dish details from the catalog replica
+        snapshot = catalog.snapshot()
+        plat = snapshot.plats.get(plat_id)
         if not plat:
             return Response({'error': 'Dish not found'}, status=status.HTTP_404_NOT_FOUND)
         
@@ -1357,15 +1226,12 @@ def get_similar_dishes(request, plat_id):
         category_id = plat.get('idCat')
         
         # Get all dishes in the same category
-        similar_plats = firebase_crud.query_collection(
-            'plats',
-            'idCat',
-            '==',
-            category_id
-        )
+        similar_plats = snapshot.dishes_in('idCat', category_id)
         
-        # Remove the current dish from results and limit to 5
-        similar_plats = [p for p in similar_plats if p['id'] != plat_id]
+        # Remove the current dish and the ones unsafe for the client, limit to 5
+        client = firebase_crud.get_doc('clients', request.user.uid)
+        safe_ids = set(filter_safe_dishes([p['id'] for p in similar_plats], client))
+        similar_plats = [p for p in similar_plats if p['id'] != plat_id and p['id'] in safe_ids]
         similar_plats = similar_plats[:5]  # Limit to 5 dishes
         
         # Format the response
@@ -1387,3 +1253,12 @@ def get_similar_dishes(request, plat_id):
                        status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+@api_view(['GET'])
+@permission_classes([IsClient])
+def search_plats(request):
+    """
+    Full-text dish search (name, description, ingredients) served from memory
+    Query params: q (search text), limit (1 to 50, default 20)
+    """
+    return client_views.search_response(request)
+
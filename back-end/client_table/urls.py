@@ -1,5 +1,6 @@
 from django.urls import path
 from core.views import client_signup_step1, client_signup_step2, client_signup_step3, client_signup_step4, client_signup_step5, client_login, guest_login, logout
+from core import client_views
 from . import views
 
 
@@ -19,6 +20,7 @@ urlpatterns = [
     path('profile/', views.view_client_profile, name='view_client_profile'), #deja fait
     path('profile/update/', views.update_client_profile, name='update_client_profile'), #deja fait
     path('plats/nouveautes/', views.get_new_plats, name='get_new_plats'),
+    path('catalog/', views.get_catalog, name='get_catalog'), #tout le catalogue en une requete (?since=version pour les changements)
 
     
     # Orders endpoints
@@ -36,8 +38,12 @@ urlpatterns = [
     # Menu endpoints
 
  #specifie categorie et renvoie les sous categories
+    path('plats/search/', views.search_plats, name='search_plats'),
+    path('plats/trending/', client_views.get_trending_plats, name='get_trending_plats'),
     path('plats/<str:plat_id>/', views.get_plat_details, name='get_plat_details'), #renvoie des detils d'un plat
     path('plats/<str:plat_id>/similar/', views.get_similar_dishes, name='get_similar_dishes'), #marakch dayrha
+    path('plats/<str:plat_id>/images/', views.get_plat_images, name='get_plat_images'), #variantes redimensionnees (?variant=thumb&format=webp -> redirection)
+    path('plats/<str:plat_id>/images/<str:filename>', views.get_plat_image_file, name='get_plat_image_file'), #fichier d'une variante (cache immuable)
     path('orders/<str:order_id>/cancel/', views.cancel_order, name='cancel_order'), # Annuler une commande
     path('cancellation-requests/', views.get_cancellation_requests, name='get_cancellation_requests'), # Voir les demandes d'annulation
 
@@ -57,6 +63,9 @@ urlpatterns = [
     
     # Notifications endpoints
     path('notifications/', views.get_notifications, name='get_notifications'),
+    path('notifications/unread-count/', views.get_unread_notifications_count, name='get_unread_notifications_count'),
+    path('notifications/poll/', client_views.poll_notifications, name='poll_notifications'),
+    path('notifications/stream/', client_views.stream_notifications, name='stream_notifications'),
     path('notifications/<str:notification_id>/read/', views.mark_notification_as_read, name='mark_notification_as_read'),
     path('notifications/mark-all-read/', views.mark_all_notifications_as_read, name='mark_all_notifications_as_read'),
     path('notifications/<str:notification_id>/', views.delete_notification, name='delete_notification'),
@@ -5,9 +5,17 @@ from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from core.permissions import IsClient, IsGuest, IsTableClient
 from core.firebase_crud import firebase_crud
+from core.popularity import popularity_tracker
+from core.catalog import catalog
+from core.allergens import filter_safe_dishes, safe_recommendations
+from core import catalog_bundle, client_views, notification_dispatcher, notifications, preference_recommender, revenue_rollups, sales_counters
+from core.sales_analytics import sales_analytics
+from core.floor_plan import floor_plan
+from core.conditional import inbox_condition
 from firebase_admin import firestore
 from firebase_admin import firestore
 import logging
+from django.views.decorators.http import condition
 from django.utils import timezone
 from datetime import datetime
 from firebase_admin import auth  # Add this import at the top
@@ -461,6 +469,21 @@ def remove_favorite(request, plat_id):
 
 @api_view(['GET'])
 @permission_classes([AllowAny])
+@condition(etag_func=catalog_bundle.etag)
+def get_catalog(request):
+    """
+    Whole catalog (categories, sous-categories, dishes with ingredients, menus) in one response
+    Query params: since (version of the catalog the app already has) for only the changes
+    """
+    try:
+        return catalog_bundle.catalog_response(request)
+    except Exception as e:
+        logger.error(f"Error getting catalog: {str(e)}")
+        return Response({'error': 'Failed to retrieve catalog'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+@condition(etag_func=catalog.etag)
 def get_new_plats(request):
     print("=== get_new_plats function called ===")
     """
@@ -471,14 +494,8 @@ def get_new_plats(request):
     """
     
     try:
-        print("Querying firebase for new plats...")
-        # Query all plats where isNew = true
-        new_plats = firebase_crud.query_collection(
-            'plats',
-            'isNew',
-            '==',
-            True
-        )
+        # All plats where isNew = true, from the catalog replica
+        new_plats = catalog.snapshot().dishes_in('isNew', True)
         
         # Format the response with proper UTF-8 handling
         plats_list = []
@@ -508,14 +525,24 @@ def get_new_plats(request):
         error_response['Content-Type'] = 'application/json; charset=utf-8'
         return error_response
 
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def search_plats(request):
+    """
+    Full-text dish search (name, description, ingredients) served from memory
+    Query params: q (search text), limit (1 to 50, default 20)
+    """
+    return client_views.search_response(request)
+
 
     
 @api_view(['GET'])
 @permission_classes([AllowAny])
+@condition(etag_func=catalog.etag)
 def get_plat_details(request, plat_id):
-    """Get detailed information for a specific dish"""
+    """Get detailed information for a specific dish (catalog replica)"""
     try:
-        plat = firebase_crud.get_doc('plats', plat_id)
+        plat = catalog.snapshot().plats.get(plat_id)
         if not plat:
             return Response({'error': 'Dish not found'}, status=status.HTTP_404_NOT_FOUND)
         
@@ -541,7 +568,28 @@ def get_plat_details(request, plat_id):
         return Response({'error': 'Failed to retrieve dish details'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
-    
+
+# ==================
+# Dish Images Endpoints
+# ==================
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def get_plat_images(request, plat_id):
+    """
+    Resized variants of a dish image (core.dish_images), open to the table guests, like the catalog
+    Without params: {variant: {width, jpeg, webp}} with the URLs of the files.
+    With variant (thumb / medium / large) and optionally format (jpeg / webp, default from Accept):
+    redirect to that file, usable directly as an image URL
+    """
+    return client_views.plat_images_response(request, plat_id)
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def get_plat_image_file(request, plat_id, filename):
+    """One image variant; the name holds the content hash, so it is cached for good"""
+    return client_views.plat_image_file_response(request, plat_id, filename)
+
 # ==================
 # Preferences Endpoints
 # ==================
@@ -677,17 +725,21 @@ def get_recommendations(request):
         current_preferences = current_client.get('preferences', [])
         if not current_preferences:
             logger.info(f"Client {client_id} has no preferences set - using fallback")
-            return _get_fallback_recommendations('no_preferences')
+            return _get_fallback_recommendations('no_preferences', current_client)
         
         logger.info(f"Client {client_id} preferences: {current_preferences}")
         
         # Generate preference-based recommendations
         recommendations = _generate_preference_based_recommendations(current_preferences, client_id)
         
+        # Exclude dishes unsafe for the client's allergies and restrictions
+        popular_ids = [dish_id for dish_id, _ in popularity_tracker.top_k(30)]
+        dish_ids = safe_recommendations(recommendations['dish_ids'], current_client, padding=popular_ids)
+        
         return Response({
-            'dish_ids': recommendations['dish_ids'],
+            'dish_ids': dish_ids,
             'source': 'preference_based',
-            'count': len(recommendations['dish_ids']),
+            'count': len(dish_ids),
             'based_on_preferences': current_preferences,
             'subcategories_used': recommendations['subcategories_used']
         })
@@ -705,212 +757,38 @@ def _generate_preference_based_recommendations(preferences, client_id):
     """
     Generate recommendations based on user preferences mapped to subcategories
     Returns exactly 8 recommendations distributed based on number of preferences
+    (core.preference_recommender, dishes from the catalog replica)
     """
-    import random
-    from datetime import datetime
-    
-    # Preference to subcategory mapping (using actual idSousCat values)
-    PREFERENCE_MAPPING = {
-        'Soupes et Potages': ['scat_soupe'],
-        'Salades et Crudités': ['scat_salade'],
-        'Poissons et Fruits de mer': ['scat_poisson'],
-        'Cuisine traditionnelle': ['scat_couscous', 'scat_tagine'],
-        'Viandes': ['scat_viande'],
-        'Sandwichs et burgers': ['scat_feuillete'],
-        'Végétariens': ['scat_vegetarien'],
-        'Crémes et Mousses': ['scat_gateau'],
-        'Pâtisseries': ['scat_patisserie'],
-        'Fruits et Sorbets': ['scat_froid']
-    }
-    
-    # Determine distribution based on number of preferences
-    num_preferences = len(preferences)
-    if num_preferences == 1:
-        distribution = [8]
-    elif num_preferences == 2:
-        distribution = [4, 4]
-    else:  # 3 or more preferences
-        distribution = [3, 3, 2]
-        preferences = preferences[:3]  # Only use first 3 preferences
-    
-    recommended_dish_ids = []
-    subcategories_used = []
-    
-    # Use client_id and current time to create seed for randomization
-    # This ensures different results for same client on different calls
-    random_seed = hash(f"{client_id}_{datetime.now().strftime('%Y%m%d%H')}") % 10000
-    random.seed(random_seed)
-    
-    for i, preference in enumerate(preferences):
-        if i >= len(distribution):
-            break
-            
-        needed_count = distribution[i]
-        subcategories = PREFERENCE_MAPPING.get(preference, [])
-        
-        if not subcategories:
-            logger.warning(f"No subcategory mapping found for preference: {preference}")
-            continue
-        
-        # Handle special case for 'Cuisine traditionnelle' with multiple subcategories
-        if len(subcategories) > 1 and preference == 'Cuisine traditionnelle':
-            # Split between Couscous and Tagine (2 each for most cases)
-            couscous_count = needed_count // 2
-            tagine_count = needed_count - couscous_count
-            
-            # Get dishes from Couscous
-            couscous_dishes = _get_dishes_from_subcategory('scat_couscous', couscous_count)
-            recommended_dish_ids.extend(couscous_dishes)
-            if couscous_dishes:
-                subcategories_used.append('scat_couscous')
-            
-            # Get dishes from Tagine
-            tagine_dishes = _get_dishes_from_subcategory('scat_tagine', tagine_count)
-            recommended_dish_ids.extend(tagine_dishes)
-            if tagine_dishes:
-                subcategories_used.append('scat_tagine')
-        else:
-            # Single subcategory
-            subcat = subcategories[0]
-            dishes = _get_dishes_from_subcategory(subcat, needed_count)
-            recommended_dish_ids.extend(dishes)
-            if dishes:
-                subcategories_used.append(subcat)
-    
-    # Remove duplicates while preserving order
-    seen = set()
-    unique_dish_ids = []
-    for dish_id in recommended_dish_ids:
-        if dish_id not in seen:
-            seen.add(dish_id)
-            unique_dish_ids.append(dish_id)
-    
-    # If we don't have enough recommendations (less than 8), pad with random dishes
-    if len(unique_dish_ids) < 8:
-        logger.info(f"Only found {len(unique_dish_ids)} recommendations, padding with random dishes")
-        remaining_needed = 8 - len(unique_dish_ids)
-        additional_dishes = _get_random_dishes(remaining_needed, exclude_ids=set(unique_dish_ids))
-        unique_dish_ids.extend(additional_dishes)
-    
-    # Ensure we have exactly 8 recommendations
-    unique_dish_ids = unique_dish_ids[:8]
-    
-    logger.info(f"Generated {len(unique_dish_ids)} preference-based recommendations")
-    
-    return {
-        'dish_ids': unique_dish_ids,
-        'subcategories_used': subcategories_used
-    }
+    recommendations = preference_recommender.recommend(
+        preferences,
+        catalog.derived('subcategory_dishes', preference_recommender.subcategory_dishes),
+        catalog.snapshot().plats.keys(),
+        preference_recommender.client_rng(client_id)
+    )
+    logger.info(f"Generated {len(recommendations['dish_ids'])} preference-based recommendations")
+    return recommendations
 
 
-def _get_dishes_from_subcategory(subcategory, count):
-    """
-    Get random dishes from a specific subcategory
-    """
-    import random
-    
-    try:
-        logger.info(f"Fetching {count} dishes from subcategory: {subcategory}")
-        
-        # Query dishes from 'plats' collection by 'idSousCat'
-        dishes = firebase_crud.query_collection(
-            'plats',
-            'idSousCat',
-            '==',
-            subcategory
-        )
-        
-        if not dishes:
-            logger.warning(f"No dishes found for subcategory: {subcategory}")
-            return []
-        
-        # Extract dish IDs
-        dish_ids = []
-        for dish in dishes:
-            dish_id = dish.get('id')
-            if dish_id:
-                dish_ids.append(str(dish_id))
-        
-        if not dish_ids:
-            logger.warning(f"No valid dish IDs found for subcategory: {subcategory}")
-            return []
-        
-        # Randomly select the requested number of dishes
-        selected_count = min(count, len(dish_ids))
-        selected_dishes = random.sample(dish_ids, selected_count)
-        
-        logger.info(f"Selected {len(selected_dishes)} dishes from {len(dish_ids)} available in {subcategory}")
-        return selected_dishes
-        
-    except Exception as e:
-        logger.error(f"Error fetching dishes from subcategory {subcategory}: {str(e)}")
-        return []
-
-
-def _get_random_dishes(count, exclude_ids=None):
-    """
-    Get random dishes from any category to pad recommendations
-    """
-    import random
-    
-    if exclude_ids is None:
-        exclude_ids = set()
-    
-    try:
-        logger.info(f"Fetching {count} random dishes for padding")
-        
-        # Get all dishes
-        all_dishes = firebase_crud.get_all_docs('plats')
-        
-        if not all_dishes:
-            return []
-        
-        # Extract dish IDs, excluding already selected ones
-        available_dish_ids = []
-        for dish in all_dishes:
-            dish_id = dish.get('id')
-            if dish_id and str(dish_id) not in exclude_ids:
-                available_dish_ids.append(str(dish_id))
-        
-        if not available_dish_ids:
-            return []
-        
-        # Randomly select dishes
-        selected_count = min(count, len(available_dish_ids))
-        selected_dishes = random.sample(available_dish_ids, selected_count)
-        
-        logger.info(f"Selected {len(selected_dishes)} random padding dishes")
-        return selected_dishes
-        
-    except Exception as e:
-        logger.error(f"Error fetching random dishes: {str(e)}")
-        return []
-
-
-def _get_fallback_recommendations(reason):
+def _get_fallback_recommendations(reason, client=None):
     """
     Provide fallback recommendations when no preferences are available
+    Dishes unsafe for the client's allergies and restrictions are left out
     """
     try:
         logger.info(f"Using fallback recommendations due to: {reason}")
         
-        # Get 8 random dishes from popular categories
-        fallback_subcategories = ['scat_viande', 'scat_salade', 'scat_poisson', 'scat_couscous']
-        fallback_dishes = []
-        
-        for subcat in fallback_subcategories:
-            dishes = _get_dishes_from_subcategory(subcat, 2)
-            fallback_dishes.extend(dishes)
-        
-        # Remove duplicates and ensure we have 8
-        fallback_dishes = list(set(fallback_dishes))[:8]
+        # Get the 8 most popular dishes (time-decayed order counts, read from memory)
+        popular_ids = [dish_id for dish_id, _ in popularity_tracker.top_k(30)]
+        fallback_dishes = filter_safe_dishes(popular_ids, client)[:8]
         
         # If still not enough, pad with random dishes
         if len(fallback_dishes) < 8:
-            additional_dishes = _get_random_dishes(8 - len(fallback_dishes), exclude_ids=set(fallback_dishes))
+            additional_dishes = preference_recommender.random_dishes(
+                catalog.snapshot().plats.keys(), 8 - len(fallback_dishes), exclude_ids=fallback_dishes
+            )
             fallback_dishes.extend(additional_dishes)
         
-        fallback_dishes = fallback_dishes[:8]
+        fallback_dishes = safe_recommendations(fallback_dishes, client)
         
         return Response({
             'dish_ids': fallback_dishes,
@@ -988,26 +866,32 @@ def get_recommendation_details(request, recommendation_id):
 
 @api_view(['GET'])
 @permission_classes([IsClient])
+@inbox_condition(lambda request: [notifications.inbox_id('client', request.user.uid)])
 def get_notifications(request):
-    """Get client's notifications"""
+    """
+    Get client's notifications, most recent first, one page at a time
+    Query params: page_size (default 50), cursor (X-Next-Cursor of the previous page), unread=true
+    """
     try:
         client_id = request.user.uid
-
-        # Update this query to match your database structure
-        notifications = firebase_crud.query_collection(
-            'notifications',
-            'recipient_id',  # Change from 'client_id' to match setup_firebase_db.py
-            '==',
-            client_id,
-            order_by='created_at',
-            desc=True
+        try:
+            page_size, cursor, unread_only = notifications.page_params(request.query_params)
+        except ValueError:
+            return Response({'error': 'page_size must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+
+        items, next_cursor = notifications.list_notifications(
+            firebase_crud.db,
+            notifications.inbox_id('client', client_id),
+            page_size=page_size,
+            cursor=cursor,
+            unread_only=unread_only
         )
 
         # Format the response
         notifications_list = []
-        for notification in notifications:
+        for notification in items:
             notifications_list.append({
-                'id': notification['id'],  # Changé de .id à ['id']
+                'id': notification['id'],
                 'title': notification.get('title', ''),
                 'message': notification.get('message', ''),
                 'created_at': notification.get('created_at', ''),
@@ -1015,10 +899,25 @@ def get_notifications(request):
                 'type': notification.get('type', 'general')
             })
 
-        return Response(notifications_list)
+        response = Response(notifications_list)
+        if next_cursor:
+            response['X-Next-Cursor'] = next_cursor
+        return response
     except Exception as e:
         logger.error(f"Error getting notifications: {str(e)}")  # This will show the actual error
         return Response({'error': f'Failed to retrieve notifications: {str(e)}'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@api_view(['GET'])
+@permission_classes([IsClient])
+def get_unread_notifications_count(request):
+    """Unread badge of the client's inbox"""
+    try:
+        inbox = notifications.inbox_id('client', request.user.uid)
+        return Response({'unread_count': notifications.unread_count(firebase_crud.db, inbox)})
+    except Exception as e:
+        logger.error(f"Error getting unread notifications count: {str(e)}")
+        return Response({'error': 'Failed to retrieve unread notifications count'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
     
 
 @api_view(['PATCH'])
@@ -1026,30 +925,14 @@ def get_notifications(request):
 def mark_notification_as_read(request, notification_id):
     """Mark a specific notification as read"""
     try:
-        client_id = request.user.uid
-        
-        # First, check if the notification exists and belongs to the client
-        notification = firebase_crud.get_document('notifications', notification_id)
+        # Only the client's own inbox is looked up
+        inbox = notifications.inbox_id('client', request.user.uid)
+        notification = notifications.mark_read(firebase_crud.db, inbox, notification_id)
         
-        if not notification:
+        if notification is None:
             return Response({'error': 'Notification not found'}, status=status.HTTP_404_NOT_FOUND)
         
-        # Check if the notification belongs to the current user
-        if notification.get('recipient_id') != client_id:
-            return Response({'error': 'Unauthorized access to notification'}, status=status.HTTP_403_FORBIDDEN)
-        
-        # Update the notification to mark as read
-        update_data = {
-            'read': True,
-            'read_at': datetime.now().isoformat()
-        }
-        
-        success = firebase_crud.update_document('notifications', notification_id, update_data)
-        
-        if success:
-            return Response({'message': 'Notification marked as read successfully'})
-        else:
-            return Response({'error': 'Failed to update notification'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        return Response({'message': 'Notification marked as read successfully'})
             
     except Exception as e:
         logger.error(f"Error marking notification as read: {str(e)}")
@@ -1061,28 +944,8 @@ def mark_notification_as_read(request, notification_id):
 def mark_all_notifications_as_read(request):
     """Mark all notifications as read for the current client"""
     try:
-        client_id = request.user.uid
-        
-        # Get all unread notifications for the client
-        unread_notifications = firebase_crud.query_collection(
-            'notifications',
-            'recipient_id',
-            '==',
-            client_id,
-            additional_filters=[('read', '==', False)]
-        )
-        
-        # Update each unread notification
-        updated_count = 0
-        for notification in unread_notifications:
-            update_data = {
-                'read': True,
-                'read_at': datetime.now().isoformat()
-            }
-            
-            success = firebase_crud.update_document('notifications', notification['id'], update_data)
-            if success:
-                updated_count += 1
+        inbox = notifications.inbox_id('client', request.user.uid)
+        updated_count = notifications.mark_all_read(firebase_crud.db, inbox)
         
         return Response({
             'message': f'Successfully marked {updated_count} notifications as read',
@@ -1099,25 +962,12 @@ def mark_all_notifications_as_read(request):
 def delete_notification(request, notification_id):
     """Delete a specific notification"""
     try:
-        client_id = request.user.uid
-        
-        # First, check if the notification exists and belongs to the client
-        notification = firebase_crud.get_document('notifications', notification_id)
+        inbox = notifications.inbox_id('client', request.user.uid)
         
-        if not notification:
+        if not notifications.delete_notification(firebase_crud.db, inbox, notification_id):
             return Response({'error': 'Notification not found'}, status=status.HTTP_404_NOT_FOUND)
         
-        # Check if the notification belongs to the current user
-        if notification.get('recipient_id') != client_id:
-            return Response({'error': 'Unauthorized access to notification'}, status=status.HTTP_403_FORBIDDEN)
-        
-        # Delete the notification
-        success = firebase_crud.delete_document('notifications', notification_id)
-        
-        if success:
-            return Response({'message': 'Notification deleted successfully'}, status=status.HTTP_200_OK)
-        else:
-            return Response({'error': 'Failed to delete notification'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        return Response({'message': 'Notification deleted successfully'}, status=status.HTTP_200_OK)
             
     except Exception as e:
         logger.error(f"Error deleting notification: {str(e)}")
@@ -1128,23 +978,14 @@ def delete_notification(request, notification_id):
 @api_view(['GET'])
 @permission_classes([IsClient])
 def get_notification_details(request, notification_id):
-    """Get detailed information for a specific notification"""
+    """Get detailed information for a specific notification (marks it as read)"""
     try:
-        client_id = request.user.uid
-        
-        # Get notification document
-        notification = firebase_crud.get_doc('notifications', notification_id)
-        if not notification or notification.get('recipient_id') != client_id:  # Changed to recipient_id
+        inbox = notifications.inbox_id('client', request.user.uid)
+        notification = notifications.mark_read(firebase_crud.db, inbox, notification_id)
+        if notification is None:
             return Response({'error': 'Notification not found'}, status=status.HTTP_404_NOT_FOUND)
         
-        # Mark as read
-        if not notification.get('read', False):
-            firebase_crud.update_doc('notifications', notification_id, {'read': True})
-        
-        # Return notification details (this was missing)
-        notification['id'] = notification_id  # Add the ID to the response
-        
-        return Response(notification)  # Return the notification object
+        return Response(notification)
     except Exception as e:
         logger.error(f"Error getting notification details: {str(e)}")
         return Response({'error': 'Failed to retrieve notification details'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
@@ -1156,8 +997,9 @@ def get_notification_details(request, notification_id):
 def get_similar_dishes(request, plat_id):
     """Get similar dishes (same sous-category) for a specific plat"""
     try:
-        # Get the current dish details
-        plat = firebase_crud.get_doc('plats', plat_id)
+        # Get the current dish details from the catalog replica
+        snapshot = catalog.snapshot()
+        plat = snapshot.plats.get(plat_id)
         if not plat:
             return Response({'error': 'Dish not found'}, status=status.HTTP_404_NOT_FOUND)
         
@@ -1165,15 +1007,12 @@ def get_similar_dishes(request, plat_id):
         category_id = plat.get('idCat')
         
         # Get all dishes in the same category
-        similar_plats = firebase_crud.query_collection(
-            'plats',
-            'idCat',
-            '==',
-            category_id
-        )
+        similar_plats = snapshot.dishes_in('idCat', category_id)
         
-        # Remove the current dish from results and limit to 5
-        similar_plats = [p for p in similar_plats if p['id'] != plat_id]
+        # Remove the current dish and the ones unsafe for the client, limit to 5
+        client = firebase_crud.get_doc('clients', request.user.uid)
+        safe_ids = set(filter_safe_dishes([p['id'] for p in similar_plats], client))
+        similar_plats = [p for p in similar_plats if p['id'] != plat_id and p['id'] in safe_ids]
         similar_plats = similar_plats[:5]  # Limit to 5 dishes
         
         # Format the response
@@ -1261,6 +1100,17 @@ def create_order(request):
         if not items:
             return Response({'error': 'Order must contain at least one item'}, status=status.HTTP_400_BAD_REQUEST)
         
+        if len(items) > 400:
+            return Response({'error': 'Order cannot contain more than 400 items'}, status=status.HTTP_400_BAD_REQUEST)
+        # The order, its items, the rollups and 3 sales counters per different dish are written in one batch
+        distinct_dishes = len({str(item.get('plat_id')) for item in items if isinstance(item, dict)})
+        if sales_counters.order_batch_writes(len(items), distinct_dishes) > sales_counters.MAX_BATCH_WRITES:
+            return Response({
+                'error': f'Order is too large: {len(items)} items of {distinct_dishes} different dishes '
+                         f'exceed the {sales_counters.MAX_BATCH_WRITES} writes of one order batch '
+                         f'(each item takes 1 write, each different dish 3 more)'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
         # STEP 3: Validate table exists
         table = firebase_crud.get_doc('tables', table_id)
         if not table:
@@ -1289,7 +1139,8 @@ def create_order(request):
             
             valid_items.append({
                 'plat_id': plat_id,
-                'quantity': quantity
+                'quantity': quantity,
+                'prix': price
             })
         
         print(f"Calculated total: {total}")
@@ -1328,9 +1179,11 @@ def create_order(request):
             print("⚠ No client_id or guest user - skipping loyalty points")
         
         # STEP 6: Create order document
+        # Explicit creation time: it also picks the revenue buckets, which a cancellation must find again
+        created_at = timezone.now()
         order_data = {
             'montant': total,
-            'dateCreation': firestore.SERVER_TIMESTAMP,
+            'dateCreation': created_at,
             'etat': 'en_attente',
             'confirmation': False,
             'idC': client_id,  # This is the key field that was null before
@@ -1350,18 +1203,32 @@ def create_order(request):
         
         print(f"Creating order with data: {order_data}")
         
-        order_id = firebase_crud.create_doc('commandes', order_data)
-        print(f"✓ Order created with ID: {order_id}")
+        # STEP 7: Write the order, its items and the revenue rollups in one batch
+        db = firebase_crud.db
+        order_ref = db.collection('commandes').document()
+        order_id = order_ref.id
+        order_data['revenue_counted'] = True
+        order_data['sales_counted'] = True
         
-        # STEP 7: Create order items
+        batch = db.batch()
+        batch.set(order_ref, order_data)
         for item in valid_items:
             order_item_data = {
                 'idCmd': order_id,
                 'idP': item['plat_id'],
-                'quantité': item['quantity']
+                'quantité': item['quantity'],
+                'prix_unitaire': item['prix']
             }
-            firebase_crud.create_doc('commandes_plat', order_item_data)  # Note the correct spelling
+            batch.set(db.collection('commandes_plat').document(), order_item_data)  # Note the correct spelling
+        revenue_rollups.record_order(batch, db, total, created_at)
+        sales_counters.record_order(batch, db, valid_items, created_at)
+        batch.commit()
+        floor_plan.invalidate()
+        print(f"✓ Order created with ID: {order_id}")
         
+        for item in valid_items:
+            popularity_tracker.record(item['plat_id'], item['quantity'])
+
         print(f"✓ Created {len(valid_items)} order items")
         
         # STEP 8: Prepare response
@@ -1473,28 +1340,28 @@ def cancel_order(request, order_id):
         if current_status == 'en_attente':
             logger.info(f"Order {order_id} is 'en_attente' - proceeding with automatic cancellation")
             
-            # Update order status to 'annulee'
-            firebase_crud.update_doc('commandes', order_id, {
+            # Update order status to 'annulee' and take it out of the revenue rollups
+            db = firebase_crud.db
+            order_ref = db.collection('commandes').document(order_id)
+            batch = db.batch()
+            batch.update(order_ref, {
                 'etat': 'annulee',
                 'cancelled_at': firestore.SERVER_TIMESTAMP,
                 'cancelled_by': client_id,
                 'cancellation_type': 'automatic'
             })
             
-            # Send notification to kitchen (chef)
-            kitchen_notification = {
-                'recipient_id': 'kitchen',
-                'recipient_type': 'chef',
-                'title': 'Commande annulée',
-                'message': f'La commande #{order_id} a été annulée par le client',
-                'type': 'order_cancellation',
-                'created_at': firestore.SERVER_TIMESTAMP,
-                'read': False,
-                'priority': 'normal',
-                'order_id': order_id,
-                'client_id': client_id
-            }
-            firebase_crud.create_doc('notifications', kitchen_notification)
+            # Notify the kitchen in the same batch
+            dispatch = notification_dispatcher.begin(db, batch)
+            dispatch.notify(
+                notification_dispatcher.role('chef'), 'order_cancelled_by_client',
+                order_id=order_id, client_id=client_id
+            )
+            dispatch.commit()
+            revenue_rollups.reverse_order(db, order_ref)
+            sales_counters.reverse_order(db, order_ref)
+            sales_analytics.mark_cancelled(order_id)
+            floor_plan.invalidate()
             
             logger.info(f"Order {order_id} cancelled automatically and kitchen notified")
             
@@ -1523,38 +1390,25 @@ def cancel_order(request, order_id):
                 'createdAt': firestore.SERVER_TIMESTAMP
             }
             
-            cancellation_id = firebase_crud.create_doc('DemandeAnnulation', cancellation_request)
-            
-            # Send notification to kitchen (chef)
-            kitchen_notification = {
-                'recipient_id': 'kitchen',
-                'recipient_type': 'chef',
-                'title': 'Demande d\'annulation',
-                'message': f'Demande d\'annulation pour la commande #{order_id} (statut: {current_status})',
-                'type': 'cancellation_request',
-                'created_at': firestore.SERVER_TIMESTAMP,
-                'read': False,
-                'priority': 'normal',
-                'order_id': order_id,
-                'client_id': client_id,
-                'cancellation_request_id': cancellation_id
-            }
-            firebase_crud.create_doc('notifications', kitchen_notification)
+            # Write the request and notify the kitchen and the managers in one batch
+            db = firebase_crud.db
+            batch = db.batch()
+            cancellation_ref = db.collection('DemandeAnnulation').document()
+            cancellation_id = cancellation_ref.id
+            batch.set(cancellation_ref, cancellation_request)
             
-            # Send notification to manager (only with recipient_type)
-            manager_notification = {
-                'recipient_type': 'manager',
-                'title': 'Demande d\'annulation en attente',
-                'message': f'Le client {client_name} demande l\'annulation de la commande #{order_id}',
-                'type': 'cancellation_request',
-                'created_at': firestore.SERVER_TIMESTAMP,
-                'read': False,
-                'priority': 'high',
-                'order_id': order_id,
-                'client_id': client_id,
-                'cancellation_request_id': cancellation_id
-            }
-            firebase_crud.create_doc('notifications', manager_notification)
+            dispatch = notification_dispatcher.begin(db, batch)
+            dispatch.notify(
+                notification_dispatcher.role('chef'), 'cancellation_requested_kitchen',
+                order_id=order_id, order_status=current_status, client_id=client_id,
+                cancellation_request_id=cancellation_id
+            )
+            dispatch.notify(
+                notification_dispatcher.role('manager'), 'cancellation_requested_by_client',
+                order_id=order_id, client_name=client_name, client_id=client_id,
+                cancellation_request_id=cancellation_id
+            )
+            dispatch.commit()
             
             logger.info(f"Cancellation request created for order {order_id}, manager and kitchen notified")
             
@@ -0,0 +1,195 @@
+"""
+Allergen / dietary restriction index over the dish catalog.
+
+Each dish gets a bitset over ALLERGEN_TAGS, derived from its ingredient names
+(plat_ingredients) and its name through a keyword mapping. A client's allergies
+and restrictions become a bitmask, so excluding unsafe dishes is a single
+vectorised AND over the numpy array of dish bitsets.
+"""
+from typing import Dict, Iterable, List, Optional, Tuple
+from core.catalog import catalog, CatalogSnapshot
+from core.text_utils import fold_text
+from core.views import ALLOWED_ALLERGIES, ALLOWED_RESTRICTIONS
+import logging
+import numpy as np
+import re
+
+logger = logging.getLogger(__name__)
+
+# Allergies the client can pick, plus the tags needed to express restrictions
+ALLERGEN_TAGS = ALLOWED_ALLERGIES + ['Viande', 'Miel', 'Glucides']
+TAG_BITS = {tag: 1 << i for i, tag in enumerate(ALLERGEN_TAGS)}
+
+# Folded ingredient keywords (singular, plurals in -s/-x also match) for each tag
+ALLERGEN_KEYWORDS = {
+    'Fraise': ['fraise'],
+    'Fruit exotique': ['mangue', 'ananas', 'kiwi', 'papaye', 'fruit de la passion', 'litchi', 'goyave',
+                       'coco', 'fruit exotique', 'avocat', 'banane'],
+    'Gluten': ['gluten', 'ble', 'frik', 'farine', 'pain', 'pain de mie', 'baguette', 'brioche', 'semoule',
+               'boulgour', 'couscous', 'vermicelle', 'pate', 'pates', 'pate brisee', 'pate feuilletee',
+               'feuille de brick', 'brick', 'filo', 'chapelure', 'crouton', 'tortilla', 'toast', 'biscuit',
+               'bechamel', 'orge', 'seigle', 'epeautre', 'panini', 'feuillete', 'tarte', 'quiche', 'gateau'],
+    'Arachides': ['arachide', 'cacahuete', 'beurre de cacahuete'],
+    'Noix': ['noix', 'amande', 'noisette', 'pistache', 'cajou', 'pecan', 'macadamia', 'praline'],
+    'Lupin': ['lupin'],
+    'Champignons': ['champignon', 'cepe', 'girolle', 'morille', 'truffe'],
+    'Moutarde': ['moutarde', 'vinaigrette', 'sauce cesar'],
+    'Soja': ['soja', 'tofu', 'edamame', 'miso'],
+    'Crustacés': ['crevette', 'crabe', 'homard', 'langouste', 'langoustine', 'ecrevisse', 'gambas',
+                  'fruits de mer', 'fruit de mer'],
+    'Poissons': ['poisson', 'dorade', 'daurade', 'saumon', 'thon', 'tilapia', 'sardine', 'cabillaud', 'merlu',
+                 'anchois', 'bar', 'sole', 'truite', 'rouille', 'calamar'],
+    'Lactose': ['lait', 'creme', 'creme fraiche', 'beurre', 'fromage', 'yaourt', 'comte', 'parmesan',
+                'mozzarella', 'emmental', 'chevre', 'roquefort', 'cheddar', 'gruyere', 'ricotta', 'mascarpone',
+                'bechamel', 'chantilly', 'raclette', 'feta', 'lben', 'raib'],
+    'Oeuf': ['oeuf', 'mayonnaise', 'meringue', 'omelette'],
+    'Viande': ['viande', 'boeuf', 'veau', 'agneau', 'mouton', 'poulet', 'dinde', 'canard', 'volaille', 'porc',
+               'jambon', 'lardon', 'bacon', 'merguez', 'saucisse', 'steak', 'foie', 'kefta', 'cotelette',
+               'bouillon de boeuf', 'chorba'],
+    'Miel': ['miel'],
+    'Glucides': ['sucre', 'miel', 'riz', 'pomme de terre', 'frites', 'datte', 'confiture', 'chocolat',
+                 'caramel', 'sirop', 'ble', 'farine', 'pain', 'semoule', 'couscous', 'pate', 'pates',
+                 'vermicelle', 'boulgour', 'lentille', 'pois chiche', 'haricot blanc', 'gateau', 'soda', 'jus'],
+}
+
+# Tags a dietary restriction excludes
+RESTRICTION_TAGS = {
+    'Végétarien': ['Viande', 'Poissons', 'Crustacés'],
+    'Végétalien': ['Viande', 'Poissons', 'Crustacés', 'Lactose', 'Oeuf', 'Miel'],
+    'Keto': ['Glucides'],
+    'Sans lactose': ['Lactose'],
+    'Sans gluten': ['Gluten'],
+}
+
+
+def _compile_patterns():
+    patterns = []
+    for tag, keywords in ALLERGEN_KEYWORDS.items():
+        alternatives = '|'.join(re.escape(k) for k in sorted(keywords, key=len, reverse=True))
+        patterns.append((TAG_BITS[tag], re.compile(rf"\b(?:{alternatives})[sx]?\b")))
+    return patterns
+
+
+_TAG_PATTERNS = _compile_patterns()
+
+
+def tag_bits_for_text(text: str) -> int:
+    """Bitset of the tags whose keywords appear in the (folded) text"""
+    folded = fold_text(text)
+    bits = 0
+    for bit, pattern in _TAG_PATTERNS:
+        if pattern.search(folded):
+            bits |= bit
+    return bits
+
+
+def _canonical(value: str, allowed: List[str]) -> Optional[str]:
+    folded = fold_text(value).strip()
+    for candidate in allowed:
+        if fold_text(candidate) == folded:
+            return candidate
+    return None
+
+
+def client_mask(allergies: Iterable[str] = (), restrictions: Iterable[str] = ()) -> Tuple[int, List[str]]:
+    """
+    Bitmask of tags the client must avoid, plus the custom (free-text) allergies
+    that have no tag and are matched against ingredient names instead.
+    """
+    mask = 0
+    custom = []
+    for allergy in allergies or []:
+        tag = _canonical(allergy, ALLOWED_ALLERGIES)
+        if tag:
+            mask |= TAG_BITS[tag]
+        elif fold_text(allergy).strip():
+            custom.append(fold_text(allergy).strip())
+    for restriction in restrictions or []:
+        name = _canonical(restriction, ALLOWED_RESTRICTIONS)
+        for tag in RESTRICTION_TAGS.get(name, []):
+            mask |= TAG_BITS[tag]
+    return mask, custom
+
+
+class AllergenIndex:
+    """Dish bitsets for one catalog version"""
+
+    def __init__(self, snapshot: CatalogSnapshot):
+        self.dish_ids = np.array(sorted(snapshot.plats.keys()), dtype=object)
+        self.position: Dict[str, int] = {dish_id: i for i, dish_id in enumerate(self.dish_ids)}
+        self.texts: List[str] = []
+        bits = np.zeros(len(self.dish_ids), dtype=np.uint64)
+
+        for i, dish_id in enumerate(self.dish_ids):
+            names = [line['nom'] for line in snapshot.dish_ingredients(dish_id)]
+            text = ' , '.join([snapshot.plats[dish_id].get('nom', '')] + names)
+            self.texts.append(fold_text(text))
+            bits[i] = tag_bits_for_text(text)
+        self.bits = bits
+
+    def safe_flags(self, mask: int, custom: List[str] = ()) -> np.ndarray:
+        """Boolean array aligned with dish_ids, True when the dish is safe"""
+        safe = (self.bits & np.uint64(mask)) == 0
+        for term in custom:
+            safe &= np.array([term not in text for text in self.texts], dtype=bool)
+        return safe
+
+    def safe_ids(self, allergies=(), restrictions=()) -> set:
+        mask, custom = client_mask(allergies, restrictions)
+        if not mask and not custom:
+            return set(self.dish_ids.tolist())
+        return set(self.dish_ids[self.safe_flags(mask, custom)].tolist())
+
+    def filter_ids(self, dish_ids: Iterable[str], allergies=(), restrictions=()) -> List[str]:
+        """
+        Keep the safe dishes of dish_ids, preserving order. Ids not in the index
+        (e.g. a dish created since the replica was loaded) are dropped: their
+        ingredients are not known yet.
+        """
+        dish_ids = list(dish_ids)
+        mask, custom = client_mask(allergies, restrictions)
+        if not mask and not custom:
+            return dish_ids
+        flags = self.safe_flags(mask, custom)
+        return [d for d in dish_ids if d in self.position and flags[self.position[d]]]
+
+    def dish_tags(self, dish_id: str) -> List[str]:
+        index = self.position.get(dish_id)
+        if index is None:
+            return []
+        value = int(self.bits[index])
+        return [tag for tag in ALLERGEN_TAGS if value & TAG_BITS[tag]]
+
+
+def get_allergen_index() -> AllergenIndex:
+    """Allergen index for the current catalog version"""
+    return catalog.derived('allergens', AllergenIndex)
+
+
+def filter_safe_dishes(dish_ids: Iterable[str], client: Optional[Dict]) -> List[str]:
+    """Drop dishes unsafe for the client's allergies and restrictions"""
+    dish_ids = list(dish_ids)
+    if not client or not (client.get('allergies') or client.get('restrictions')):
+        return dish_ids
+    return get_allergen_index().filter_ids(dish_ids, client.get('allergies', []), client.get('restrictions', []))
+
+
+def safe_recommendations(dish_ids: Iterable[str], client: Optional[Dict], count: int = 8, padding=()) -> List[str]:
+    """
+    Filter recommended dishes for the client, then top up to count with safe
+    dishes from padding (e.g. the most popular ones) and the rest of the catalog.
+    """
+    selected = filter_safe_dishes(dish_ids, client)
+    if len(selected) >= count or not client:
+        return selected[:count]
+
+    index = get_allergen_index()
+    safe = index.safe_ids(client.get('allergies', []), client.get('restrictions', []))
+    chosen = set(selected)
+    for dish_id in list(padding) + sorted(safe):
+        if len(selected) >= count:
+            break
+        if dish_id in safe and dish_id not in chosen:
+            selected.append(dish_id)
+            chosen.add(dish_id)
+    return selected
@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class CoreConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'core'
+
+    def ready(self):
+        # Every registered query shape must have its index in firestore.indexes.json
+        from core.query_specs import check_indexes
+        check_indexes()
@@ -0,0 +1,172 @@
+"""
+In-memory replica of the menu catalog (plats, categories, sous_categories,
+plat_ingredients, ingredients, menus, menu_plat).
+
+The catalog changes rarely compared to how often it is read, so the whole of it
+is loaded in one pass and served from memory. Write endpoints call
+catalog.invalidate(); a TTL bounds staleness for writes made by other processes.
+Indexes derived from the catalog (allergens, search...) are registered with
+catalog.derived() and rebuilt only when the catalog version changes.
+The version counts the content changes seen by this process (a reload that
+finds the same fingerprint keeps the current snapshot and its derived
+indexes); the fingerprint hashes the content and is the same in every
+process, it is the ETag of the catalog endpoints (core.conditional).
+"""
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List
+from core.firebase_utils import firebase_config
+from core.conditional import fingerprint
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class CatalogSnapshot:
+    version: int
+    loaded_at: float
+    plats: Dict[str, Dict] = field(default_factory=dict)
+    categories: Dict[str, Dict] = field(default_factory=dict)
+    sous_categories: Dict[str, Dict] = field(default_factory=dict)
+    ingredients: Dict[str, Dict] = field(default_factory=dict)
+    plat_ingredients: Dict[str, List[Dict]] = field(default_factory=dict)
+    menus: Dict[str, Dict] = field(default_factory=dict)
+    menu_plats: Dict[str, List[str]] = field(default_factory=dict)
+    fingerprint: str = ''
+
+    def dish_ingredients(self, plat_id: str) -> List[Dict]:
+        """Ingredient lines of a dish: [{nom, quantite_g, unite}]"""
+        return self.plat_ingredients.get(plat_id, [])
+
+    def dishes_in(self, field_name: str, value: str) -> List[Dict]:
+        """Dishes whose field equals value (e.g. 'idCat', 'idSousCat'), with their id"""
+        return [{'id': plat_id, **plat} for plat_id, plat in self.plats.items() if plat.get(field_name) == value]
+
+
+def _normalise_ingredient_lines(raw) -> List[Dict]:
+    """
+    plat_ingredients stores [{nom, quantite_g, unite}], older dishes created by the
+    manager app keep a plain 'ingrédients' list (strings or dicts) on the plat itself.
+    """
+    lines = []
+    for item in raw or []:
+        if isinstance(item, dict):
+            if item.get('nom'):
+                lines.append({
+                    'nom': item['nom'],
+                    'quantite_g': item.get('quantite_g', item.get('quantite', 0)),
+                    'unite': item.get('unite', 'g')
+                })
+        elif isinstance(item, str) and item.strip():
+            lines.append({'nom': item.strip(), 'quantite_g': 0, 'unite': ''})
+    return lines
+
+
+class CatalogReplica:
+    """Lazily loaded, versioned snapshot of the catalog collections"""
+
+    TTL_SECONDS = 300
+    # After a failed reload the previous snapshot is served, and the reload retried after RETRY_SECONDS
+    RETRY_SECONDS = 30
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._snapshot = None
+        self._version = 0
+        self._stale = True
+        self._derived: Dict[str, tuple] = {}
+
+    def invalidate(self) -> None:
+        """Mark the replica stale, the next read reloads it"""
+        self._stale = True
+
+    @property
+    def version(self) -> int:
+        return self.snapshot().version
+
+    def etag(self, request, *args, **kwargs) -> str:
+        """etag_func for condition() on endpoints served from the catalog"""
+        return self.snapshot().fingerprint
+
+    def snapshot(self) -> CatalogSnapshot:
+        snapshot = self._snapshot
+        if snapshot is None or self._stale or time.time() - snapshot.loaded_at > self.TTL_SECONDS:
+            with self._lock:
+                snapshot = self._snapshot
+                if snapshot is None or self._stale or time.time() - snapshot.loaded_at > self.TTL_SECONDS:
+                    self._stale = False
+                    try:
+                        snapshot = self._load()
+                    except Exception as e:
+                        logger.error(f"Catalog reload failed: {str(e)}", exc_info=True)
+                        if self._snapshot is None:
+                            raise
+                        # Keep serving the previous snapshot, without retrying on every request
+                        snapshot = self._snapshot
+                        snapshot.loaded_at = time.time() - self.TTL_SECONDS + self.RETRY_SECONDS
+                    self._snapshot = snapshot
+        return snapshot
+
+    def derived(self, name: str, builder: Callable[[CatalogSnapshot], object]):
+        """Return builder(snapshot), cached until the catalog version changes"""
+        snapshot = self.snapshot()
+        cached = self._derived.get(name)
+        if cached and cached[0] == snapshot.version:
+            return cached[1]
+        value = builder(snapshot)
+        self._derived[name] = (snapshot.version, value)
+        return value
+
+    def _load(self) -> CatalogSnapshot:
+        db = firebase_config.get_db()
+        started = time.perf_counter()
+
+        def load(collection):
+            return {doc.id: doc.to_dict() for doc in db.collection(collection).stream()}
+
+        plats = load('plats')
+        plat_ingredients = {}
+        for doc_id, data in load('plat_ingredients').items():
+            plat_ingredients[data.get('idP', doc_id)] = _normalise_ingredient_lines(data.get('ingredients'))
+        for plat_id, plat in plats.items():
+            if plat_id not in plat_ingredients and plat.get('ingrédients'):
+                plat_ingredients[plat_id] = _normalise_ingredient_lines(plat.get('ingrédients'))
+
+        menu_plats: Dict[str, List[str]] = {}
+        for data in load('menu_plat').values():
+            if data.get('idM') and data.get('idP'):
+                menu_plats.setdefault(data['idM'], []).append(data['idP'])
+
+        snapshot = CatalogSnapshot(
+            version=self._version + 1,
+            loaded_at=time.time(),
+            plats=plats,
+            categories=load('categories'),
+            sous_categories=load('sous_categories'),
+            ingredients=load('ingredients'),
+            plat_ingredients=plat_ingredients,
+            menus=load('menus'),
+            menu_plats=menu_plats,
+        )
+        snapshot.fingerprint = fingerprint([
+            snapshot.plats, snapshot.categories, snapshot.sous_categories, snapshot.ingredients,
+            snapshot.plat_ingredients, snapshot.menus, snapshot.menu_plats
+        ])
+        previous = self._snapshot
+        if previous is not None and previous.fingerprint == snapshot.fingerprint:
+            # Unchanged: same version, the derived indexes stay valid
+            previous.loaded_at = snapshot.loaded_at
+            return previous
+
+        self._version = snapshot.version
+        logger.info(
+            f"Catalog v{snapshot.version} loaded: {len(plats)} plats, {len(snapshot.ingredients)} ingredients "
+            f"in {(time.perf_counter() - started) * 1000:.0f} ms"
+        )
+        return snapshot
+
+
+# Singleton instance
+catalog = CatalogReplica()
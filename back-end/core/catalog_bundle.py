@@ -0,0 +1,133 @@
+"""
+Whole catalog in one response, for the client apps' start-up.
+
+Categories, sous-categories, dishes (with their ingredient lines) and menus
+(with their dish ids) are serialized once per catalog version, from the
+catalog replica, and kept in memory as JSON plus a gzip copy: a request
+only picks one of the two ready-made bodies.
+
+The bundle version is the catalog fingerprint, so it is the same in every
+process. An app that already has a copy passes its version as ?since= and
+receives only the documents added, changed or deleted since then; versions
+are compared document by document against the hashes of the last
+HISTORY_SIZE versions this process has served. An unknown version (older,
+or seen by another process only) gets the full bundle again.
+"""
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpResponse
+from django.utils.cache import patch_vary_headers
+from core.catalog import catalog, CatalogSnapshot
+from core.conditional import fingerprint
+import gzip
+import json
+import threading
+
+HISTORY_SIZE = 20
+KINDS = ('categories', 'sous_categories', 'plats', 'menus')
+
+_history: 'OrderedDict[str, Dict[str, Dict[str, str]]]' = OrderedDict()
+_history_lock = threading.Lock()
+
+
+def _encode(payload: Dict) -> Tuple[bytes, bytes]:
+    """(JSON, gzip JSON) bodies; mtime=0 keeps the compressed bytes stable"""
+    body = json.dumps(payload, cls=DjangoJSONEncoder, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    return body, gzip.compress(body, compresslevel=9, mtime=0)
+
+
+class CatalogBundle:
+    """Serialized catalog of one version, full and as deltas from the previous ones"""
+
+    def __init__(self, snapshot: CatalogSnapshot):
+        self.version = snapshot.fingerprint
+        self.documents: Dict[str, Dict[str, Dict]] = {
+            'categories': {cat_id: {'id': cat_id, **cat} for cat_id, cat in snapshot.categories.items()},
+            'sous_categories': {
+                sub_id: {'id': sub_id, **sub} for sub_id, sub in snapshot.sous_categories.items()
+            },
+            'plats': {
+                plat_id: {'id': plat_id, **plat, 'ingredients': snapshot.dish_ingredients(plat_id)}
+                for plat_id, plat in snapshot.plats.items()
+            },
+            'menus': {
+                menu_id: {'id': menu_id, **menu, 'plats': snapshot.menu_plats.get(menu_id, [])}
+                for menu_id, menu in snapshot.menus.items()
+            },
+        }
+        self.hashes = {
+            kind: {doc_id: fingerprint(doc) for doc_id, doc in docs.items()}
+            for kind, docs in self.documents.items()
+        }
+        payload = {'version': self.version, 'mode': 'full'}
+        payload.update({kind: self._sorted(kind, self.documents[kind]) for kind in KINDS})
+        self.body, self.gzip_body = _encode(payload)
+        self._deltas: Dict[str, Tuple[bytes, bytes]] = {}
+        self._lock = threading.Lock()
+
+        with _history_lock:
+            _history[self.version] = self.hashes
+            _history.move_to_end(self.version)
+            while len(_history) > HISTORY_SIZE:
+                _history.popitem(last=False)
+
+    @staticmethod
+    def _sorted(kind: str, docs: Dict[str, Dict]) -> List[Dict]:
+        return [docs[doc_id] for doc_id in sorted(docs)]
+
+    def delta(self, since: str) -> Optional[Dict]:
+        """Documents changed and ids deleted since a version, None when the version is unknown"""
+        with _history_lock:
+            previous = _history.get(since)
+        if previous is None:
+            return None
+        changed, deleted = {}, {}
+        for kind in KINDS:
+            old, new = previous.get(kind, {}), self.hashes[kind]
+            changed[kind] = self._sorted(kind, {
+                doc_id: self.documents[kind][doc_id] for doc_id, digest in new.items() if old.get(doc_id) != digest
+            })
+            deleted[kind] = sorted(doc_id for doc_id in old if doc_id not in new)
+        return {'version': self.version, 'mode': 'delta', 'since': since, 'changed': changed, 'deleted': deleted}
+
+    def bodies(self, since: Optional[str] = None) -> Tuple[bytes, bytes]:
+        """(JSON, gzip JSON) of the full bundle, or of the delta since a known version"""
+        if not since:
+            return self.body, self.gzip_body
+        with self._lock:
+            cached = self._deltas.get(since)
+        if cached:
+            return cached
+        delta = self.delta(since)
+        if delta is None:
+            return self.body, self.gzip_body
+        encoded = _encode(delta)
+        with self._lock:
+            self._deltas[since] = encoded
+        return encoded
+
+
+def get_catalog_bundle() -> CatalogBundle:
+    """Catalog bundle for the current catalog version"""
+    return catalog.derived('bundle', CatalogBundle)
+
+
+def etag(request, *args, **kwargs) -> str:
+    """etag_func for condition(); weak, the same content is served gzipped or not"""
+    return f'W/"{catalog.snapshot().fingerprint}"'
+
+
+def catalog_response(request) -> HttpResponse:
+    """Full bundle or delta (?since=<version>), gzipped when the client accepts it"""
+    bundle = get_catalog_bundle()
+    body, gzip_body = bundle.bodies(request.GET.get('since'))
+    accepts_gzip = 'gzip' in request.META.get('HTTP_ACCEPT_ENCODING', '')
+
+    response = HttpResponse(gzip_body if accepts_gzip else body, content_type='application/json; charset=utf-8')
+    if accepts_gzip:
+        response['Content-Encoding'] = 'gzip'
+    patch_vary_headers(response, ('Accept-Encoding',))
+    response['Cache-Control'] = 'no-cache'
+    response['X-Catalog-Version'] = bundle.version
+    return response
@@ -0,0 +1,155 @@
+"""
+Views shared by the client apps (client_mobile and client_table), routed
+from both apps' urls.py like the authentication views of core.views.
+"""
+from django.http import FileResponse, HttpResponseRedirect, StreamingHttpResponse
+from django.utils.cache import patch_vary_headers
+from rest_framework import status
+from rest_framework.decorators import api_view, permission_classes, renderer_classes
+from rest_framework.permissions import AllowAny
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+from core import dish_images, notifications
+from core.notification_stream import EventStreamRenderer, client_payload, notification_stream, sse_events
+from core.permissions import IsClient
+from core.popularity import get_trending_dishes
+from core.search_index import search_dishes
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def get_trending_plats(request):
+    """Get the currently most ordered dishes (time-decayed popularity)"""
+    try:
+        limit = max(1, min(int(request.query_params.get('limit', 10)), 50))
+        return Response(get_trending_dishes(limit))
+    except ValueError:
+        return Response({'error': 'limit must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+    except Exception as e:
+        logger.error(f"Error getting trending plats: {str(e)}")
+        return Response({'error': 'Failed to retrieve trending plats'},
+                       status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+def search_response(request) -> Response:
+    """
+    Body of the search_plats views of both apps (each keeps its own permissions)
+    Query params: q (search text), limit (1 to 50, default 20)
+    """
+    try:
+        query = request.query_params.get('q', '').strip()
+        if not query:
+            return Response({'error': 'Query parameter q is required'}, status=status.HTTP_400_BAD_REQUEST)
+        limit = max(1, min(int(request.query_params.get('limit', 20)), 50))
+        return Response(search_dishes(query, limit=limit))
+    except ValueError:
+        return Response({'error': 'limit must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+    except Exception as e:
+        logger.error(f"Error searching plats: {str(e)}")
+        return Response({'error': 'Failed to search plats'},
+                       status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+def plat_images_response(request, plat_id):
+    """
+    Body of the get_plat_images views of both apps (each keeps its own permissions)
+    Without params: {variant: {width, jpeg, webp}} with the URLs of the files already rendered.
+    With variant (thumb / medium / large) and optionally format (jpeg / webp, default from Accept):
+    redirect to that file, usable directly as an image URL
+    """
+    try:
+        variants = dish_images.dish_variants(plat_id)
+        if variants is None:
+            return Response({'error': 'Image not available'}, status=status.HTTP_404_NOT_FOUND)
+        base_url = request.build_absolute_uri(request.path)
+
+        variant = request.query_params.get('variant')
+        if variant:
+            image_format = request.query_params.get('format') or dish_images.preferred_format(request)
+            if variant not in dish_images.VARIANTS or image_format not in dish_images.FORMATS:
+                return Response({'error': 'Unknown variant or format'}, status=status.HTTP_400_BAD_REQUEST)
+            name = variants.get(variant, {}).get(image_format)
+            if not name:
+                return Response({'error': 'Image not available'}, status=status.HTTP_404_NOT_FOUND)
+            response = HttpResponseRedirect(base_url + name)
+            # The target changes when the image is replaced: short cache on the redirect only
+            response['Cache-Control'] = 'public, max-age=300'
+            patch_vary_headers(response, ('Accept',))
+            return response
+
+        return Response({
+            'plat_id': plat_id,
+            'variants': {
+                name: {key: base_url + value if key in dish_images.FORMATS else value for key, value in files.items()}
+                for name, files in variants.items()
+            }
+        })
+    except Exception as e:
+        logger.error(f"Error getting images of plat {plat_id}: {str(e)}")
+        return Response({'error': 'Failed to retrieve dish images'},
+                       status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+def plat_image_file_response(request, plat_id, filename):
+    """Body of the get_plat_image_file views of both apps: one rendered variant of the dish, cached for good"""
+    try:
+        variants = dish_images.dish_variants(plat_id) or {}
+        names = {name for files in variants.values() for key, name in files.items() if key in dish_images.FORMATS}
+        # Only the variants of this dish are served under its URL
+        path = dish_images.variant_path(filename) if filename in names else None
+        if path is None:
+            return Response({'error': 'Image not found'}, status=status.HTTP_404_NOT_FOUND)
+        response = FileResponse(open(path, 'rb'), content_type=dish_images.content_type(filename))
+        response['Cache-Control'] = dish_images.IMMUTABLE_CACHE_CONTROL
+        return response
+    except Exception as e:
+        logger.error(f"Error serving image {filename}: {str(e)}")
+        return Response({'error': 'Failed to retrieve image'},
+                       status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@api_view(['GET'])
+@permission_classes([IsClient])
+def poll_notifications(request):
+    """
+    Long-poll for new notifications
+    Query params: cursor (id of the last notification received; latest one by default),
+    timeout in seconds (default 25, max 55)
+    Returns {'notifications': [...], 'cursor': ...}, with an empty list on timeout
+    """
+    try:
+        try:
+            timeout = float(request.query_params.get('timeout', 25))
+        except ValueError:
+            return Response({'error': 'timeout must be a number'}, status=status.HTTP_400_BAD_REQUEST)
+
+        items, cursor = notification_stream.wait(
+            notifications.inbox_id('client', request.user.uid),
+            request.query_params.get('cursor') or None,
+            timeout=timeout
+        )
+        return Response({
+            'notifications': [client_payload(item) for item in items],
+            'cursor': cursor
+        })
+    except Exception as e:
+        logger.error(f"Error polling notifications: {str(e)}")
+        return Response({'error': 'Failed to poll notifications'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@api_view(['GET'])
+@renderer_classes([JSONRenderer, EventStreamRenderer])
+@permission_classes([IsClient])
+def stream_notifications(request):
+    """Server-sent events stream of new notifications (resumes from Last-Event-ID or ?cursor)"""
+    cursor = request.META.get('HTTP_LAST_EVENT_ID') or request.query_params.get('cursor') or None
+    response = StreamingHttpResponse(
+        sse_events(notifications.inbox_id('client', request.user.uid), cursor),
+        content_type='text/event-stream'
+    )
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
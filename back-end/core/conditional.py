@@ -0,0 +1,68 @@
+"""
+Conditional GET (ETag / Last-Modified, 304 Not Modified) for the polled endpoints.
+
+ConditionalGetMiddleware (settings) gives every GET response without an ETag
+one hashed from its body and answers a matching If-None-Match with an empty
+304: the tablets stop re-downloading unchanged lists, but the view still
+runs. Endpoints whose data has a cheap version also compute their ETag
+before the view, with Django's condition() placed under the DRF decorators
+so authentication and permissions still apply:
+
+    @api_view(['GET'])
+    @permission_classes([IsClient])
+    @condition(etag_func=catalog.etag)
+    def get_categories(request): ...
+
+An unchanged poll is then answered without running the queries:
+
+- catalog endpoints: catalog.etag, fingerprint of the catalog content
+- floor plan: floor_plan.etag, fingerprint of the cached floor plan
+- notification listings: inbox_condition(), update time of the inbox
+  documents, which every item write touches through the counters
+  (core.notifications)
+"""
+from typing import Callable, List, Optional
+from django.views.decorators.http import condition
+from core.firebase_utils import firebase_config
+from core import notifications
+import hashlib
+import json
+
+
+def fingerprint(data) -> str:
+    """Stable hash of JSON-like data (dict keys sorted, timestamps as strings)"""
+    payload = json.dumps(data, sort_keys=True, default=str, separators=(',', ':'))
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()[:20]
+
+
+# ======================
+# Notification inboxes
+# ======================
+def _inbox_versions(request, inboxes: Callable) -> List[tuple]:
+    """(inbox, update_time) of the request's inboxes, read once per request with get_all"""
+    versions = getattr(request, '_inbox_versions', None)
+    if versions is None:
+        db = firebase_config.get_db()
+        refs = [notifications.inbox_ref(db, inbox) for inbox in inboxes(request)]
+        versions = sorted(
+            ((doc.id, doc.update_time if doc.exists else None) for doc in db.get_all(refs)),
+            key=lambda version: version[0]
+        )
+        request._inbox_versions = versions
+    return versions
+
+
+def inbox_condition(inboxes: Callable):
+    """
+    condition() for a notification listing; inboxes(request) returns the
+    inbox ids the view lists. Query params are part of the URL, so each page
+    and filter is validated separately by the client.
+    """
+    def etag(request, *args, **kwargs) -> str:
+        return fingerprint(_inbox_versions(request, inboxes))
+
+    def last_modified(request, *args, **kwargs) -> Optional[object]:
+        times = [updated for _, updated in _inbox_versions(request, inboxes) if updated is not None]
+        return max(times) if times else None
+
+    return condition(etag_func=etag, last_modified_func=last_modified)
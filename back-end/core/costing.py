@@ -0,0 +1,166 @@
+"""
+Menu costing engine.
+
+Joins plat_ingredients quantities with ingredients.cout_par_unite. Quantities
+and unit costs are normalised to a base unit per dimension (g, ml, pièce),
+then the whole menu is costed in one matrix product:
+costs = quantities (dishes x ingredients) @ unit_costs (ingredients).
+"""
+from typing import Dict, List, Optional, Tuple
+from core.catalog import catalog, CatalogSnapshot
+from core.text_utils import fold_text
+import logging
+import numpy as np
+import re
+
+logger = logging.getLogger(__name__)
+
+# unit -> (dimension, factor to the base unit of the dimension)
+UNIT_FACTORS = {
+    'mg': ('masse', 0.001), 'g': ('masse', 1.0), 'gr': ('masse', 1.0), 'gramme': ('masse', 1.0),
+    'kg': ('masse', 1000.0), 'kilo': ('masse', 1000.0), 'kilogramme': ('masse', 1000.0),
+    'ml': ('volume', 1.0), 'millilitre': ('volume', 1.0), 'cl': ('volume', 10.0), 'centilitre': ('volume', 10.0),
+    'dl': ('volume', 100.0), 'l': ('volume', 1000.0), 'litre': ('volume', 1000.0),
+    'piece': ('piece', 1.0), 'pc': ('piece', 1.0), 'pcs': ('piece', 1.0), 'unite': ('piece', 1.0),
+    'u': ('piece', 1.0), 'botte': ('piece', 1.0), 'sachet': ('piece', 1.0), 'boite': ('piece', 1.0),
+}
+
+# Kitchen approximation used when a recipe and the stock use mass and volume (density 1)
+INTERCHANGEABLE = {('masse', 'volume'), ('volume', 'masse')}
+
+
+def parse_unit(unit) -> Optional[Tuple[str, float]]:
+    """'Kilogramme (kg)' -> ('masse', 1000.0), 'Litre' -> ('volume', 1000.0), unknown -> None"""
+    folded = fold_text(unit).strip()
+    if not folded:
+        return None
+    inner = re.search(r"\(([^)]+)\)", folded)
+    candidates = [inner.group(1).strip()] if inner else []
+    candidates += [folded, folded.rstrip('s'), folded.split()[0].rstrip('s')]
+    for candidate in candidates:
+        if candidate in UNIT_FACTORS:
+            return UNIT_FACTORS[candidate]
+    return None
+
+
+class CostingEngine:
+    """Cost and margin of every dish for one catalog version"""
+
+    def __init__(self, snapshot: CatalogSnapshot):
+        # Ingredient columns
+        self.ingredient_ids = list(snapshot.ingredients.keys())
+        by_name = {}
+        unit_costs = np.zeros(len(self.ingredient_ids))
+        dimensions = []
+        for col, ingredient_id in enumerate(self.ingredient_ids):
+            ingredient = snapshot.ingredients[ingredient_id]
+            by_name.setdefault(fold_text(ingredient.get('nom', '')).strip(), col)
+            by_name.setdefault(fold_text(ingredient_id.replace('_', ' ')).strip(), col)
+            parsed = parse_unit(ingredient.get('unite', '')) or ('masse', 1000.0)  # stock defaults to kg
+            dimensions.append(parsed[0])
+            try:
+                unit_costs[col] = float(ingredient.get('cout_par_unite', 0) or 0) / parsed[1]
+            except (TypeError, ValueError):
+                unit_costs[col] = 0.0
+        self.unit_costs = unit_costs
+
+        # Dish rows
+        self.dish_ids = list(snapshot.plats.keys())
+        self.position = {dish_id: row for row, dish_id in enumerate(self.dish_ids)}
+        self.names = [snapshot.plats[d].get('nom', 'Unknown') for d in self.dish_ids]
+        self.prices = np.array([float(snapshot.plats[d].get('prix', 0) or 0) for d in self.dish_ids])
+        quantities = np.zeros((len(self.dish_ids), len(self.ingredient_ids)))
+        self.lines: Dict[str, List[Dict]] = {}
+        self.missing: Dict[str, List[str]] = {}
+
+        for row, dish_id in enumerate(self.dish_ids):
+            dish_lines = []
+            for line in snapshot.dish_ingredients(dish_id):
+                name = line.get('nom', '')
+                col = by_name.get(fold_text(name).strip())
+                quantity = float(line.get('quantite_g', 0) or 0)
+                parsed = parse_unit(line.get('unite')) or ('masse', 1.0)  # recipe quantities are grams
+                if col is None or quantity <= 0 or not self._compatible(parsed[0], dimensions[col]):
+                    self.missing.setdefault(dish_id, []).append(name)
+                    dish_lines.append({'name': name, 'quantity': quantity, 'unit': line.get('unite', ''), 'col': None})
+                    continue
+                base_quantity = quantity * parsed[1]
+                quantities[row, col] += base_quantity
+                dish_lines.append({'name': name, 'quantity': quantity, 'unit': line.get('unite', ''),
+                                   'col': col, 'base_quantity': base_quantity})
+            self.lines[dish_id] = dish_lines
+
+        # One vectorised pass for the whole menu
+        self.costs = np.round(quantities @ unit_costs, 2)
+        self.margins = np.round(self.prices - self.costs, 2)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            self.margin_percentages = np.round(
+                np.where(self.prices > 0, self.margins / self.prices * 100, 0.0), 1
+            )
+
+    @staticmethod
+    def _compatible(line_dimension: str, stock_dimension: str) -> bool:
+        return line_dimension == stock_dimension or (line_dimension, stock_dimension) in INTERCHANGEABLE
+
+    def dish_details(self, dish_id: str) -> Optional[Dict]:
+        row = self.position.get(dish_id)
+        if row is None:
+            return None
+        ingredients = []
+        for line in self.lines.get(dish_id, []):
+            cost = None
+            if line['col'] is not None:
+                cost = round(float(line['base_quantity'] * self.unit_costs[line['col']]), 2)
+            ingredients.append({
+                'name': line['name'],
+                'quantity': line['quantity'],
+                'unit': line['unit'],
+                'cost': cost
+            })
+        return {
+            'plat_id': dish_id,
+            'nom': self.names[row],
+            'prix_de_vente': float(self.prices[row]),
+            'cout_total': float(self.costs[row]),
+            'marge': float(self.margins[row]),
+            'marge_percentage': float(self.margin_percentages[row]),
+            'ingredients': ingredients,
+            'ingredients_sans_cout': self.missing.get(dish_id, [])
+        }
+
+    def report(self, order_by: str = 'marge_percentage', descending: bool = False) -> Dict:
+        """Cost and margin of every dish plus menu-wide aggregates"""
+        columns = {
+            'marge_percentage': self.margin_percentages,
+            'marge': self.margins,
+            'cout_total': self.costs,
+            'prix_de_vente': self.prices,
+        }
+        key = columns.get(order_by, self.margin_percentages)
+        order = np.argsort(key, kind='stable')
+        if descending:
+            order = order[::-1]
+
+        plats = [{
+            'plat_id': self.dish_ids[row],
+            'nom': self.names[row],
+            'prix_de_vente': float(self.prices[row]),
+            'cout_total': float(self.costs[row]),
+            'marge': float(self.margins[row]),
+            'marge_percentage': float(self.margin_percentages[row]),
+            'cout_incomplet': self.dish_ids[row] in self.missing
+        } for row in order]
+
+        priced = self.prices > 0
+        return {
+            'plats': plats,
+            'total_plats': len(plats),
+            'plats_cout_incomplet': len(self.missing),
+            'marge_percentage_moyenne': round(float(self.margin_percentages[priced].mean()), 1) if priced.any() else 0,
+            'cout_moyen': round(float(self.costs.mean()), 2) if len(self.costs) else 0,
+        }
+
+
+def get_costing_engine() -> CostingEngine:
+    """Costing engine for the current catalog version"""
+    return catalog.derived('costing', CostingEngine)
@@ -0,0 +1,255 @@
+"""
+Resized dish images.
+
+A dish's image_url is either an http(s) URL or a path of an image stored
+in settings.DISH_IMAGE_SOURCE_DIR (for instance the 'assets/images/...'
+paths of the Flutter apps). The original is fetched once, stored under
+its content hash, and turned into the VARIANTS widths / qualities in JPEG
+and WebP with Pillow. Variants are written once to
+settings.DISH_IMAGE_CACHE_DIR with content-hash file names:
+
+    <source hash>-w<width>-q<quality>.<jpg|webp>
+
+so a file never changes once served and is sent with an immutable
+Cache-Control; a new image gets a new hash, hence a new URL. The variants
+listing of a dish (or its redirect to one variant) is what changes.
+
+Variants are rendered ahead of time, never on a request: render_dish() runs
+in the background after the manager writes a dish, and
+`python manage.py render_dish_images` renders the whole catalog (after a
+deploy, or to pick up images replaced at the same URL). The content hash
+of each image_url is kept in the cache directory, so every process serves
+what any of them rendered; requests only list and send existing files.
+Renders of one dish are serialized by a lock per dish, renders of different
+dishes run side by side.
+"""
+from pathlib import Path
+from typing import Dict, Optional
+from django.conf import settings
+from PIL import Image, ImageOps
+from core.catalog import catalog
+import hashlib
+import io
+import logging
+import os
+import re
+import requests
+import tempfile
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# variant -> (max width in px, quality)
+VARIANTS = {
+    'thumb': (320, 70),
+    'medium': (640, 75),
+    'large': (1280, 80),
+}
+FORMATS = {
+    'jpeg': ('jpg', 'image/jpeg'),
+    'webp': ('webp', 'image/webp'),
+}
+DEFAULT_VARIANT = 'medium'
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+MAX_SOURCE_BYTES = 20 * 1024 * 1024
+DOWNLOAD_TIMEOUT = 10
+
+VARIANT_NAME_RE = re.compile(r'^(?P<hash>[0-9a-f]{16})-w(?P<width>\d+)-q(?P<quality>\d+)\.(?P<ext>jpg|webp)$')
+
+_dish_locks: Dict[str, threading.Lock] = {}
+_dish_locks_lock = threading.Lock()
+
+
+def source_dir() -> Path:
+    return Path(getattr(settings, 'DISH_IMAGE_SOURCE_DIR', Path(settings.BASE_DIR) / 'media' / 'plats'))
+
+
+def cache_dir() -> Path:
+    return Path(getattr(settings, 'DISH_IMAGE_CACHE_DIR', Path(settings.BASE_DIR) / 'media' / 'image_cache'))
+
+
+def _originals_dir() -> Path:
+    return cache_dir() / 'originals'
+
+
+def _sources_dir() -> Path:
+    return cache_dir() / 'sources'
+
+
+def _source_key(image_url: str) -> str:
+    return hashlib.sha256(image_url.encode('utf-8')).hexdigest()[:32]
+
+
+def _dish_lock(plat_id: str) -> threading.Lock:
+    with _dish_locks_lock:
+        return _dish_locks.setdefault(plat_id, threading.Lock())
+
+
+def variant_name(source_hash: str, variant: str, image_format: str) -> str:
+    width, quality = VARIANTS[variant]
+    return f"{source_hash}-w{width}-q{quality}.{FORMATS[image_format][0]}"
+
+
+def _write_atomic(path: Path, write) -> None:
+    """write(file) into a temporary file renamed over path: readers never see a partial image"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=path.parent, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            write(f)
+        os.replace(tmp, path)
+    except Exception:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+
+# ======================
+# Originals
+# ======================
+def _read_source(image_url: str) -> Optional[bytes]:
+    """Bytes of an image_url: downloaded, or read from the source directory"""
+    if image_url.startswith(('http://', 'https://')):
+        with requests.get(image_url, timeout=DOWNLOAD_TIMEOUT, stream=True) as response:
+            response.raise_for_status()
+            content = response.raw.read(MAX_SOURCE_BYTES + 1, decode_content=True)
+        if len(content) > MAX_SOURCE_BYTES:
+            raise ValueError(f"Image larger than {MAX_SOURCE_BYTES} bytes: {image_url}")
+        return content
+
+    root = source_dir().resolve()
+    for candidate in (root / image_url.lstrip('/'), root / Path(image_url).name):
+        candidate = candidate.resolve()
+        # Never read outside the source directory
+        if root in candidate.parents and candidate.is_file():
+            return candidate.read_bytes()
+    return None
+
+
+def fetch_source(image_url: str) -> Optional[str]:
+    """Read an image_url, store its original and record its content hash; None when unreadable"""
+    content = _read_source(image_url)
+    if content is None:
+        return None
+    digest = hashlib.sha256(content).hexdigest()[:16]
+    original = _originals_dir() / digest
+    if not original.exists():
+        # Checked by Pillow before being kept
+        with Image.open(io.BytesIO(content)) as image:
+            image.verify()
+        _write_atomic(original, lambda f: f.write(content))
+    _write_atomic(_sources_dir() / _source_key(image_url), lambda f: f.write(digest.encode('ascii')))
+    return digest
+
+
+def source_hash(image_url: str) -> Optional[str]:
+    """Content hash recorded for an image_url by the last render, None when never rendered"""
+    try:
+        return (_sources_dir() / _source_key(image_url)).read_text(encoding='ascii').strip() or None
+    except OSError:
+        return None
+
+
+# ======================
+# Variants
+# ======================
+def _render(original: Path, target: Path, width: int, quality: int, image_format: str) -> None:
+    with Image.open(original) as image:
+        image = ImageOps.exif_transpose(image)
+        # Width bound, never upscaled
+        image.thumbnail((width, width * 4), Image.Resampling.LANCZOS)
+        if image_format == 'jpeg':
+            if image.mode in ('RGBA', 'LA', 'P'):
+                image = image.convert('RGBA')
+                background = Image.new('RGB', image.size, (255, 255, 255))
+                background.paste(image, mask=image.getchannel('A'))
+                image = background
+            elif image.mode != 'RGB':
+                image = image.convert('RGB')
+            options = {'quality': quality, 'optimize': True, 'progressive': True}
+        else:
+            options = {'quality': quality, 'method': 6}
+        _write_atomic(target, lambda f: image.save(f, format=image_format.upper(), **options))
+
+
+def variant_path(name: str) -> Optional[Path]:
+    """Path of an existing variant file; None for an unknown name or a variant not rendered"""
+    match = VARIANT_NAME_RE.match(name)
+    if not match:
+        return None
+    if (int(match['width']), int(match['quality'])) not in VARIANTS.values():
+        return None
+    target = cache_dir() / name
+    return target if target.exists() else None
+
+
+def render_dish(plat_id: str, image_url: Optional[str] = None, force: bool = False) -> Optional[Dict[str, Dict]]:
+    """
+    Fetch the image of a dish (its catalog image_url by default) and render
+    every missing variant. force fetches the source again even when already
+    rendered, to pick up an image replaced at the same URL. Returns
+    dish_variants(), None when the dish has no usable image.
+    """
+    if image_url is None:
+        image_url = (catalog.snapshot().plats.get(plat_id) or {}).get('image_url')
+    if not image_url:
+        return None
+    with _dish_lock(plat_id):
+        digest = None if force else source_hash(image_url)
+        if digest is None or not (_originals_dir() / digest).exists():
+            digest = fetch_source(image_url)
+        if digest is None:
+            logger.warning(f"Image of plat {plat_id} not found: {image_url}")
+            return None
+        original = _originals_dir() / digest
+        started = time.perf_counter()
+        for variant, (width, quality) in VARIANTS.items():
+            for image_format in FORMATS:
+                target = cache_dir() / variant_name(digest, variant, image_format)
+                if not target.exists():
+                    _render(original, target, width, quality, image_format)
+        logger.info(f"Image variants of plat {plat_id} ready in {(time.perf_counter() - started) * 1000:.0f} ms")
+    return dish_variants(plat_id, image_url)
+
+
+def render_in_background(plat_id: str, image_url: Optional[str] = None) -> None:
+    """render_dish() off the request thread, after a dish write"""
+    def run():
+        try:
+            render_dish(plat_id, image_url, force=True)
+        except Exception as e:
+            logger.error(f"Error rendering the image of plat {plat_id}: {str(e)}")
+
+    threading.Thread(target=run, name=f'dish-image-{plat_id}', daemon=True).start()
+
+
+def dish_variants(plat_id: str, image_url: Optional[str] = None) -> Optional[Dict[str, Dict]]:
+    """
+    {variant: {'width': w, 'jpeg': name, 'webp': name}} of a dish, with only
+    the files already rendered; None when the dish has no rendered image.
+    Never fetches nor renders anything.
+    """
+    if image_url is None:
+        image_url = (catalog.snapshot().plats.get(plat_id) or {}).get('image_url')
+    digest = source_hash(image_url) if image_url else None
+    if digest is None:
+        return None
+    variants = {}
+    for variant, (width, _) in VARIANTS.items():
+        files = {
+            image_format: variant_name(digest, variant, image_format) for image_format in FORMATS
+            if (cache_dir() / variant_name(digest, variant, image_format)).exists()
+        }
+        if files:
+            variants[variant] = {'width': width, **files}
+    return variants or None
+
+
+def content_type(name: str) -> str:
+    return FORMATS['webp'][1] if name.endswith('.webp') else FORMATS['jpeg'][1]
+
+
+def preferred_format(request) -> str:
+    """WebP for the clients that accept it, JPEG otherwise"""
+    return 'webp' if 'image/webp' in request.META.get('HTTP_ACCEPT', '') else 'jpeg'
@@ -1,5 +1,6 @@
 from firebase_admin import firestore
 from core.firebase_utils import firebase_config
+from core.reservation_index import index_fields
 from datetime import datetime
 from typing import Dict, List, Any, Optional
 import logging
@@ -184,7 +185,8 @@ class FirebaseCRUD:
             'date_time': reservation_data['date_time'],
             'party_size': reservation_data['party_size'],
             'status': 'confirmed',
-            'created_at': firestore.SERVER_TIMESTAMP
+            'created_at': firestore.SERVER_TIMESTAMP,
+            **index_fields(reservation_data['date_time'])
         })
 
     def update_reservation_status(self, reservation_id: str, status: str) -> None:
@@ -0,0 +1,145 @@
+"""
+Floor plan for the server app.
+
+Tables, their pending / confirmed reservations, the reservation clients and
+the clients' active orders are fetched with a handful of set queries and
+joined in memory by table, instead of several queries per table. The
+result is cached for CACHE_TTL seconds and invalidated by the views that
+write tables, reservations or orders. The fingerprint of the cached plan
+is the ETag of the tables endpoint (core.conditional).
+"""
+from collections import defaultdict
+from typing import Dict, List
+from core.firebase_utils import firebase_config
+from core.conditional import fingerprint
+from core.orders_utils import IN_QUERY_LIMIT
+import copy
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+CACHE_TTL = 15
+# Orders in these states are not shown on the floor plan
+CLOSED_ORDER_STATES = ['servie', 'annulee']
+
+
+def _chunks(values: List[str]):
+    for start in range(0, len(values), IN_QUERY_LIMIT):
+        yield values[start:start + IN_QUERY_LIMIT]
+
+
+def build_floor_plan(db) -> List[Dict]:
+    """Same payload as the per-table version: every table with 'reservation' and 'orders'"""
+    tables = []
+    for doc in db.collection('tables').stream():
+        table = doc.to_dict()
+        table['id'] = doc.id
+        tables.append(table)
+
+    # 1. Pending and confirmed reservations, grouped by table (document id order, as before)
+    pending, confirmed = defaultdict(list), defaultdict(list)
+    reservations_query = db.collection('reservations').where('status', 'in', ['en_attente', 'confirmee'])
+    for doc in sorted(reservations_query.stream(), key=lambda d: d.id):
+        reservation = doc.to_dict()
+        reservation['id'] = doc.id
+        target = pending if reservation.get('status') == 'en_attente' else confirmed
+        target[reservation.get('table_id')].append(reservation)
+
+    reserved = {t['id'] for t in tables if t.get('etatTable') == 'reservee'}
+    occupied = {t['id'] for t in tables if t.get('etatTable') == 'occupee'}
+    first_pending = {table_id: pending[table_id][0] for table_id in reserved if pending.get(table_id)}
+
+    # 2. Clients of the displayed pending reservations, in one batched read
+    client_ids = sorted({r['client_id'] for r in first_pending.values() if r.get('client_id')})
+    clients = {}
+    if client_ids:
+        refs = [db.collection('clients').document(client_id) for client_id in client_ids]
+        clients = {doc.id: doc.to_dict() for doc in db.get_all(refs) if doc.exists}
+
+    # 3. Active orders of the clients seated at occupied tables
+    seated_clients = sorted({
+        r['client_id'] for table_id in occupied for r in confirmed.get(table_id, []) if 'client_id' in r
+    })
+    orders_by_client = defaultdict(list)
+    for chunk in _chunks(seated_clients):
+        for doc in sorted(db.collection('commandes').where('idC', 'in', chunk).stream(), key=lambda d: d.id):
+            order = doc.to_dict()
+            if order.get('etat') not in CLOSED_ORDER_STATES:
+                orders_by_client[order.get('idC')].append({
+                    'id': doc.id,
+                    'etat': order.get('etat', 'Unknown'),
+                    'montant': order.get('montant', 0)
+                })
+
+    # 4. Join by table
+    for table in tables:
+        reservation_info = None
+        reservation = first_pending.get(table['id'])
+        if reservation:
+            client_info = None
+            client = clients.get(reservation.get('client_id'))
+            if client is not None:
+                client_info = {
+                    'id': reservation['client_id'],
+                    'username': client.get('username', 'Unknown'),
+                    'email': client.get('email', 'Unknown')
+                }
+            reservation_info = {
+                'id': reservation['id'],
+                'date_time': reservation.get('date_time'),
+                'party_size': reservation.get('party_size'),
+                'status': reservation.get('status'),
+                'client': client_info,
+                'created_at': reservation.get('created_at')
+            }
+
+        orders = []
+        if table['id'] in occupied:
+            for reservation in confirmed.get(table['id'], []):
+                if 'client_id' in reservation:
+                    orders.extend(orders_by_client.get(reservation['client_id'], []))
+
+        table['reservation'] = reservation_info
+        table['orders'] = orders
+    return tables
+
+
+class FloorPlanCache:
+    """Cached floor plan, rebuilt on demand after an invalidation or CACHE_TTL seconds"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._tables: List[Dict] = []
+        self._fingerprint = ''
+        self._built_at = 0.0
+        self._generation = 0
+
+    def invalidate(self) -> None:
+        self._generation += 1
+        self._built_at = 0.0
+
+    def _refresh(self) -> None:
+        if time.time() - self._built_at >= CACHE_TTL:
+            with self._lock:
+                if time.time() - self._built_at >= CACHE_TTL:
+                    generation = self._generation
+                    tables = build_floor_plan(firebase_config.get_db())
+                    self._tables = tables
+                    self._fingerprint = fingerprint(tables)
+                    # A write during the build leaves the cache stale: rebuild on next read
+                    self._built_at = time.time() if generation == self._generation else 0.0
+
+    def get(self) -> List[Dict]:
+        self._refresh()
+        return copy.deepcopy(self._tables)
+
+    def etag(self, request, *args, **kwargs) -> str:
+        """etag_func for condition(): unchanged plan, no copy and no serialization"""
+        self._refresh()
+        return self._fingerprint
+
+
+# Singleton instance
+floor_plan = FloorPlanCache()
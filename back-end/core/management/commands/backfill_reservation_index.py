@@ -0,0 +1,80 @@
+from django.core.management.base import BaseCommand
+from core.firebase_utils import firebase_config
+from core.reservation_index import index_fields
+from core.reservation_booking import claim_existing
+from core.table_availability import ACTIVE_STATUSES
+import logging
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 500
+
+class Command(BaseCommand):
+    help = 'Add the date_key and slot_start fields and the slot claims to existing reservations'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help='Recompute the fields of reservations that already have them')
+
+    def handle(self, *args, **options):
+        db = firebase_config.get_db()
+        force = options['force']
+
+        self.stdout.write("Indexation des réservations par date...")
+
+        updated, skipped, invalid = 0, 0, []
+        # Active reservations booked before the slot claims existed
+        unclaimed = []
+        try:
+            batch = db.batch()
+            pending = 0
+            for doc in db.collection('reservations').stream():
+                data = doc.to_dict()
+                if data.get('status') in ACTIVE_STATUSES and data.get('table_id') and not data.get('slot_ids'):
+                    unclaimed.append((doc.id, data))
+                if not force and data.get('date_key') and data.get('slot_start'):
+                    skipped += 1
+                    continue
+                try:
+                    fields = index_fields(data.get('date_time', ''))
+                except ValueError:
+                    invalid.append(doc.id)
+                    continue
+                data.update(fields)
+
+                batch.update(doc.reference, fields)
+                pending += 1
+                updated += 1
+                if pending == BATCH_SIZE:
+                    batch.commit()
+                    batch = db.batch()
+                    pending = 0
+            if pending:
+                batch.commit()
+
+            # One transaction per reservation, like a booking
+            claimed, conflicts = 0, {}
+            for reservation_id, data in unclaimed:
+                if reservation_id in invalid:
+                    continue
+                slots, taken = claim_existing(db, reservation_id, data)
+                claimed += len(slots)
+                if taken:
+                    conflicts[reservation_id] = taken
+        except Exception as e:
+            self.stdout.write(self.style.ERROR(f"Erreur lors de l'indexation: {str(e)}"))
+            return
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Indexation terminée avec succès!\n'
+                f'Réservations mises à jour: {updated}\n'
+                f'Déjà indexées: {skipped}\n'
+                f'Créneaux réservés: {claimed} ({len(unclaimed)} réservations sans créneaux)'
+            )
+        )
+        for reservation_id, taken in conflicts.items():
+            self.stdout.write(self.style.WARNING(
+                f"Double réservation: {reservation_id} chevauche des créneaux déjà pris ({', '.join(taken)})"
+            ))
+        if invalid:
+            self.stdout.write(self.style.WARNING(f"date_time invalide pour: {', '.join(invalid)}"))
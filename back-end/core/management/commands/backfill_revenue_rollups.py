@@ -0,0 +1,82 @@
+from django.core.management.base import BaseCommand
+from core.firebase_utils import firebase_config
+from core import revenue_rollups
+from collections import defaultdict
+import logging
+
+logger = logging.getLogger(__name__)
+
+class Command(BaseCommand):
+    help = 'Recount the hourly, daily and monthly revenue rollups from the order history'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Compute the rollups without writing them')
+
+    def handle(self, *args, **options):
+        db = firebase_config.get_db()
+        dry_run = options['dry_run']
+
+        self.stdout.write("Recomptage des revenus agrégés à partir des commandes...")
+
+        try:
+            # Orders of each hour (cancelled ones too: their flag may need clearing)
+            hours = defaultdict(list)
+            totals = defaultdict(lambda: {'montant': 0.0, 'commandes': 0})
+            counted, skipped = 0, 0
+            for doc in db.collection('commandes').stream():
+                data = doc.to_dict()
+                if not data.get('dateCreation'):
+                    skipped += 1
+                    continue
+                try:
+                    keys = revenue_rollups.bucket_keys(data['dateCreation'])
+                except ValueError:
+                    skipped += 1
+                    continue
+                hours[keys['hour']].append(doc.reference)
+                if not revenue_rollups.is_counted(data):
+                    skipped += 1
+                    continue
+                counted += 1
+                for granularity, key in keys.items():
+                    totals[(granularity, key)]['montant'] += float(data.get('montant', 0) or 0)
+                    totals[(granularity, key)]['commandes'] += 1
+
+            if dry_run:
+                self.stdout.write(
+                    self.style.SUCCESS(
+                        f'Simulation terminée (aucune écriture)\n'
+                        f'Commandes comptées: {counted}\n'
+                        f'Commandes ignorées: {skipped}\n'
+                        f'Documents agrégés: {len(totals)}'
+                    )
+                )
+                return
+
+            # Existing buckets without any order left are recounted too (to zero)
+            for doc in db.collection(revenue_rollups.ROLLUP_COLLECTION).where('granularite', '==', 'hour').stream():
+                hours.setdefault(doc.to_dict().get('periode', ''), [])
+            hours.pop('', None)
+
+            # Each bucket is recounted in its own transaction: orders created meanwhile are not lost
+            days, months = set(), set()
+            for key in sorted(hours):
+                revenue_rollups.recount_hour(db, key, hours[key])
+                days.add(key[:10])
+                months.add(key[:7])
+            for day in sorted(days):
+                revenue_rollups.recount_from_hours(db, 'day', day)
+            for month in sorted(months):
+                revenue_rollups.recount_from_hours(db, 'month', month)
+        except Exception as e:
+            self.stdout.write(self.style.ERROR(f'Erreur lors du recomptage: {str(e)}'))
+            return
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Recomptage terminé avec succès!\n'
+                f'Commandes comptées: {counted}\n'
+                f'Commandes ignorées: {skipped}\n'
+                f'Documents agrégés écrits: {len(hours) + len(days) + len(months)}'
+            )
+        )
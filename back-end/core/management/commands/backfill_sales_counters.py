@@ -0,0 +1,124 @@
+from django.core.management.base import BaseCommand
+from core.firebase_utils import firebase_config
+from core.orders_utils import LINE_ITEM_COLLECTIONS
+from core import sales_counters
+from core.revenue_rollups import bucket_keys, is_counted
+from collections import defaultdict
+import logging
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 500
+# Daily counters recounted per transaction, leaving room for the order flags it fixes
+DISHES_PER_TRANSACTION = 400
+
+class Command(BaseCommand):
+    help = 'Recount the per-dish sales counters (all time, monthly, daily) from the order history'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Compute the counters without writing them')
+
+    def handle(self, *args, **options):
+        db = firebase_config.get_db()
+        dry_run = options['dry_run']
+
+        self.stdout.write("Recomptage des compteurs de ventes par plat...")
+
+        try:
+            # Orders of each day (cancelled ones too: their flag may need clearing)
+            days = defaultdict(list)
+            order_days, unflagged = {}, []
+            for doc in db.collection('commandes').stream():
+                data = doc.to_dict()
+                if not data.get('dateCreation'):
+                    continue
+                try:
+                    day = bucket_keys(data['dateCreation'])['day']
+                except ValueError:
+                    continue
+                days[day].append(doc.reference)
+                if is_counted(data):
+                    order_days[doc.id] = day
+                    if not data.get('sales_counted'):
+                        unflagged.append(doc.reference)
+
+            prices = {doc.id: float(doc.to_dict().get('prix', 0) or 0) for doc in db.collection('plats').stream()}
+            items_by_order = defaultdict(list)
+            dishes_by_day = defaultdict(set)
+            totals = defaultdict(lambda: {'quantite': 0, 'chiffre_affaires': 0.0})
+            for collection in LINE_ITEM_COLLECTIONS:
+                for doc in db.collection(collection).stream():
+                    line = doc.to_dict()
+                    day = order_days.get(line.get('idCmd'))
+                    if not day or not line.get('idP'):
+                        continue
+                    quantity = int(line.get('quantité', line.get('quantite', 1)) or 1)
+                    price = float(line.get('prix_unitaire', prices.get(line['idP'], 0)) or 0)
+                    items_by_order[line['idCmd']].append({'plat_id': line['idP'], 'quantity': quantity, 'prix': price})
+                    dishes_by_day[day].add(line['idP'])
+                    for period in (sales_counters.TOTAL_PERIOD, day[:7], day):
+                        totals[(period, line['idP'])]['quantite'] += quantity
+                        totals[(period, line['idP'])]['chiffre_affaires'] += quantity * price
+
+            if dry_run:
+                self.stdout.write(
+                    self.style.SUCCESS(
+                        f'Simulation terminée (aucune écriture)\n'
+                        f'Commandes comptées: {len(order_days)}\n'
+                        f'Compteurs calculés: {len(totals)}'
+                    )
+                )
+                return
+
+            # Existing counters are recounted too (to zero when no order is left)
+            months_by_dish = defaultdict(set)
+            for doc in db.collection(sales_counters.SALES_COLLECTION).stream():
+                counter = doc.to_dict()
+                if counter.get('granularite') == 'day' and counter.get('idP'):
+                    dishes_by_day[counter['periode']].add(counter['idP'])
+                    days.setdefault(counter['periode'], [])
+                elif counter.get('granularite') == 'month' and counter.get('idP'):
+                    months_by_dish[counter['idP']].add(counter['periode'])
+
+            # Flag the counted orders first, so a transaction only fixes the flags changed meanwhile
+            for start in range(0, len(unflagged), BATCH_SIZE):
+                batch = db.batch()
+                for ref in unflagged[start:start + BATCH_SIZE]:
+                    batch.update(ref, {'sales_counted': True})
+                batch.commit()
+
+            # Days, then months from days, then all time from months, each in transactions
+            written = 0
+            days_by_month = defaultdict(set)
+            for day in sorted(days):
+                dishes = sorted(dishes_by_day[day])
+                for start in range(0, len(dishes), DISHES_PER_TRANSACTION):
+                    written += sales_counters.recount_day(
+                        db, day, days[day], dishes[start:start + DISHES_PER_TRANSACTION], items_by_order
+                    )
+                for plat_id in dishes:
+                    days_by_month[(day[:7], plat_id)].add(day)
+                    months_by_dish[plat_id].add(day[:7])
+            for (month, plat_id), month_days in sorted(days_by_month.items()):
+                sales_counters.recount_from(db, 'month', month, plat_id, sorted(month_days))
+                written += 1
+            for plat_id, months in sorted(months_by_dish.items()):
+                for month in sorted(months):
+                    if (month, plat_id) not in days_by_month:
+                        # Monthly counter without any daily counter left
+                        sales_counters.recount_from(db, 'month', month, plat_id, [])
+                        written += 1
+            for plat_id, months in sorted(months_by_dish.items()):
+                sales_counters.recount_from(db, 'total', sales_counters.TOTAL_PERIOD, plat_id, sorted(months))
+                written += 1
+        except Exception as e:
+            self.stdout.write(self.style.ERROR(f'Erreur lors du recomptage: {str(e)}'))
+            return
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Recomptage terminé avec succès!\n'
+                f'Commandes comptées: {len(order_days)}\n'
+                f'Compteurs écrits: {written}'
+            )
+        )
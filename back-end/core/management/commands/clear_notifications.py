@@ -1,30 +1,34 @@
 from django.core.management.base import BaseCommand
 from core.firebase_utils import firebase_config
+from core import notifications
 from firebase_admin import firestore
 import logging
 
 logger = logging.getLogger(__name__)
 
 class Command(BaseCommand):
-    help = 'Clear all documents from the notifications collection'
+    help = 'Clear all notifications (inboxes and the legacy notifications collection)'
 
     def handle(self, *args, **options):
         db = firebase_config.get_db()
 
-        self.stdout.write("Début de la suppression de tous les documents de la collection 'notifications'...")
+        self.stdout.write("Début de la suppression de toutes les notifications...")
 
         try:
-            # Récupérer tous les documents de la collection notifications
-            notifications_ref = db.collection('notifications')
-            docs = notifications_ref.stream()
-
+            # Suppressions en parallèle; pour une purge par ancienneté voir purge_notifications
+            writer = db.bulk_writer()
             count_deleted = 0
-            
-            # Supprimer chaque document
-            for doc in docs:
-                doc.reference.delete()
+
+            for doc in db.collection_group(notifications.ITEMS_COLLECTION).stream():
+                writer.delete(doc.reference)
                 count_deleted += 1
-                self.stdout.write(f"Document supprimé: {doc.id}")
+            for doc in db.collection('notifications').stream():
+                writer.delete(doc.reference)
+                count_deleted += 1
+            for doc in db.collection(notifications.INBOX_COLLECTION).stream():
+                writer.delete(doc.reference)
+
+            writer.close()
 
         except Exception as e:
             self.stdout.write(self.style.ERROR(f'Erreur lors de la suppression: {str(e)}'))
@@ -35,4 +39,4 @@ class Command(BaseCommand):
                 f'Suppression terminée avec succès!\n'
                 f'Documents supprimés: {count_deleted}'
             )
-        )
\ No newline at end of file
+        )
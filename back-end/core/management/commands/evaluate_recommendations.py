@@ -0,0 +1,46 @@
+from django.core.management.base import BaseCommand
+from core.firebase_utils import firebase_config
+from core.recommendation_eval import ENGINES, load_order_history, load_clients, load_catalog, evaluate, format_report
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+class Command(BaseCommand):
+    help = 'Evaluate recommendation engines offline by replaying the order history'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--k', type=int, default=8, help='Nombre de plats recommandés évalués (défaut: 8)')
+        parser.add_argument('--engines', nargs='+', choices=sorted(ENGINES.keys()),
+                            help='Moteurs à comparer (défaut: tous)')
+        parser.add_argument('--max-cases', type=int, default=None, help='Limiter le nombre de commandes rejouées')
+        parser.add_argument('--output', type=str, default=None, help='Écrire le rapport JSON dans ce fichier')
+
+    def handle(self, *args, **options):
+        db = firebase_config.get_db()
+        k = options['k']
+        names = options['engines'] or sorted(ENGINES.keys())
+        engines = {name: ENGINES[name] for name in names}
+
+        try:
+            self.stdout.write("Chargement de l'historique des commandes...")
+            orders = load_order_history(db)
+            clients = load_clients(db, {order['client_id'] for order in orders})
+            plats = load_catalog(db)
+            self.stdout.write(
+                f"{len(orders)} commandes, {len(clients)} clients, {len(plats)} plats au catalogue"
+            )
+
+            rows = evaluate(engines, orders, clients, plats, k=k, max_cases=options['max_cases'])
+        except Exception as e:
+            self.stdout.write(self.style.ERROR(f"Erreur lors de l'évaluation: {str(e)}"))
+            return
+
+        self.stdout.write(format_report(rows))
+
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                json.dump({'k': k, 'results': rows}, f, ensure_ascii=False, indent=2)
+            self.stdout.write(f"Rapport écrit dans {options['output']}")
+
+        self.stdout.write(self.style.SUCCESS('Évaluation terminée avec succès!'))
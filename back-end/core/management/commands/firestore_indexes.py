@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand, CommandError
+from core import query_specs
+import logging
+
+logger = logging.getLogger(__name__)
+
+class Command(BaseCommand):
+    help = 'Generate firestore.indexes.json from the query specs (core.query_specs)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true', help='Only check that the manifest covers every query spec')
+
+    def handle(self, *args, **options):
+        if options['check']:
+            missing = query_specs.missing_indexes()
+            for spec in missing:
+                self.stdout.write(self.style.WARNING(
+                    f"Index manquant: {spec.name} ({spec.collection}: {spec.index_fields()}) - {spec.used_by}"
+                ))
+            if missing:
+                raise CommandError(f"{len(missing)} requête(s) sans index, lancer: python manage.py firestore_indexes")
+            self.stdout.write(self.style.SUCCESS(f"Toutes les requêtes ont leur index ({len(query_specs.SPECS)} formes)"))
+            return
+
+        path = query_specs.write_manifest()
+        manifest = query_specs.manifest()
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Manifeste écrit: {path}\n"
+                f"Index composites: {len(manifest['indexes'])}\n"
+                f"Surcharges de champ: {len(manifest['fieldOverrides'])}\n"
+                f"Déployer avec: firebase deploy --only firestore:indexes"
+            )
+        )
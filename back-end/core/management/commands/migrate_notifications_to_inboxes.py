@@ -0,0 +1,68 @@
+from django.core.management.base import BaseCommand
+from core.firebase_utils import firebase_config
+from core import notifications
+import logging
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 500
+
+class Command(BaseCommand):
+    help = "Move the documents of the flat 'notifications' collection into the per-recipient inboxes"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--delete-legacy', action='store_true', help="Delete the migrated documents from 'notifications'")
+
+    def handle(self, *args, **options):
+        db = firebase_config.get_db()
+        delete_legacy = options['delete_legacy']
+
+        self.stdout.write("Migration des notifications vers les boîtes de réception...")
+
+        migrated, unknown, inboxes = 0, [], set()
+        try:
+            batch = db.batch()
+            pending = 0
+            for doc in db.collection('notifications').stream():
+                data = doc.to_dict()
+                try:
+                    inbox = notifications.inbox_id(data.get('recipient_type', ''), data.get('recipient_id'))
+                except ValueError:
+                    unknown.append(doc.id)
+                    continue
+
+                # Same id, so running the command twice does not duplicate anything
+                batch.set(notifications.items_ref(db, inbox).document(doc.id), dict(data, inbox=inbox))
+                if delete_legacy:
+                    batch.delete(doc.reference)
+                inboxes.add(inbox)
+                pending += 2 if delete_legacy else 1
+                migrated += 1
+                if pending >= BATCH_SIZE - 1:
+                    batch.commit()
+                    batch = db.batch()
+                    pending = 0
+            if pending:
+                batch.commit()
+
+            # Counters are recomputed from the inbox contents rather than incremented
+            for inbox in sorted(inboxes):
+                total, unread = 0, 0
+                for item in notifications.items_ref(db, inbox).select(['read']).stream():
+                    total += 1
+                    if not item.to_dict().get('read', False):
+                        unread += 1
+                notifications.inbox_ref(db, inbox).set({'total': total, 'unread': unread}, merge=True)
+        except Exception as e:
+            self.stdout.write(self.style.ERROR(f'Erreur lors de la migration: {str(e)}'))
+            return
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Migration terminée avec succès!\n'
+                f'Notifications migrées: {migrated}\n'
+                f'Boîtes de réception mises à jour: {len(inboxes)}'
+            )
+        )
+        if unknown:
+            self.stdout.write(self.style.WARNING(f"Destinataire inconnu pour: {', '.join(unknown)}"))
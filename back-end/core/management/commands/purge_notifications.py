@@ -0,0 +1,135 @@
+"""
+Notification retention.
+
+Deletes the inbox notifications that were read more than --read-days ago
+(by creation date) and the unread ones older than --unread-days, plus the
+same from the legacy flat 'notifications' collection. Meant to run as a
+scheduled job, e.g. every night:
+
+    0 3 * * * python manage.py purge_notifications --read-days 30 --unread-days 90
+
+Inbox items are deleted in transactions of
+notifications.ITEMS_PER_TRANSACTION, which decrement the inbox counters
+from the items as they are when deleted: a notification marked read in the
+meantime is not taken off the unread counter twice. Legacy notifications,
+without counters, go through a BulkWriter, which sends them in parallel
+batches and retries throttled writes. Each pass is ordered by (created_at, document path): the
+notifications of one batch share their created_at, so the path breaks the
+tie at page boundaries. The position of each pass (both values) is saved in
+a checkpoint document after every page, so an interrupted run restarted
+with --resume continues where it stopped; a failed run exits with an error
+for the scheduler.
+"""
+from datetime import datetime, timedelta, timezone
+from django.core.management.base import BaseCommand, CommandError
+from core.firebase_utils import firebase_config
+from core import notifications
+from firebase_admin import firestore
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_COLLECTION = 'maintenance'
+CHECKPOINT_DOC = 'notification_retention'
+PAGE_SIZE = 1000
+MAX_WRITE_ATTEMPTS = 5
+
+class Command(BaseCommand):
+    help = 'Delete read notifications older than N days and unread ones older than M days'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--read-days', type=int, default=30, help='Age of the read notifications to delete (default 30)')
+        parser.add_argument('--unread-days', type=int, default=90, help='Age of the unread notifications to delete (default 90)')
+        parser.add_argument('--page-size', type=int, default=PAGE_SIZE, help='Documents read per query page')
+        parser.add_argument('--resume', action='store_true', help='Continue from the checkpoint of an interrupted run')
+        parser.add_argument('--dry-run', action='store_true', help='Count the notifications without deleting them')
+
+    def handle(self, *args, **options):
+        db = firebase_config.get_db()
+        now = datetime.now(timezone.utc)
+        page_size = max(1, options['page_size'])
+        dry_run = options['dry_run']
+        checkpoint_ref = db.collection(CHECKPOINT_COLLECTION).document(CHECKPOINT_DOC)
+
+        checkpoint = {}
+        if options['resume']:
+            doc = checkpoint_ref.get()
+            checkpoint = doc.to_dict().get('cursors', {}) if doc.exists else {}
+            if checkpoint:
+                self.stdout.write(f"Reprise depuis le point de contrôle: {', '.join(sorted(checkpoint))}")
+
+        passes = [
+            ('inbox_read', db.collection_group(notifications.ITEMS_COLLECTION), True, now - timedelta(days=options['read_days'])),
+            ('inbox_unread', db.collection_group(notifications.ITEMS_COLLECTION), False, now - timedelta(days=options['unread_days'])),
+            ('legacy_read', db.collection('notifications'), True, now - timedelta(days=options['read_days'])),
+            ('legacy_unread', db.collection('notifications'), False, now - timedelta(days=options['unread_days'])),
+        ]
+
+        self.stdout.write(
+            f"Rétention des notifications: lues > {options['read_days']} jours, "
+            f"non lues > {options['unread_days']} jours{' (simulation)' if dry_run else ''}..."
+        )
+
+        started = time.time()
+        totals = {}
+        writer = None if dry_run else db.bulk_writer()
+        if writer is not None:
+            writer.on_write_error(lambda error: error.attempts < MAX_WRITE_ATTEMPTS)
+        try:
+            for name, source, read, cutoff in passes:
+                totals[name] = self._run_pass(db, writer, checkpoint_ref, checkpoint, name, source, read, cutoff, page_size, started)
+            if writer is not None:
+                writer.close()
+                checkpoint_ref.delete()
+        except Exception as e:
+            raise CommandError(f'Erreur lors de la purge: {str(e)} (relancer avec --resume)')
+
+        elapsed = time.time() - started
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Purge terminée en {elapsed:.1f}s!\n"
+                + '\n'.join(f"{name}: {count}" for name, count in totals.items())
+                + f"\nTotal {'à supprimer' if dry_run else 'supprimé'}: {sum(totals.values())}"
+            )
+        )
+
+    def _run_pass(self, db, writer, checkpoint_ref, checkpoint, name, source, read, cutoff, page_size, started):
+        query = (source.where('read', '==', read).where('created_at', '<', cutoff)
+                 .order_by('created_at').order_by('__name__'))
+        cursor = self._saved_cursor(db, checkpoint.get(name))
+        count = 0
+        while True:
+            page = query.start_after(cursor) if cursor else query
+            docs = list(page.limit(page_size).stream())
+            if not docs:
+                break
+
+            if writer is not None:
+                items = [doc.reference for doc in docs if doc.reference.parent.parent is not None]
+                for doc in docs:
+                    if doc.reference.parent.parent is None:
+                        writer.delete(doc.reference)
+                for start in range(0, len(items), notifications.ITEMS_PER_TRANSACTION):
+                    notifications.delete_items(db, items[start:start + notifications.ITEMS_PER_TRANSACTION])
+                writer.flush()
+
+            count += len(docs)
+            cursor = docs[-1]
+            checkpoint[name] = {'created_at': cursor.get('created_at'), 'path': cursor.reference.path}
+            if writer is not None:
+                checkpoint_ref.set({'cursors': checkpoint, 'updated_at': firestore.SERVER_TIMESTAMP})
+            rate = count / max(time.time() - started, 0.001)
+            self.stdout.write(f"  {name}: {count} notifications ({rate:.0f}/s)")
+            if len(docs) < page_size:
+                break
+        return count
+
+    @staticmethod
+    def _saved_cursor(db, saved):
+        """start_after() values of a checkpointed position; a bare created_at from an older checkpoint still works"""
+        if not saved:
+            return None
+        if isinstance(saved, dict) and saved.get('path'):
+            return {'created_at': saved['created_at'], '__name__': db.document(saved['path'])}
+        return {'created_at': saved}
@@ -0,0 +1,53 @@
+from django.core.management.base import BaseCommand
+from core.firebase_utils import firebase_config
+from core.popularity import popularity_tracker
+from datetime import datetime
+import logging
+
+logger = logging.getLogger(__name__)
+
+class Command(BaseCommand):
+    help = 'Rebuild the time-decayed dish popularity counters from the order history'
+
+    def handle(self, *args, **options):
+        db = firebase_config.get_db()
+
+        self.stdout.write("Reconstruction des compteurs de popularité à partir des commandes...")
+
+        try:
+            order_dates = {}
+            for doc in db.collection('commandes').stream():
+                data = doc.to_dict()
+                created = data.get('dateCreation')
+                if not created or data.get('etat') in ('annule', 'annulee', 'cancelled'):
+                    continue
+                # Firestore timestamps are datetimes, seed data may store ISO strings
+                if isinstance(created, str):
+                    try:
+                        created = datetime.fromisoformat(created.replace('Z', '+00:00'))
+                    except ValueError:
+                        continue
+                order_dates[doc.id] = created.timestamp()
+
+            events = []
+            for collection in ('commandes_plat', 'commande_plat'):
+                for doc in db.collection(collection).stream():
+                    line = doc.to_dict()
+                    timestamp = order_dates.get(line.get('idCmd'))
+                    if timestamp is None:
+                        continue
+                    quantity = line.get('quantité', line.get('quantite', 1))
+                    events.append((line.get('idP'), int(quantity or 1), timestamp))
+
+            count = popularity_tracker.rebuild(events)
+        except Exception as e:
+            self.stdout.write(self.style.ERROR(f'Erreur lors de la reconstruction: {str(e)}'))
+            return
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Reconstruction terminée avec succès!\n'
+                f'Lignes de commande traitées: {len(events)}\n'
+                f'Plats classés: {count}'
+            )
+        )
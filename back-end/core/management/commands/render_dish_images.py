@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand, CommandError
+from core.catalog import catalog
+from core import dish_images
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+class Command(BaseCommand):
+    help = 'Render the resized variants of every dish image (core.dish_images)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--plat', action='append', dest='plats', help='Only this dish (repeatable)')
+        parser.add_argument('--force', action='store_true', help='Fetch the sources again, to pick up images replaced at the same URL')
+
+    def handle(self, *args, **options):
+        catalog.invalidate()
+        plats = catalog.snapshot().plats
+        plat_ids = options['plats'] or sorted(plat_id for plat_id, plat in plats.items() if plat.get('image_url'))
+        self.stdout.write(f"Rendu des images de {len(plat_ids)} plat(s)...")
+
+        started = time.time()
+        rendered, missing, failed = 0, [], []
+        for plat_id in plat_ids:
+            try:
+                if dish_images.render_dish(plat_id, force=options['force']) is None:
+                    missing.append(plat_id)
+                else:
+                    rendered += 1
+            except Exception as e:
+                failed.append(plat_id)
+                logger.error(f"Error rendering the image of plat {plat_id}: {str(e)}")
+
+        for plat_id in missing:
+            self.stdout.write(self.style.WARNING(f"Image introuvable pour le plat {plat_id}"))
+        if failed:
+            raise CommandError(f"Rendu échoué pour {len(failed)} plat(s): {', '.join(failed)}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Images rendues pour {rendered} plat(s) en {time.time() - started:.1f}s"
+            + (f", {len(missing)} sans image" if missing else '')
+        ))
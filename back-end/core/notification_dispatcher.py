@@ -0,0 +1,233 @@
+"""
+Notification fan-out.
+
+A view that changes state and notifies people opens a Dispatch on the batch
+that carries its state change, adds one event per recipient and commits
+once: the state change, the inbox items and the inbox counters reach
+Firestore in a single round trip.
+
+    dispatch = notification_dispatcher.begin(db, batch)
+    dispatch.notify(client(client_id), 'order_ready', order_id=order_id)
+    dispatch.notify(role('serveur'), 'order_ready_server', order_id=order_id, table_id=table_id)
+    dispatch.commit()
+
+An unbounded number of notifications (one per ingredient alert...) stays
+out of the state batch, which holds 500 writes at most: notify_each()
+commits them in batches of their own once the state change is written.
+
+Recipients are a client, a role broadcast (every chef / server / manager)
+or one employee. Titles, messages, types and priorities of the events live
+in EVENTS; callers only pass the context. Once the batch is committed the
+delivered notifications are handed to the registered push hooks (real-time
+push, websocket fan-out...), whose failures never fail the request.
+"""
+from collections import namedtuple
+from typing import Callable, Dict, List, Optional
+from core import notifications
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+Recipient = namedtuple('Recipient', ['recipient_type', 'recipient_id'])
+
+
+def client(client_id: str) -> Recipient:
+    return Recipient('client', client_id)
+
+
+def role(name: str) -> Recipient:
+    """Every employee of a role: 'chef', 'serveur' or 'manager' (aliases accepted)"""
+    return Recipient(name, None)
+
+
+def employee(employee_id: str) -> Recipient:
+    return Recipient('employe', employee_id)
+
+
+# event -> title, message (formatted with the context), type, priority
+EVENTS = {
+    'order_preparing': {
+        'title': 'Commande en préparation',
+        'message': 'Votre commande est maintenant en cours de préparation. Nos chefs s\'en occupent !',
+        'type': 'order_preparation',
+        'priority': 'normal',
+    },
+    'order_ready': {
+        'title': 'Commande prête !',
+        'message': 'Votre commande est prête ! Un serveur va bientôt vous l\'apporter.',
+        'type': 'order_ready',
+        'priority': 'high',
+    },
+    'order_ready_server': {
+        'title': 'Commande prête',
+        'message': 'La commande pour la table {table_id} est prête à être servie.',
+        'type': 'order_ready',
+        'priority': 'high',
+    },
+    'order_cancelled_by_kitchen': {
+        'title': 'Commande annulée',
+        'message': 'Votre commande #{order_id} a été annulée par la cuisine. Motif: {motif}. '
+                   'Veuillez demander de l\'assistance pour plus d\'informations.',
+        'type': 'order_cancelled',
+        'priority': 'high',
+    },
+    'order_cancelled_by_client': {
+        'title': 'Commande annulée',
+        'message': 'La commande #{order_id} a été annulée par le client',
+        'type': 'order_cancellation',
+        'priority': 'normal',
+    },
+    'order_cancelled_notice': {
+        'title': 'Commande annulée',
+        'message': 'La commande #{order_id} pour la table {table_id} a été annulée par le client.',
+        'type': 'order_cancelled',
+        'priority': 'normal',
+    },
+    'cancellation_requested_kitchen': {
+        'title': 'Demande d\'annulation',
+        'message': 'Demande d\'annulation pour la commande #{order_id} (statut: {order_status})',
+        'type': 'cancellation_request',
+        'priority': 'normal',
+    },
+    'cancellation_requested_by_client': {
+        'title': 'Demande d\'annulation en attente',
+        'message': 'Le client {client_name} demande l\'annulation de la commande #{order_id}',
+        'type': 'cancellation_request',
+        'priority': 'high',
+    },
+    'cancellation_requested_by_server': {
+        'title': 'Nouvelle demande d\'annulation',
+        'message': 'Demande d\'annulation pour la commande {order_id}',
+        'type': 'cancellation_request',
+        'priority': 'high',
+    },
+    'reservation_confirmed': {
+        'title': 'Réservation confirmée',
+        'message': 'Votre réservation pour {date_time} a été confirmée.',
+        'type': 'reservation_confirmation',
+        'priority': 'normal',
+    },
+    'reservation_cancelled': {
+        'title': 'Réservation annulée',
+        'message': 'Votre réservation pour {date_time} a été annulée.',
+        'type': 'reservation_cancellation',
+        'priority': 'normal',
+    },
+    # Title and message are built by the caller
+    'ingredient_alert': {
+        'type': 'ingredient_alert',
+        'priority': 'normal',
+    },
+}
+
+# Context keys stored on the notification document itself
+STORED_FIELDS = ('order_id', 'related_id', 'client_id', 'cancellation_request_id')
+# A notification is 2 writes (inbox item + inbox counter), a batch at most 500
+NOTIFICATIONS_PER_BATCH = 200
+
+_push_hooks: List[Callable[[List[Dict]], None]] = []
+_hooks_lock = threading.Lock()
+
+
+def register_push_hook(hook: Callable[[List[Dict]], None]) -> None:
+    """hook(notifications) is called after each commit with the delivered notifications"""
+    with _hooks_lock:
+        if hook not in _push_hooks:
+            _push_hooks.append(hook)
+
+
+def unregister_push_hook(hook: Callable[[List[Dict]], None]) -> None:
+    with _hooks_lock:
+        if hook in _push_hooks:
+            _push_hooks.remove(hook)
+
+
+def build(recipient: Recipient, event: str, context: Dict) -> Dict:
+    """Notification document of an event for one recipient"""
+    template = EVENTS[event]
+    data = {
+        'title': context.get('title', template.get('title', '')),
+        'message': context.get('message') or template.get('message', '').format(**context),
+        'type': template['type'],
+        'priority': context.get('priority', template['priority']),
+        'event': event,
+        'recipient_type': recipient.recipient_type,
+        'read': False,
+    }
+    if recipient.recipient_id:
+        data['recipient_id'] = recipient.recipient_id
+    for field in STORED_FIELDS:
+        if context.get(field) is not None:
+            data[field] = context[field]
+    return data
+
+
+class Dispatch:
+    """Notifications of one state change, written in the same batch"""
+
+    def __init__(self, db, batch=None):
+        self.db = db
+        self.batch = batch if batch is not None else db.batch()
+        self.delivered: List[Dict] = []
+
+    def notify(self, recipient: Optional[Recipient], event: str, **context) -> Optional[str]:
+        """Add the event for one recipient to the batch; a recipient without id is skipped"""
+        if recipient is None or (recipient.recipient_type in ('client', 'employe') and not recipient.recipient_id):
+            return None
+        data = build(recipient, event, context)
+        notification_id = notifications.add_notification(self.batch, self.db, data)
+        self.delivered.append(dict(data, id=notification_id,
+                                   inbox=notifications.inbox_id(recipient.recipient_type, recipient.recipient_id)))
+        return notification_id
+
+    def notify_all(self, recipients: List[Recipient], event: str, **context) -> List[str]:
+        ids = [self.notify(recipient, event, **context) for recipient in recipients]
+        return [notification_id for notification_id in ids if notification_id]
+
+    def commit(self):
+        """Commit the batch (state change + notifications), then push"""
+        result = self.batch.commit()
+        self.push()
+        return result
+
+    def push(self) -> None:
+        """Hand the delivered notifications to the push hooks (call after an external commit)"""
+        if not self.delivered:
+            return
+        with _hooks_lock:
+            hooks = list(_push_hooks)
+        for hook in hooks:
+            try:
+                hook(list(self.delivered))
+            except Exception as e:
+                logger.error(f"Notification push hook failed: {str(e)}", exc_info=True)
+
+
+def begin(db, batch=None) -> Dispatch:
+    return Dispatch(db, batch)
+
+
+def notify(db, recipient: Recipient, event: str, **context) -> Optional[str]:
+    """Single notification without any other write: one commit"""
+    dispatch = begin(db)
+    notification_id = dispatch.notify(recipient, event, **context)
+    if notification_id:
+        dispatch.commit()
+    return notification_id
+
+
+def notify_each(db, recipient: Recipient, event: str, contexts: List[Dict]) -> List[str]:
+    """
+    One notification per context, without any other write, for an unbounded
+    number of them: committed NOTIFICATIONS_PER_BATCH at a time
+    """
+    ids = []
+    for start in range(0, len(contexts), NOTIFICATIONS_PER_BATCH):
+        dispatch = begin(db)
+        chunk_ids = [dispatch.notify(recipient, event, **context)
+                     for context in contexts[start:start + NOTIFICATIONS_PER_BATCH]]
+        if any(chunk_ids):
+            dispatch.commit()
+        ids.extend(notification_id for notification_id in chunk_ids if notification_id)
+    return ids
@@ -0,0 +1,284 @@
+"""
+Real-time notification delivery for the client apps.
+
+One Firestore snapshot listener per process watches every inbox item
+created since the process started (collection group query) and appends the
+new notifications to a small per-inbox buffer, keyed by inbox id
+('client_<uid>', see core.notifications). Notifications dispatched by this
+process are also added directly through the dispatcher push hook, so they
+are delivered before the listener fires.
+
+Clients follow their inbox with a cursor: the id of the last notification
+they received. wait() returns the notifications after it, blocking up to a
+timeout until one arrives (long-poll / SSE). Each inbox has its own
+condition, so a publish only wakes the clients of the inboxes it touches,
+and a client without a cursor follows from the latest buffered
+notification without any read. A cursor that is not in the buffer (other
+process, evicted, restart) is resolved with one indexed query on the
+inbox, which then seeds the buffer with it: later wake-ups stay in memory.
+When the listener cannot be started, waiting polls the inbox every
+POLL_INTERVAL seconds instead.
+
+A waiting request holds its worker thread for up to MAX_WAIT seconds
+(long-poll) or STREAM_DURATION seconds (SSE), so the sync gunicorn worker
+would serve one client at a time. Run with threaded workers, sized for the
+number of connected clients, e.g.
+
+    gunicorn restaurant_system.wsgi -k gthread --workers 2 --threads 64
+"""
+from collections import OrderedDict, deque
+from datetime import datetime, timezone
+from typing import Dict, Iterator, List, Optional, Tuple
+from django.core.serializers.json import DjangoJSONEncoder
+from firebase_admin import firestore
+from rest_framework.renderers import BaseRenderer
+from core.firebase_utils import firebase_config
+from core import notification_dispatcher, notifications
+import json
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+BUFFER_SIZE = 50
+MAX_INBOXES = 5000
+POLL_INTERVAL = 5
+MAX_WAIT = 55
+# An SSE connection is closed after STREAM_DURATION; the client reconnects with Last-Event-ID
+STREAM_DURATION = 300
+HEARTBEAT = 20
+# Fields sent to the client apps, as in the notification listings
+CLIENT_FIELDS = ('id', 'title', 'message', 'created_at', 'read', 'type')
+
+
+class NotificationStream:
+    """Per-process fan-out of new inbox notifications"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # inbox -> [condition on _lock, number of waiting clients]
+        self._waiters: Dict[str, list] = {}
+        self._buffers: 'OrderedDict[str, deque]' = OrderedDict()
+        self._seen: Dict[str, set] = {}
+        self._started = False
+        self._listening = False
+        self._watch = None
+
+    # ======================
+    # Feeding
+    # ======================
+    @staticmethod
+    def _serializable(notification: Dict) -> Dict:
+        item = dict(notification)
+        created_at = item.get('created_at')
+        if created_at is None or created_at is firestore.SERVER_TIMESTAMP:
+            # Written by this process, not yet stamped by the server
+            item['created_at'] = datetime.now(timezone.utc)
+        return item
+
+    def publish(self, items: List[Dict]) -> None:
+        """Add new notifications (each with 'id' and 'inbox') and wake the waiting clients"""
+        with self._lock:
+            touched = set()
+            for item in items:
+                inbox = item.get('inbox')
+                if not inbox:
+                    continue
+                seen = self._seen.setdefault(inbox, set())
+                if item['id'] in seen:
+                    continue
+                buffer = self._buffer(inbox)
+                if len(buffer) == buffer.maxlen:
+                    seen.discard(buffer[0]['id'])
+                buffer.append(self._serializable(item))
+                seen.add(item['id'])
+                touched.add(inbox)
+            for inbox in touched:
+                waiters = self._waiters.get(inbox)
+                if waiters:
+                    waiters[0].notify_all()
+
+    def _buffer(self, inbox: str) -> deque:
+        """Buffer of an inbox, created (evicting the least recent one) if missing; call with the lock held"""
+        buffer = self._buffers.get(inbox)
+        if buffer is None:
+            buffer = self._buffers[inbox] = deque(maxlen=BUFFER_SIZE)
+            self._seen.setdefault(inbox, set())
+            if len(self._buffers) > MAX_INBOXES:
+                evicted, _ = self._buffers.popitem(last=False)
+                self._seen.pop(evicted, None)
+        self._buffers.move_to_end(inbox)
+        return buffer
+
+    def _seed(self, inbox: str, item: Dict) -> None:
+        """Put a cursor notification read from Firestore before the newer buffered ones; call with the lock held"""
+        buffer = self._buffer(inbox)
+        seen = self._seen[inbox]
+        if item['id'] not in seen and len(buffer) < buffer.maxlen:
+            buffer.appendleft(self._serializable(item))
+            seen.add(item['id'])
+
+    def _on_snapshot(self, snapshots, changes, read_time) -> None:
+        added = []
+        for change in changes:
+            if change.type.name != 'ADDED':
+                continue
+            item = change.document.to_dict()
+            item['id'] = change.document.id
+            item.setdefault('inbox', change.document.reference.parent.parent.id)
+            added.append(item)
+        if added:
+            self.publish(added)
+
+    def _ensure_started(self) -> None:
+        if self._started:
+            return
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+        notification_dispatcher.register_push_hook(self.publish)
+        try:
+            db = firebase_config.get_db()
+            since = datetime.now(timezone.utc)
+            self._watch = db.collection_group(notifications.ITEMS_COLLECTION)\
+                .where('created_at', '>', since)\
+                .on_snapshot(self._on_snapshot)
+            self._listening = True
+        except Exception as e:
+            logger.warning(f"Notification listener unavailable, polling instead: {str(e)}")
+
+    # ======================
+    # Reading
+    # ======================
+    def _from_buffer(self, inbox: str, cursor: Optional[str]) -> Tuple[bool, List[Dict]]:
+        """(cursor found, notifications after it); call with the lock held"""
+        items = list(self._buffers.get(inbox, ()))
+        if cursor is None:
+            return True, items
+        for index, item in enumerate(items):
+            if item['id'] == cursor:
+                return True, items[index + 1:]
+        return False, []
+
+    def _from_firestore(self, inbox: str, cursor: Optional[str]) -> Tuple[Optional[Dict], List[Dict]]:
+        """(cursor notification, None when unknown; notifications created after it, oldest first)"""
+        db = firebase_config.get_db()
+        query = notifications.items_ref(db, inbox).order_by('created_at')
+        cursor_item = None
+        if cursor is not None:
+            cursor_doc = notifications.items_ref(db, inbox).document(cursor).get()
+            if not cursor_doc.exists:
+                return None, []
+            cursor_item = dict(cursor_doc.to_dict(), id=cursor_doc.id, inbox=inbox)
+            query = query.start_after(cursor_doc)
+        items = []
+        for doc in query.limit(BUFFER_SIZE).stream():
+            item = doc.to_dict()
+            item['id'] = doc.id
+            items.append(item)
+        return cursor_item, items
+
+    def latest_id(self, inbox: str) -> Optional[str]:
+        """Id of the most recent notification of an inbox, to start following it"""
+        db = firebase_config.get_db()
+        latest, _ = notifications.list_notifications(db, inbox, page_size=1)
+        return latest[0]['id'] if latest else None
+
+    def wait(self, inbox: str, cursor: Optional[str], timeout: float = 25) -> Tuple[List[Dict], Optional[str]]:
+        """
+        Notifications of inbox after cursor (None: after the current latest one),
+        oldest first, and the cursor to pass next time. Blocks up to timeout
+        seconds when there are none yet; returns no notifications on timeout.
+        """
+        self._ensure_started()
+        deadline = time.time() + max(0.0, min(timeout, MAX_WAIT))
+        if not self._listening:
+            return self._poll(inbox, cursor, deadline)
+
+        with self._lock:
+            if cursor is None:
+                # Latest buffered notification; with an empty buffer every notification buffered from now on is new
+                buffer = self._buffer(inbox)
+                cursor = buffer[-1]['id'] if buffer else None
+            found, items = self._from_buffer(inbox, cursor)
+            buffer = self._buffers.get(inbox)
+            last_buffered = buffer[-1]['id'] if buffer else None
+
+        if not found:
+            cursor_item, items = self._from_firestore(inbox, cursor)
+            if items:
+                return items, items[-1]['id']
+            with self._lock:
+                if last_buffered:
+                    # Nothing after the cursor: everything buffered before the query is older, follow the buffer
+                    cursor = last_buffered
+                elif cursor_item:
+                    self._seed(inbox, cursor_item)
+                else:
+                    # Unknown notification: follow from now on
+                    self._buffer(inbox)
+                    cursor = None
+
+        with self._lock:
+            waiters = self._waiters.setdefault(inbox, [threading.Condition(self._lock), 0])
+            waiters[1] += 1
+            try:
+                while True:
+                    found, items = self._from_buffer(inbox, cursor)
+                    remaining = deadline - time.time()
+                    if items or not found or remaining <= 0:
+                        break
+                    # Checked and waited under the same lock: no notification is missed
+                    waiters[0].wait(remaining)
+            finally:
+                waiters[1] -= 1
+                if not waiters[1]:
+                    self._waiters.pop(inbox, None)
+
+        if not found:
+            # The cursor left the buffer while waiting (more than BUFFER_SIZE new ones, or evicted)
+            _, items = self._from_firestore(inbox, cursor)
+        return items, items[-1]['id'] if items else cursor
+
+    def _poll(self, inbox: str, cursor: Optional[str], deadline: float) -> Tuple[List[Dict], Optional[str]]:
+        """wait() without the listener: the inbox is queried every POLL_INTERVAL seconds"""
+        if cursor is None:
+            cursor = self.latest_id(inbox)
+        while True:
+            _, items = self._from_firestore(inbox, cursor)
+            remaining = deadline - time.time()
+            if items or remaining <= 0:
+                return items, items[-1]['id'] if items else cursor
+            time.sleep(min(POLL_INTERVAL, remaining))
+
+
+class EventStreamRenderer(BaseRenderer):
+    """Lets DRF views accept 'Accept: text/event-stream' (sent by EventSource)"""
+    media_type = 'text/event-stream'
+    format = 'sse'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return data
+
+
+def client_payload(item: Dict) -> Dict:
+    return {field: item.get(field, '') for field in CLIENT_FIELDS}
+
+
+def sse_events(inbox: str, cursor: Optional[str], duration: float = STREAM_DURATION) -> Iterator[str]:
+    """Server-sent events of an inbox: one 'notification' event per new notification, comments as heartbeat"""
+    end = time.time() + duration
+    yield 'retry: 3000\n\n'
+    while time.time() < end:
+        items, cursor = notification_stream.wait(inbox, cursor, timeout=min(HEARTBEAT, end - time.time()))
+        if not items:
+            yield ': keep-alive\n\n'
+        for item in items:
+            data = json.dumps(client_payload(item), cls=DjangoJSONEncoder)
+            yield f"id: {item['id']}\nevent: notification\ndata: {data}\n\n"
+
+
+# Singleton instance
+notification_stream = NotificationStream()
@@ -0,0 +1,316 @@
+"""
+Per-recipient notification inboxes.
+
+Notifications are stored under the inbox of their recipient instead of one
+flat 'notifications' collection:
+
+    notification_inboxes/{inbox}                -> {'unread': n, 'total': n}
+    notification_inboxes/{inbox}/items/{id}     -> the notification
+
+Clients have one inbox each ('client_<uid>'); staff notifications go to the
+inbox of their role ('role_chef', 'role_serveur', 'role_manager'), shared by
+every employee of that role as before, or to the personal inbox of one
+employee ('employe_<uid>'). Listing an inbox is an indexed query
+on created_at, one page at a time, and the unread badge is a single read of
+the inbox document, whose counters are kept with Increment in the same
+batch / transaction as the items.
+"""
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+from firebase_admin import firestore
+from core.orders_utils import IN_QUERY_LIMIT
+import logging
+import uuid
+
+logger = logging.getLogger(__name__)
+
+INBOX_COLLECTION = 'notification_inboxes'
+ITEMS_COLLECTION = 'items'
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+# Items per transaction of the bulk operations: one write each, plus one counter write per inbox
+ITEMS_PER_TRANSACTION = 200
+
+# recipient_type values found in the data -> inbox role
+ROLE_ALIASES = {
+    'chef': 'chef',
+    'cuisinier': 'chef',
+    'cuisine': 'chef',
+    'kitchen': 'chef',
+    'serveur': 'serveur',
+    'server': 'serveur',
+    'manager': 'manager',
+}
+
+
+def inbox_id(recipient_type: str, recipient_id: Optional[str] = None) -> str:
+    """Inbox of a recipient: 'client_<id>', 'employe_<id>', or 'role_<role>' for staff broadcasts"""
+    role = ROLE_ALIASES.get(recipient_type)
+    if role:
+        return f"role_{role}"
+    if recipient_type in ('client', 'employe') and recipient_id:
+        return f"{recipient_type}_{recipient_id}"
+    raise ValueError(f"Unknown notification recipient: {recipient_type}/{recipient_id}")
+
+
+def inbox_ref(db, inbox: str):
+    return db.collection(INBOX_COLLECTION).document(inbox)
+
+
+def items_ref(db, inbox: str):
+    return inbox_ref(db, inbox).collection(ITEMS_COLLECTION)
+
+
+# ======================
+# Writes
+# ======================
+def add_notification(batch, db, data: Dict, notification_id: Optional[str] = None) -> str:
+    """
+    Add a notification to its recipient's inbox, in the caller's batch or
+    transaction. data carries recipient_type / recipient_id like the old
+    documents; read and created_at default to unread / server time.
+    """
+    inbox = inbox_id(data.get('recipient_type', ''), data.get('recipient_id'))
+    notification_id = notification_id or uuid.uuid4().hex
+    item = dict(data, inbox=inbox)
+    item.setdefault('read', False)
+    item.setdefault('created_at', firestore.SERVER_TIMESTAMP)
+
+    batch.set(items_ref(db, inbox).document(notification_id), item)
+    counters = {'total': firestore.Increment(1), 'updated_at': firestore.SERVER_TIMESTAMP}
+    if not item['read']:
+        counters['unread'] = firestore.Increment(1)
+    batch.set(inbox_ref(db, inbox), counters, merge=True)
+    return notification_id
+
+
+def send(db, data: Dict) -> str:
+    """Add a single notification outside of any batch"""
+    batch = db.batch()
+    notification_id = add_notification(batch, db, data)
+    batch.commit()
+    return notification_id
+
+
+# ======================
+# Reads
+# ======================
+def list_notifications(db, inbox: str, page_size: int = DEFAULT_PAGE_SIZE, cursor: Optional[str] = None,
+                       unread_only: bool = False) -> Tuple[List[Dict], Optional[str]]:
+    """
+    One page of an inbox, most recent first.
+    cursor is the id of the last notification of the previous page.
+    Returns (notifications, next_cursor); next_cursor is None on the last page.
+    """
+    page_size = max(1, min(int(page_size), MAX_PAGE_SIZE))
+    query = items_ref(db, inbox)
+    if unread_only:
+        query = query.where('read', '==', False)
+    query = query.order_by('created_at', direction=firestore.Query.DESCENDING)
+
+    if cursor:
+        cursor_doc = items_ref(db, inbox).document(cursor).get()
+        if cursor_doc.exists:
+            query = query.start_after(cursor_doc)
+
+    docs = list(query.limit(page_size + 1).stream())
+    notifications = []
+    for doc in docs[:page_size]:
+        notification = doc.to_dict()
+        notification['id'] = doc.id
+        notifications.append(notification)
+    next_cursor = docs[page_size - 1].id if len(docs) > page_size else None
+    return notifications, next_cursor
+
+
+def query_inboxes(db, inboxes: List[str], page_size: int = DEFAULT_PAGE_SIZE, cursor: Optional[str] = None,
+                  unread_only: bool = False, since: Optional[datetime] = None) -> Tuple[List[Dict], Optional[str]]:
+    """
+    One page of several inboxes merged (e.g. a role inbox and an employee's
+    personal inbox), most recent first: one collection group query with
+    inbox 'in' [...], optional read / created_at filters, ordered and limited
+    server side (see firestore.indexes.json).
+    cursor is '<inbox>/<id>' of the last notification of the previous page.
+    """
+    page_size = max(1, min(int(page_size), MAX_PAGE_SIZE))
+    query = db.collection_group(ITEMS_COLLECTION).where('inbox', 'in', list(inboxes)[:IN_QUERY_LIMIT])
+    if unread_only:
+        query = query.where('read', '==', False)
+    if since is not None:
+        query = query.where('created_at', '>', since)
+    query = query.order_by('created_at', direction=firestore.Query.DESCENDING)
+
+    if cursor and '/' in cursor:
+        cursor_inbox, cursor_id = cursor.split('/', 1)
+        cursor_doc = items_ref(db, cursor_inbox).document(cursor_id).get()
+        if cursor_doc.exists:
+            query = query.start_after(cursor_doc)
+
+    docs = list(query.limit(page_size + 1).stream())
+    notifications = []
+    for doc in docs[:page_size]:
+        notification = doc.to_dict()
+        notification['id'] = doc.id
+        notifications.append(notification)
+    next_cursor = None
+    if len(docs) > page_size:
+        last = docs[page_size - 1]
+        next_cursor = f"{last.reference.parent.parent.id}/{last.id}"
+    return notifications, next_cursor
+
+
+def unread_count(db, inbox: str) -> int:
+    """Unread badge of an inbox: one document read"""
+    doc = inbox_ref(db, inbox).get()
+    if not doc.exists:
+        return 0
+    return max(0, int(doc.to_dict().get('unread', 0) or 0))
+
+
+def get_notification(db, inbox: str, notification_id: str) -> Optional[Dict]:
+    doc = items_ref(db, inbox).document(notification_id).get()
+    if not doc.exists:
+        return None
+    notification = doc.to_dict()
+    notification['id'] = doc.id
+    return notification
+
+
+# ======================
+# Read state
+# ======================
+def mark_read(db, inbox: str, notification_id: str) -> Optional[Dict]:
+    """
+    Mark one notification as read and decrement the unread counter if it was
+    unread. Returns the notification, None when it does not exist.
+    """
+    item_ref = items_ref(db, inbox).document(notification_id)
+
+    @firestore.transactional
+    def apply(transaction):
+        doc = item_ref.get(transaction=transaction)
+        if not doc.exists:
+            return None
+        notification = doc.to_dict()
+        if not notification.get('read', False):
+            transaction.update(item_ref, {'read': True, 'read_at': datetime.now().isoformat()})
+            transaction.set(inbox_ref(db, inbox), {'unread': firestore.Increment(-1)}, merge=True)
+            notification['read'] = True
+        notification['id'] = doc.id
+        return notification
+
+    return apply(db.transaction())
+
+
+def mark_items_read(db, inbox: str, item_refs: List) -> int:
+    """
+    Mark items of an inbox as read in one transaction (ITEMS_PER_TRANSACTION
+    at most). The unread counter drops by the items still unread when the
+    transaction reads them, so a concurrent mark_read is never counted twice.
+    """
+    read_at = datetime.now().isoformat()
+
+    @firestore.transactional
+    def apply(transaction):
+        unread = [
+            doc for doc in db.get_all(item_refs, transaction=transaction)
+            if doc.exists and not doc.to_dict().get('read', False)
+        ]
+        for doc in unread:
+            transaction.update(doc.reference, {'read': True, 'read_at': read_at})
+        if unread:
+            transaction.set(inbox_ref(db, inbox), {'unread': firestore.Increment(-len(unread))}, merge=True)
+        return len(unread)
+
+    return apply(db.transaction())
+
+
+def mark_all_read(db, inbox: str, page_size: int = 1000) -> int:
+    """Mark every unread notification of an inbox as read, returns how many were updated"""
+    query = items_ref(db, inbox).where('read', '==', False).order_by('__name__')
+    updated = failed = 0
+    last = None
+    while True:
+        page = query.start_after(last) if last is not None else query
+        docs = list(page.limit(page_size).stream())
+        if not docs:
+            break
+        for start in range(0, len(docs), ITEMS_PER_TRANSACTION):
+            chunk = [doc.reference for doc in docs[start:start + ITEMS_PER_TRANSACTION]]
+            try:
+                updated += mark_items_read(db, inbox, chunk)
+            except Exception as e:
+                failed += len(chunk)
+                logger.error(f"mark_all_read {inbox}: chunk failed: {str(e)}")
+        last = docs[-1]
+        if len(docs) < page_size:
+            break
+    if failed:
+        logger.warning(f"mark_all_read {inbox}: {failed} notifications not updated")
+    return updated
+
+
+def delete_notification(db, inbox: str, notification_id: str) -> bool:
+    """Delete a notification, keeping the counters in step. False when it does not exist"""
+    item_ref = items_ref(db, inbox).document(notification_id)
+
+    @firestore.transactional
+    def apply(transaction):
+        doc = item_ref.get(transaction=transaction)
+        if not doc.exists:
+            return False
+        counters = {'total': firestore.Increment(-1)}
+        if not doc.to_dict().get('read', False):
+            counters['unread'] = firestore.Increment(-1)
+        transaction.delete(item_ref)
+        transaction.set(inbox_ref(db, inbox), counters, merge=True)
+        return True
+
+    return apply(db.transaction())
+
+
+def delete_items(db, item_refs: List) -> int:
+    """
+    Delete inbox items, of any inboxes, in one transaction
+    (ITEMS_PER_TRANSACTION at most). The counters of each inbox drop by the
+    items that still exist, and the unread one by those still unread, as the
+    transaction reads them. Returns how many were deleted.
+    """
+    @firestore.transactional
+    def apply(transaction):
+        decrements = defaultdict(lambda: {'total': 0, 'unread': 0})
+        docs = [doc for doc in db.get_all(item_refs, transaction=transaction) if doc.exists]
+        for doc in docs:
+            removed = decrements[doc.reference.parent.parent.id]
+            removed['total'] += 1
+            if not doc.to_dict().get('read', False):
+                removed['unread'] += 1
+            transaction.delete(doc.reference)
+        for inbox, removed in decrements.items():
+            counters = {'total': firestore.Increment(-removed['total'])}
+            if removed['unread']:
+                counters['unread'] = firestore.Increment(-removed['unread'])
+            transaction.set(inbox_ref(db, inbox), counters, merge=True)
+        return len(docs)
+
+    return apply(db.transaction())
+
+
+# ======================
+# Request helpers
+# ======================
+def page_params(params) -> Tuple[int, Optional[str], bool]:
+    """(page_size, cursor, unread_only) from query params; raises ValueError on a bad page_size"""
+    page_size = int(params.get('page_size', DEFAULT_PAGE_SIZE))
+    unread_only = str(params.get('unread', '')).lower() in ('1', 'true', 'yes')
+    return page_size, params.get('cursor') or None, unread_only
+
+
+def since_param(params) -> Optional[datetime]:
+    """'since' query param (ISO 8601) as an aware datetime; raises ValueError when malformed"""
+    value = params.get('since')
+    if not value:
+        return None
+    since = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    return since if since.tzinfo else since.replace(tzinfo=timezone.utc)
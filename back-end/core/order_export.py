@@ -0,0 +1,81 @@
+"""
+Streaming export of orders and their line items.
+
+Orders are read one cursor page at a time and the line items of a page are
+joined with batched 'in' queries, so memory stays bounded by one page
+whatever the size of the export. Rows are produced by generators meant to
+feed a StreamingHttpResponse.
+"""
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional
+from core.catalog import catalog
+from core.orders_utils import iter_order_lines, iter_orders_in_range
+import csv
+import json
+
+CSV_COLUMNS = [
+    'commande_id', 'date_creation', 'etat', 'montant', 'client_id', 'table_id',
+    'plat_id', 'plat_nom', 'quantite', 'prix_unitaire'
+]
+
+
+class _Echo:
+    """File-like object whose write returns the value, for csv.writer"""
+
+    def write(self, value):
+        return value
+
+
+def _serialize(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def iter_orders_with_lines(db, start: Optional[datetime] = None, end: Optional[datetime] = None,
+                           page_size: int = 500) -> Iterator[Dict]:
+    """Orders in [start, end) with an 'items' list, one page of Firestore reads at a time"""
+    plats = catalog.snapshot().plats
+    for page in iter_orders_in_range(db, start, end, page_size=page_size):
+        lines: Dict[str, List[Dict]] = defaultdict(list)
+        for line_doc in iter_order_lines(db, [doc.id for doc in page]):
+            line = line_doc.to_dict()
+            plat = plats.get(line.get('idP'), {})
+            lines[line.get('idCmd')].append({
+                'plat_id': line.get('idP'),
+                'nom': plat.get('nom', ''),
+                'quantite': line.get('quantité', line.get('quantite', 1)),
+                # Price stored on the line at order time, current catalog price for older lines
+                'prix_unitaire': line.get('prix_unitaire', plat.get('prix', 0))
+            })
+
+        for doc in page:
+            order = doc.to_dict()
+            yield {
+                'id': doc.id,
+                'dateCreation': _serialize(order.get('dateCreation')),
+                'etat': order.get('etat', ''),
+                'montant': order.get('montant', 0),
+                'idC': order.get('idC', ''),
+                'idTable': order.get('idTable', ''),
+                'items': lines.get(doc.id, [])
+            }
+
+
+def csv_rows(orders: Iterator[Dict]) -> Iterator[str]:
+    """One CSV line per line item (orders without items get one line with empty dish columns)"""
+    writer = csv.writer(_Echo())
+    yield writer.writerow(CSV_COLUMNS)
+    for order in orders:
+        base = [order['id'], order['dateCreation'], order['etat'], order['montant'], order['idC'], order['idTable']]
+        if not order['items']:
+            yield writer.writerow(base + ['', '', '', ''])
+        for item in order['items']:
+            yield writer.writerow(base + [item['plat_id'], item['nom'], item['quantite'], item['prix_unitaire']])
+
+
+def jsonl_rows(orders: Iterator[Dict]) -> Iterator[str]:
+    """One JSON object per order"""
+    for order in orders:
+        yield json.dumps(order, ensure_ascii=False, default=str) + '\n'
@@ -173,4 +173,57 @@ def get_all_orders(db):
         
     except Exception as e:
         logger.error(f"Error fetching all orders: {str(e)}", exc_info=True)
-        return []
\ No newline at end of file
+        return []
+# Line items live in 'commandes_plat' (orders placed through the API) and 'commande_plat' (seed data)
+LINE_ITEM_COLLECTIONS = ('commandes_plat', 'commande_plat')
+IN_QUERY_LIMIT = 30
+
+def iter_order_lines(db, order_ids):
+    """
+    Stream the line item documents of several orders, using 'in' queries
+    of at most IN_QUERY_LIMIT order ids per collection.
+    
+    Args:
+        db: Firestore database instance
+        order_ids: iterable of order ids
+        
+    Yields:
+        DocumentSnapshot of each line item
+    """
+    order_ids = list(order_ids)
+    for start in range(0, len(order_ids), IN_QUERY_LIMIT):
+        chunk = order_ids[start:start + IN_QUERY_LIMIT]
+        for collection in LINE_ITEM_COLLECTIONS:
+            yield from db.collection(collection).where('idCmd', 'in', chunk).stream()
+
+def iter_orders_in_range(db, start=None, end=None, page_size=500):
+    """
+    Stream orders ordered by dateCreation, one page (cursor) at a time, so
+    only page_size documents are held in memory.
+    
+    Args:
+        db: Firestore database instance
+        start: datetime, inclusive lower bound (optional)
+        end: datetime, exclusive upper bound (optional)
+        page_size: documents per query
+        
+    Yields:
+        list of DocumentSnapshot per page
+    """
+    query = db.collection('commandes')
+    if start:
+        query = query.where('dateCreation', '>=', start)
+    if end:
+        query = query.where('dateCreation', '<', end)
+    query = query.order_by('dateCreation').limit(page_size)
+    
+    last_doc = None
+    while True:
+        page_query = query.start_after(last_doc) if last_doc else query
+        page = list(page_query.stream())
+        if not page:
+            return
+        yield page
+        if len(page) < page_size:
+            return
+        last_doc = page[-1]
@@ -0,0 +1,329 @@
+"""
+Time-decayed dish popularity.
+
+Every ordered quantity adds qty * 2 ** ((t - epoch) / HALF_LIFE) to the dish score.
+Scores are kept relative to an epoch, so decaying them to "now" multiplies
+all of them by the same factor: the ranking never has to be recomputed and
+reading the top-k is a slice of an always-sorted list.
+
+The epoch moves forward every REBASE_INTERVAL (a whole number of half-lives
+after BASE_EPOCH, so every process agrees on it): the scores are then
+multiplied by 2 ** ((old - new) / HALF_LIFE), which keeps the weights below
+2 ** (REBASE_INTERVAL / HALF_LIFE) instead of growing until they overflow.
+
+Deltas are checkpointed to Firestore ('popularite_plats') with Increment,
+into the map entry of their epoch (scores.<epoch>), so several server
+processes can share the same counters. A background thread checkpoints,
+reloads and folds the entries of past epochs into the current one; request
+handlers only touch memory.
+"""
+from bisect import bisect_left, insort
+from typing import Dict, List, Optional, Tuple
+from firebase_admin import firestore
+from core.catalog import catalog
+from core.firebase_utils import firebase_config
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+POPULARITY_COLLECTION = 'popularite_plats'
+
+
+class PopularityTracker:
+    """In-memory exponentially decayed popularity counters with Firestore checkpoints"""
+
+    BASE_EPOCH = 1735689600  # 2025-01-01T00:00:00Z
+    HALF_LIFE_SECONDS = 7 * 24 * 3600
+    # 32 half-lives (about 7 months): weights stay below 2 ** 32
+    REBASE_INTERVAL = 32 * HALF_LIFE_SECONDS
+    CHECKPOINT_INTERVAL = 60
+    RELOAD_INTERVAL = 300
+
+    def __init__(self, persist: bool = True):
+        self.persist = persist
+        self._lock = threading.Lock()
+        self._epoch = self._epoch_at(time.time())
+        self._scores: Dict[str, float] = {}
+        self._ranking: List[Tuple[float, str]] = []  # (-score, dish_id), ascending
+        self._pending: Dict[str, float] = {}
+        self._started = False
+        self._last_reload = 0.0
+
+    # ======================
+    # Scoring helpers
+    # ======================
+    @classmethod
+    def _epoch_at(cls, timestamp: float) -> int:
+        periods = max(0, int((timestamp - cls.BASE_EPOCH) // cls.REBASE_INTERVAL))
+        return cls.BASE_EPOCH + periods * cls.REBASE_INTERVAL
+
+    def _factor(self, from_epoch: float, to_epoch: float) -> float:
+        """Multiplier converting a score relative to from_epoch into one relative to to_epoch"""
+        return 2 ** ((from_epoch - to_epoch) / self.HALF_LIFE_SECONDS)
+
+    def _weight(self, timestamp: float) -> float:
+        return self._factor(timestamp, self._epoch)
+
+    def _set_score(self, dish_id: str, score: float) -> None:
+        old = self._scores.get(dish_id)
+        if old is not None:
+            index = bisect_left(self._ranking, (-old, dish_id))
+            if index < len(self._ranking) and self._ranking[index] == (-old, dish_id):
+                del self._ranking[index]
+        self._scores[dish_id] = score
+        insort(self._ranking, (-score, dish_id))
+
+    def _rebase(self, now: float) -> None:
+        """Move the epoch forward when its interval is over, rescaling scores and pending deltas"""
+        epoch = self._epoch_at(now)
+        if epoch <= self._epoch:
+            return
+        with self._lock:
+            if epoch <= self._epoch:
+                return
+            factor = self._factor(self._epoch, epoch)
+            self._scores = {dish_id: score * factor for dish_id, score in self._scores.items()}
+            # Same factor for every dish: the order is unchanged
+            self._ranking = [(neg_score * factor, dish_id) for neg_score, dish_id in self._ranking]
+            self._pending = {dish_id: delta * factor for dish_id, delta in self._pending.items()}
+            self._epoch = epoch
+
+    # ======================
+    # Public API
+    # ======================
+    def record(self, dish_id: str, quantity: int = 1, timestamp: Optional[float] = None) -> None:
+        """Register ordered quantity for a dish"""
+        if not dish_id or quantity <= 0:
+            return
+        dish_id = str(dish_id)
+        self._ensure_started()
+        self._rebase(time.time())
+
+        with self._lock:
+            delta = quantity * self._weight(timestamp if timestamp is not None else time.time())
+            self._set_score(dish_id, self._scores.get(dish_id, 0.0) + delta)
+            if self.persist:
+                self._pending[dish_id] = self._pending.get(dish_id, 0.0) + delta
+
+    def top_k(self, k: int, exclude_ids=None) -> List[Tuple[str, float]]:
+        """
+        Return up to k (dish_id, score) pairs, most popular first.
+        Scores are decayed to the current time (roughly "orders per half-life").
+        """
+        self._ensure_started()
+        now = time.time()
+        self._rebase(now)
+        exclude_ids = exclude_ids or set()
+
+        result = []
+        with self._lock:
+            now_factor = 1 / self._weight(now)
+            for neg_score, dish_id in self._ranking:
+                if len(result) >= k:
+                    break
+                if dish_id in exclude_ids:
+                    continue
+                result.append((dish_id, -neg_score * now_factor))
+        return result
+
+    def forget(self, dish_id: str) -> None:
+        """Drop a dish (e.g. when it is deleted from the menu)"""
+        dish_id = str(dish_id)
+        with self._lock:
+            old = self._scores.pop(dish_id, None)
+            self._pending.pop(dish_id, None)
+            if old is not None:
+                index = bisect_left(self._ranking, (-old, dish_id))
+                if index < len(self._ranking) and self._ranking[index] == (-old, dish_id):
+                    del self._ranking[index]
+        if self.persist:
+            try:
+                firebase_config.get_db().collection(POPULARITY_COLLECTION).document(dish_id).delete()
+            except Exception as e:
+                logger.error(f"Failed to delete popularity counter for {dish_id}: {str(e)}")
+
+    # ======================
+    # Background synchronization
+    # ======================
+    def _ensure_started(self) -> None:
+        """Start the sync thread on first use; the first reload happens there, not in the request"""
+        if not self.persist or self._started:
+            return
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+        threading.Thread(target=self._sync_loop, name='popularity-sync', daemon=True).start()
+
+    def _sync_loop(self) -> None:
+        self.reload()
+        while True:
+            time.sleep(self.CHECKPOINT_INTERVAL)
+            try:
+                self._rebase(time.time())
+                self.checkpoint()
+                if time.time() - self._last_reload >= self.RELOAD_INTERVAL:
+                    self.reload()
+            except Exception as e:
+                logger.error(f"Popularity sync failed: {str(e)}")
+
+    # ======================
+    # Firestore persistence
+    # ======================
+    def _stored_score(self, data: Dict, epoch: int) -> Tuple[float, bool]:
+        """(score of a counter doc relative to epoch, whether it has entries of other epochs)"""
+        score, stale = 0.0, False
+        for entry_epoch, value in (data.get('scores') or {}).items():
+            score += (value or 0.0) * self._factor(int(entry_epoch), epoch)
+            stale = stale or int(entry_epoch) != epoch
+        if 'score' in data:
+            # Counters written before the epoch map
+            score += (data.get('score') or 0.0) * self._factor(data.get('epoch', self.BASE_EPOCH), epoch)
+            stale = True
+        return score, stale
+
+    def checkpoint(self) -> int:
+        """Flush pending deltas to Firestore, returns the number of dishes written"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            epoch = self._epoch
+        if not pending:
+            return 0
+
+        try:
+            db = firebase_config.get_db()
+            items = list(pending.items())
+            for start in range(0, len(items), 500):
+                batch = db.batch()
+                for dish_id, delta in items[start:start + 500]:
+                    ref = db.collection(POPULARITY_COLLECTION).document(dish_id)
+                    batch.set(ref, {
+                        'scores': {str(epoch): firestore.Increment(delta)},
+                        'updated_at': firestore.SERVER_TIMESTAMP
+                    }, merge=True)
+                batch.commit()
+            return len(items)
+        except Exception as e:
+            # Keep the deltas for the next checkpoint
+            logger.error(f"Popularity checkpoint failed: {str(e)}")
+            with self._lock:
+                factor = self._factor(epoch, self._epoch)
+                for dish_id, delta in pending.items():
+                    self._pending[dish_id] = self._pending.get(dish_id, 0.0) + delta * factor
+            return 0
+
+    def reload(self) -> None:
+        """Reload the shared counters, keeping local deltas not yet checkpointed"""
+        self._last_reload = time.time()
+        try:
+            docs = {doc.id: doc.to_dict() for doc in firebase_config.get_db().collection(POPULARITY_COLLECTION).stream()}
+        except Exception as e:
+            logger.error(f"Popularity reload failed: {str(e)}")
+            return
+
+        stale = []
+        with self._lock:
+            stored = {}
+            for dish_id, data in docs.items():
+                stored[dish_id], is_stale = self._stored_score(data, self._epoch)
+                if is_stale:
+                    stale.append(dish_id)
+            for dish_id, delta in self._pending.items():
+                stored[dish_id] = stored.get(dish_id, 0.0) + delta
+            self._scores = stored
+            self._ranking = sorted((-score, dish_id) for dish_id, score in stored.items())
+        if stale:
+            self.compact(stale)
+
+    def compact(self, dish_ids: List[str]) -> int:
+        """Fold the entries of past epochs of these counters into the current one"""
+        db = firebase_config.get_db()
+        compacted = 0
+
+        @firestore.transactional
+        def fold(transaction, ref):
+            snapshot = ref.get(transaction=transaction)
+            if not snapshot.exists:
+                return False
+            epoch = self._epoch
+            score, stale = self._stored_score(snapshot.to_dict(), epoch)
+            if not stale:
+                return False
+            # Replaces the document: the legacy score / epoch fields and old entries go away
+            transaction.set(ref, {'scores': {str(epoch): score}, 'updated_at': firestore.SERVER_TIMESTAMP})
+            return True
+
+        for dish_id in dish_ids:
+            try:
+                if fold(db.transaction(), db.collection(POPULARITY_COLLECTION).document(dish_id)):
+                    compacted += 1
+            except Exception as e:
+                logger.error(f"Popularity compaction failed for {dish_id}: {str(e)}")
+        return compacted
+
+    def rebuild(self, events) -> int:
+        """
+        Recompute every counter from (dish_id, quantity, timestamp) events and
+        overwrite the Firestore checkpoint.
+        """
+        self._rebase(time.time())
+        with self._lock:
+            epoch = self._epoch
+        scores: Dict[str, float] = {}
+        for dish_id, quantity, timestamp in events:
+            if dish_id and quantity > 0:
+                scores[str(dish_id)] = scores.get(str(dish_id), 0.0) + quantity * self._factor(timestamp, epoch)
+
+        with self._lock:
+            self._pending = {}
+            self._scores = scores
+            self._ranking = sorted((-score, dish_id) for dish_id, score in scores.items())
+
+        if self.persist:
+            db = firebase_config.get_db()
+            for doc in db.collection(POPULARITY_COLLECTION).stream():
+                if doc.id not in scores:
+                    doc.reference.delete()
+            items = list(scores.items())
+            for start in range(0, len(items), 500):
+                batch = db.batch()
+                for dish_id, score in items[start:start + 500]:
+                    batch.set(db.collection(POPULARITY_COLLECTION).document(dish_id), {
+                        'scores': {str(epoch): score},
+                        'updated_at': firestore.SERVER_TIMESTAMP
+                    })
+                batch.commit()
+        return len(scores)
+
+
+# Singleton instance
+popularity_tracker = PopularityTracker()
+
+
+def get_trending_dishes(limit: int = 10) -> List[Dict]:
+    """Top dishes with their menu data, from the catalog replica (no Firestore read)"""
+    ranked = popularity_tracker.top_k(limit)
+    if not ranked:
+        return []
+
+    plats = catalog.snapshot().plats
+
+    trending = []
+    for dish_id, score in ranked:
+        plat = plats.get(dish_id)
+        if not plat:
+            continue
+        trending.append({
+            'id': dish_id,
+            'nom': plat.get('nom', ''),
+            'description': plat.get('description', ''),
+            'prix': plat.get('prix', 0),
+            'categorie': plat.get('idCat', ''),
+            'sous_categorie': plat.get('idSousCat', ''),
+            'note': plat.get('note', 0),
+            'image_url': plat.get('image_url', ''),
+            'popularity_score': round(score, 2)
+        })
+    return trending
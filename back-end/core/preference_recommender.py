@@ -0,0 +1,117 @@
+"""
+Preference-based dish recommendations, shared by the client apps and the
+offline evaluation (core.recommendation_eval).
+
+The selection itself is a pure function of its inputs: the client's
+preferences, the dishes of each sous-category, the dishes used for padding
+and a random.Random. The apps feed it the catalog replica and a generator
+seeded per client and hour; the evaluation feeds it the history before
+each replayed order and its own generator, so nothing after the cutoff is
+seen and the global random module is never reseeded.
+"""
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+import logging
+import random
+
+logger = logging.getLogger(__name__)
+
+RECOMMENDATION_COUNT = 8
+
+# Preference to subcategory mapping (using actual idSousCat values)
+PREFERENCE_MAPPING = {
+    'Soupes et Potages': ['scat_soupe'],
+    'Salades et Crudités': ['scat_salade'],
+    'Poissons et Fruits de mer': ['scat_poisson'],
+    'Cuisine traditionnelle': ['scat_couscous', 'scat_tagine'],
+    'Viandes': ['scat_viande'],
+    'Sandwichs et burgers': ['scat_feuillete'],
+    'Végétariens': ['scat_vegetarien'],
+    'Crémes et Mousses': ['scat_gateau'],
+    'Pâtisseries': ['scat_patisserie'],
+    'Fruits et Sorbets': ['scat_froid']
+}
+
+
+def client_rng(client_id: str, when: Optional[datetime] = None) -> random.Random:
+    """Generator seeded per client and hour: different results on different hours, stable within one"""
+    when = when or datetime.now()
+    return random.Random(f"{client_id}_{when.strftime('%Y%m%d%H')}")
+
+
+def preference_quotas(preferences: List[str]) -> List[Tuple[str, int]]:
+    """(sous-category, number of dishes) for the client's preferences, RECOMMENDATION_COUNT in total"""
+    # Determine distribution based on number of preferences
+    if len(preferences) == 1:
+        distribution = [8]
+    elif len(preferences) == 2:
+        distribution = [4, 4]
+    else:  # 3 or more preferences, only the first 3 are used
+        distribution = [3, 3, 2]
+
+    quotas = []
+    for preference, needed_count in zip(preferences, distribution):
+        subcategories = PREFERENCE_MAPPING.get(preference, [])
+        if not subcategories:
+            logger.warning(f"No subcategory mapping found for preference: {preference}")
+            continue
+        if len(subcategories) > 1:
+            # Split between the subcategories (Couscous and Tagine: 2 each for most cases)
+            share = needed_count // len(subcategories)
+            for index, subcat in enumerate(subcategories):
+                count = needed_count - share * (len(subcategories) - 1) if index == len(subcategories) - 1 else share
+                quotas.append((subcat, count))
+        else:
+            quotas.append((subcategories[0], needed_count))
+    return quotas
+
+
+def recommend(preferences: List[str], dishes_by_subcategory: Dict[str, List[str]],
+              all_dish_ids: Iterable[str], rng: random.Random) -> Dict:
+    """
+    RECOMMENDATION_COUNT dish ids drawn from the preferred sous-categories,
+    padded with random dishes of the catalog.
+    Returns {'dish_ids': [...], 'subcategories_used': [...]}.
+    """
+    recommended_dish_ids = []
+    subcategories_used = []
+    for subcat, count in preference_quotas(preferences):
+        dish_ids = sorted(dishes_by_subcategory.get(subcat, []))
+        if not dish_ids:
+            logger.warning(f"No dishes found for subcategory: {subcat}")
+            continue
+        recommended_dish_ids.extend(rng.sample(dish_ids, min(count, len(dish_ids))))
+        subcategories_used.append(subcat)
+
+    # Remove duplicates while preserving order
+    unique_dish_ids = list(dict.fromkeys(recommended_dish_ids))
+
+    # If we don't have enough recommendations, pad with random dishes
+    if len(unique_dish_ids) < RECOMMENDATION_COUNT:
+        chosen = set(unique_dish_ids)
+        available = sorted(dish_id for dish_id in set(all_dish_ids) if dish_id not in chosen)
+        needed = min(RECOMMENDATION_COUNT - len(unique_dish_ids), len(available))
+        unique_dish_ids.extend(rng.sample(available, needed))
+
+    return {
+        'dish_ids': unique_dish_ids[:RECOMMENDATION_COUNT],
+        'subcategories_used': subcategories_used
+    }
+
+
+def random_dishes(all_dish_ids: Iterable[str], count: int, rng: Optional[random.Random] = None,
+                  exclude_ids=()) -> List[str]:
+    """count random dishes of the catalog, for padding"""
+    rng = rng or random.Random()
+    exclude_ids = set(exclude_ids)
+    available = sorted(dish_id for dish_id in set(all_dish_ids) if dish_id not in exclude_ids)
+    return rng.sample(available, min(count, len(available)))
+
+
+def subcategory_dishes(snapshot) -> Dict[str, List[str]]:
+    """idSousCat -> dish ids of a catalog snapshot (registered with catalog.derived)"""
+    dishes: Dict[str, List[str]] = {}
+    for plat_id, plat in snapshot.plats.items():
+        if plat.get('idSousCat'):
+            dishes.setdefault(plat['idSousCat'], []).append(str(plat_id))
+    return dishes
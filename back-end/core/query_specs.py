@@ -0,0 +1,234 @@
+"""
+Registry of the Firestore query shapes used by the views and core modules.
+
+Each QuerySpec declares the filters and ordering of one query: equality
+('==' / 'in') fields, the range field ('<', '>=', ...), the order_by
+fields and whether it runs on a collection group. From the registry:
+
+- manifest() generates firestore.indexes.json: one composite index per
+  shape combining several fields, and a field override for single-field
+  collection group queries (Firestore only indexes single fields per
+  collection by default). Deploy it with
+  `firebase deploy --only firestore:indexes`.
+- missing_indexes() compares the registry with the manifest on disk;
+  CoreConfig.ready() logs the shapes that have no index, and
+  `python manage.py firestore_indexes --check` fails on them.
+
+A new query that filters on several fields or orders by a field it does
+not filter on is added to SPECS, then the manifest is regenerated with
+`python manage.py firestore_indexes`.
+"""
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+from django.conf import settings
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+ASC = 'ASCENDING'
+DESC = 'DESCENDING'
+
+
+@dataclass(frozen=True)
+class QuerySpec:
+    name: str
+    collection: str
+    equals: Tuple[str, ...] = ()
+    range: Optional[str] = None
+    order: Tuple[Tuple[str, str], ...] = ()
+    group: bool = False
+    used_by: str = ''
+
+    @property
+    def scope(self) -> str:
+        return 'COLLECTION_GROUP' if self.group else 'COLLECTION'
+
+    def index_fields(self) -> List[Tuple[str, str]]:
+        """Fields of the index serving this shape: equalities, then the range field, then the ordering"""
+        fields = [(field, ASC) for field in self.equals]
+        ordering = list(self.order)
+        # Firestore orders by the range field first
+        if self.range and (not ordering or ordering[0][0] != self.range):
+            ordering.insert(0, (self.range, ASC))
+        for field, direction in ordering:
+            if field not in [name for name, _ in fields]:
+                fields.append((field, direction))
+        return fields
+
+    def composite_index(self) -> Optional[Dict]:
+        """Composite index definition, None when single-field indexes serve the shape"""
+        fields = self.index_fields()
+        if len(fields) < 2:
+            return None
+        return {
+            'collectionGroup': self.collection,
+            'queryScope': self.scope,
+            'fields': [{'fieldPath': field, 'order': direction} for field, direction in fields],
+        }
+
+    def group_field(self) -> Optional[str]:
+        """Single field of a collection group query, which needs a field override"""
+        fields = self.index_fields()
+        return fields[0][0] if self.group and len(fields) == 1 else None
+
+
+SPECS: List[QuerySpec] = [
+    # ======================
+    # Notifications (core.notifications)
+    # ======================
+    QuerySpec('inbox_page', 'items', order=(('created_at', DESC),),
+              used_by='notifications.list_notifications'),
+    QuerySpec('inbox_unread_page', 'items', equals=('read',), order=(('created_at', DESC),),
+              used_by='notifications.list_notifications(unread_only)'),
+    QuerySpec('inboxes_page', 'items', equals=('inbox',), order=(('created_at', DESC),), group=True,
+              used_by='notifications.query_inboxes'),
+    QuerySpec('inboxes_unread_page', 'items', equals=('inbox', 'read'), order=(('created_at', DESC),), group=True,
+              used_by='notifications.query_inboxes(unread_only)'),
+    QuerySpec('inboxes_since', 'items', equals=('inbox',), range='created_at', order=(('created_at', DESC),),
+              group=True, used_by='notifications.query_inboxes(since)'),
+    QuerySpec('inboxes_unread_since', 'items', equals=('inbox', 'read'), range='created_at',
+              order=(('created_at', DESC),), group=True, used_by='notifications.query_inboxes(unread_only, since)'),
+    QuerySpec('new_inbox_items', 'items', range='created_at', group=True,
+              used_by='notification_stream listener'),
+    QuerySpec('retention_items', 'items', equals=('read',), range='created_at', order=(('created_at', ASC),),
+              group=True, used_by='purge_notifications'),
+    QuerySpec('retention_legacy', 'notifications', equals=('read',), range='created_at',
+              order=(('created_at', ASC),), used_by='purge_notifications'),
+
+    # ======================
+    # Reservations
+    # ======================
+    QuerySpec('reservations_by_slot', 'reservations', range='slot_start', order=(('slot_start', ASC),),
+              used_by='reservation_index.query_reservations, table_availability'),
+    QuerySpec('reservations_by_status_slot', 'reservations', equals=('status',), range='slot_start',
+              order=(('slot_start', ASC),), used_by='reservation_index.query_reservations(status)'),
+    QuerySpec('active_reservations', 'reservations', equals=('status',),
+              used_by='floor_plan, manager get_active_reservations'),
+    QuerySpec('table_reservations', 'reservations', equals=('table_id',),
+              used_by='server get_table_orders'),
+    QuerySpec('table_pending_reservations', 'reservations', equals=('table_id', 'status'),
+              used_by='server update_table_status, confirm_reservation'),
+    QuerySpec('client_reservations', 'reservations', equals=('client_id',),
+              used_by='client_mobile get_reservations, orders_utils'),
+    QuerySpec('client_upcoming_reservations', 'reservations', equals=('client_id',), range='slot_start',
+              order=(('slot_start', ASC),), used_by='client_mobile get_dashboard'),
+
+    # ======================
+    # Orders
+    # ======================
+    QuerySpec('orders_by_status', 'commandes', equals=('etat',),
+              used_by='orders_utils.get_orders_by_status, server dashboard'),
+    QuerySpec('orders_by_date', 'commandes', range='dateCreation', order=(('dateCreation', ASC),),
+              used_by='orders_utils.get_all_orders / iter_orders_in_range, range_query, sales_analytics'),
+    QuerySpec('client_orders', 'commandes', equals=('idC',), used_by='client order history, floor_plan'),
+    QuerySpec('order_lines', 'commandes_plat', equals=('idCmd',), used_by='orders_utils.iter_order_lines'),
+    QuerySpec('order_lines_seed', 'commande_plat', equals=('idCmd',), used_by='orders_utils.iter_order_lines'),
+    QuerySpec('order_dish_lines', 'commande_plat', equals=('idCmd', 'idP'),
+              used_by='manager get_commande_plat_list'),
+    QuerySpec('order_servers', 'serveur_commande', equals=('idCmd',), used_by='kitchen / server order details'),
+    QuerySpec('server_orders', 'serveur_commande', equals=('idE',), used_by='server get_server_profile'),
+    QuerySpec('client_cancellation_requests', 'DemandeAnnulation', equals=('idClient',),
+              order=(('createdAt', DESC),), used_by='client_table get_cancellation_requests'),
+
+    # ======================
+    # Catalog, clients, staff
+    # ======================
+    QuerySpec('client_favorite', 'favoris', equals=('client_id', 'plat_id'),
+              used_by='client_table add_favorite / remove_favorite'),
+    QuerySpec('client_favorites', 'favoris', equals=('client_id',), used_by='client_table get_favorites'),
+    QuerySpec('employee_by_uid', 'employes', equals=('firebase_uid',), used_by='permissions, profiles'),
+    QuerySpec('assistance_requests', 'demandeAssistance', order=(('createdAt', DESC),),
+              used_by='server get_assistance_requests'),
+    QuerySpec('dish_sales', 'ventes_plats', equals=('periode',), used_by='sales_counters'),
+    QuerySpec('ingredient_consumption', 'consommations_ingredients', range='date', used_by='stock_forecast'),
+]
+
+
+def get_spec(name: str) -> QuerySpec:
+    for spec in SPECS:
+        if spec.name == name:
+            return spec
+    raise KeyError(f"Unknown query spec: {name}")
+
+
+def manifest_path() -> Path:
+    return Path(getattr(settings, 'FIRESTORE_INDEXES_FILE', Path(settings.BASE_DIR) / 'firestore.indexes.json'))
+
+
+def _index_key(index: Dict) -> tuple:
+    return (
+        index['collectionGroup'],
+        index['queryScope'],
+        tuple((field['fieldPath'], field.get('order')) for field in index['fields']),
+    )
+
+
+def manifest() -> Dict:
+    """firestore.indexes.json content for the registered shapes"""
+    indexes = {}
+    overrides = {}
+    for spec in SPECS:
+        index = spec.composite_index()
+        if index:
+            indexes.setdefault(_index_key(index), index)
+        field = spec.group_field()
+        if field:
+            overrides[(spec.collection, field)] = {
+                'collectionGroup': spec.collection,
+                'fieldPath': field,
+                # An override replaces the default single-field indexes: keep the collection ones
+                'indexes': [
+                    {'order': order, 'queryScope': scope}
+                    for scope in ('COLLECTION', 'COLLECTION_GROUP') for order in (ASC, DESC)
+                ],
+            }
+    return {
+        'indexes': [indexes[key] for key in sorted(indexes)],
+        'fieldOverrides': [overrides[key] for key in sorted(overrides)],
+    }
+
+
+def write_manifest(path: Optional[Path] = None) -> Path:
+    path = path or manifest_path()
+    path.write_text(json.dumps(manifest(), indent=2, ensure_ascii=False) + '\n', encoding='utf-8')
+    return path
+
+
+def missing_indexes(path: Optional[Path] = None) -> List[QuerySpec]:
+    """Registered shapes whose composite index or field override is not in the manifest file"""
+    path = path or manifest_path()
+    try:
+        current = json.loads(path.read_text(encoding='utf-8'))
+    except (OSError, ValueError):
+        current = {}
+    indexes = {_index_key(index) for index in current.get('indexes', [])}
+    overrides = {
+        (override.get('collectionGroup'), override.get('fieldPath'))
+        for override in current.get('fieldOverrides', [])
+        if any(index.get('queryScope') == 'COLLECTION_GROUP' for index in override.get('indexes', []))
+    }
+
+    missing = []
+    for spec in SPECS:
+        index = spec.composite_index()
+        field = spec.group_field()
+        if (index and _index_key(index) not in indexes) or (field and (spec.collection, field) not in overrides):
+            missing.append(spec)
+    return missing
+
+
+def check_indexes() -> List[QuerySpec]:
+    """Log the registered shapes without an index in the manifest (run at startup)"""
+    names = [spec.name for spec in SPECS]
+    duplicates = sorted({name for name in names if names.count(name) > 1})
+    if duplicates:
+        logger.warning(f"Duplicate query specs: {', '.join(duplicates)}")
+    missing = missing_indexes()
+    for spec in missing:
+        logger.warning(
+            f"No Firestore index for query '{spec.name}' ({spec.collection}: {spec.index_fields()}, "
+            f"used by {spec.used_by}); run manage.py firestore_indexes"
+        )
+    return missing
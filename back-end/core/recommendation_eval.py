@@ -0,0 +1,240 @@
+"""
+Offline evaluation harness for dish recommendation engines.
+Replays the order history chronologically, holds out each client's next order
+and measures precision@k, recall@k, catalog coverage and per-call latency.
+Engines only see the history before the replayed order (no live popularity,
+no Firestore reads) and draw from their own random.Random.
+"""
+from collections import Counter, defaultdict
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+from core.orders_utils import LINE_ITEM_COLLECTIONS
+from core.preference_recommender import random_dishes, recommend
+from core.revenue_rollups import CANCELLED_STATES, to_utc
+import logging
+import random
+import statistics
+import time
+
+logger = logging.getLogger(__name__)
+
+# Engine registry: name -> callable(context, k) returning a ranked list of dish ids
+ENGINES: Dict[str, Callable] = {}
+
+
+def register_engine(name: str):
+    """Decorator registering a recommendation engine under the given name"""
+    def decorator(func):
+        ENGINES[name] = func
+        return func
+    return decorator
+
+
+@dataclass
+class ReplayContext:
+    """Everything an engine may look at when asked for a recommendation"""
+    client_id: str
+    client: Dict
+    history: List[Dict]
+    as_of: datetime
+    popularity: Counter
+    dish_ids: List[str] = field(default_factory=list)
+    dishes_by_subcategory: Dict[str, List[str]] = field(default_factory=dict)
+    rng: random.Random = field(default_factory=random.Random)
+
+
+@dataclass
+class EngineResult:
+    name: str
+    k: int
+    precisions: List[float] = field(default_factory=list)
+    recalls: List[float] = field(default_factory=list)
+    latencies_ms: List[float] = field(default_factory=list)
+    recommended: set = field(default_factory=set)
+    errors: int = 0
+
+    def summary(self, catalog_size: int) -> Dict:
+        evaluated = len(self.precisions)
+        latencies = sorted(self.latencies_ms)
+        return {
+            'engine': self.name,
+            'evaluated': evaluated,
+            'errors': self.errors,
+            f'precision@{self.k}': round(statistics.fmean(self.precisions), 4) if evaluated else 0.0,
+            f'recall@{self.k}': round(statistics.fmean(self.recalls), 4) if evaluated else 0.0,
+            'coverage': round(len(self.recommended) / catalog_size, 4) if catalog_size else 0.0,
+            'latency_p50_ms': round(_percentile(latencies, 50), 2),
+            'latency_p95_ms': round(_percentile(latencies, 95), 2),
+            'latency_mean_ms': round(statistics.fmean(latencies), 2) if latencies else 0.0,
+        }
+
+
+def _percentile(sorted_values: List[float], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def load_order_history(db) -> List[Dict]:
+    """
+    Load every order with a creation date together with the set of dishes it contains,
+    sorted chronologically.
+    """
+    lines_by_order = defaultdict(set)
+    for collection in LINE_ITEM_COLLECTIONS:
+        for doc in db.collection(collection).stream():
+            line = doc.to_dict()
+            if line.get('idCmd') and line.get('idP'):
+                lines_by_order[line['idCmd']].add(str(line['idP']))
+
+    orders = []
+    for doc in db.collection('commandes').stream():
+        data = doc.to_dict()
+        created = data.get('dateCreation')
+        if not created or not data.get('idC') or doc.id not in lines_by_order:
+            continue
+        if data.get('etat') in CANCELLED_STATES:
+            continue
+        # Firestore timestamps, or ISO strings in seed data
+        try:
+            created = to_utc(created)
+        except (TypeError, ValueError):
+            continue
+        orders.append({
+            'id': doc.id,
+            'client_id': data['idC'],
+            'date': created,
+            'dish_ids': lines_by_order[doc.id],
+        })
+
+    orders.sort(key=lambda o: o['date'])
+    return orders
+
+
+def load_clients(db, client_ids) -> Dict[str, Dict]:
+    """Fetch client documents in one batched read"""
+    refs = [db.collection('clients').document(cid) for cid in client_ids]
+    clients = {}
+    for doc in db.get_all(refs):
+        if doc.exists:
+            clients[doc.id] = doc.to_dict()
+    return clients
+
+
+def load_catalog(db) -> Dict[str, Dict]:
+    """Dish id -> {'idSousCat'} of every dish, all the engines need from the catalog"""
+    return {doc.id: doc.to_dict() for doc in db.collection('plats').select(['idSousCat']).stream()}
+
+
+def evaluate(engines: Dict[str, Callable], orders: List[Dict], clients: Dict[str, Dict],
+             plats: Dict[str, Dict], k: int = 8, max_cases: Optional[int] = None) -> List[Dict]:
+    """
+    Replay orders in time order. Every order whose client already has at least one
+    earlier order is a test case: engines see only data strictly before it.
+    """
+    results = {name: EngineResult(name=name, k=k) for name in engines}
+    dish_ids = sorted(plats)
+    dishes_by_subcategory = defaultdict(list)
+    for plat_id, plat in plats.items():
+        if plat.get('idSousCat'):
+            dishes_by_subcategory[plat['idSousCat']].append(plat_id)
+    history_by_client = defaultdict(list)
+    popularity = Counter()
+    cases = 0
+
+    for order in orders:
+        client_id = order['client_id']
+        history = history_by_client[client_id]
+
+        if history and (max_cases is None or cases < max_cases):
+            cases += 1
+            target = order['dish_ids']
+            context = ReplayContext(
+                client_id=client_id,
+                client=clients.get(client_id, {}),
+                history=list(history),
+                as_of=order['date'],
+                popularity=popularity,
+                dish_ids=dish_ids,
+                dishes_by_subcategory=dishes_by_subcategory,
+                # Reproducible per case, and the global random module is left alone
+                rng=random.Random(f"{client_id}_{order['id']}"),
+            )
+            for name, engine in engines.items():
+                result = results[name]
+                started = time.perf_counter()
+                try:
+                    recommended = list(engine(context, k))[:k]
+                except Exception as e:
+                    logger.error(f"Engine {name} failed for client {client_id}: {str(e)}")
+                    result.errors += 1
+                    continue
+                result.latencies_ms.append((time.perf_counter() - started) * 1000)
+
+                hits = len(target.intersection(recommended))
+                result.precisions.append(hits / k)
+                result.recalls.append(hits / len(target))
+                result.recommended.update(recommended)
+
+        history.append(order)
+        popularity.update(order['dish_ids'])
+
+    return [results[name].summary(len(plats)) for name in engines]
+
+
+def format_report(rows: List[Dict]) -> str:
+    """Render evaluation summaries as a fixed-width comparison table"""
+    if not rows:
+        return 'No engine evaluated.'
+    columns = list(rows[0].keys())
+    widths = {c: max(len(c), *(len(str(r[c])) for r in rows)) for c in columns}
+    header = '  '.join(c.ljust(widths[c]) for c in columns)
+    separator = '  '.join('-' * widths[c] for c in columns)
+    body = ['  '.join(str(r[c]).ljust(widths[c]) for c in columns) for r in rows]
+    return '\n'.join([header, separator, *body])
+
+
+# ======================
+# Built-in engines
+# ======================
+
+@register_engine('preference_based')
+def preference_based_engine(context: ReplayContext, k: int) -> List[str]:
+    """
+    Production engine of the client apps (core.preference_recommender), with the
+    popularity of the replayed history instead of the live tracker
+    """
+    from core.allergens import filter_safe_dishes, safe_recommendations
+
+    popular_ids = [dish_id for dish_id, _ in context.popularity.most_common(30)]
+    preferences = context.client.get('preferences', [])
+    if not preferences:
+        # Fallback of the apps: most popular safe dishes, padded with random ones
+        dish_ids = filter_safe_dishes(popular_ids, context.client)[:k]
+        dish_ids += random_dishes(context.dish_ids, k - len(dish_ids), context.rng, exclude_ids=dish_ids)
+        return safe_recommendations(dish_ids, context.client, count=k)
+    dish_ids = recommend(preferences, context.dishes_by_subcategory, context.dish_ids, context.rng)['dish_ids']
+    return safe_recommendations(dish_ids, context.client, count=k, padding=popular_ids)
+
+
+@register_engine('popularity_baseline')
+def popularity_baseline_engine(context: ReplayContext, k: int) -> List[str]:
+    """Most ordered dishes so far, a sanity baseline any smarter engine should beat"""
+    return [dish_id for dish_id, _ in context.popularity.most_common(k)]
+
+
+@register_engine('repeat_history')
+def repeat_history_engine(context: ReplayContext, k: int) -> List[str]:
+    """Client's own most ordered dishes, padded with global popularity"""
+    own = Counter()
+    for order in context.history:
+        own.update(order['dish_ids'])
+    ranked = [dish_id for dish_id, _ in own.most_common(k)]
+    for dish_id, _ in context.popularity.most_common(k * 2):
+        if len(ranked) >= k:
+            break
+        if dish_id not in ranked:
+            ranked.append(dish_id)
+    return ranked
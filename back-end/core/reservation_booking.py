@@ -0,0 +1,169 @@
+"""
+Transactional reservation booking.
+
+A reservation claims one 'reservation_slots' document per SLOT_MINUTES
+bucket it covers, with a deterministic id (table + bucket start). The slot
+documents, the table and the reservation are read and written in a single
+Firestore transaction: two concurrent bookings of the same table and time
+conflict on the same slot documents, so one of them is retried, sees the
+claim and fails. Cancelling is a transaction too: it refuses a reservation
+already cancelled and deletes only the claims that still name this
+reservation, so a repeated cancel never frees a slot booked by someone else
+since. claim_existing() adds the claims of reservations created before the
+slot documents (backfill_reservation_index).
+"""
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+from firebase_admin import firestore
+from core.reservation_index import index_fields, parse_slot, to_utc
+from core.table_availability import RESERVATION_DURATION
+import logging
+import uuid
+
+logger = logging.getLogger(__name__)
+
+SLOTS_COLLECTION = 'reservation_slots'
+SLOT_MINUTES = 30
+MAX_ATTEMPTS = 5
+
+
+class SlotUnavailable(Exception):
+    """The table is already booked on part of the requested slot"""
+
+
+class TableNotFound(Exception):
+    pass
+
+
+class ReservationNotFound(Exception):
+    pass
+
+
+class ReservationNotCancellable(Exception):
+    """The reservation is already cancelled, or in a status that cannot be cancelled"""
+
+    def __init__(self, status: str):
+        super().__init__(status)
+        self.status = status
+
+
+def slot_ids(table_id: str, start: datetime, duration: Optional[timedelta] = None) -> List[str]:
+    """Ids of the SLOT_MINUTES buckets covered by [start, start + duration)"""
+    # Bucket ids are in UTC, whatever the zone of start (naive: restaurant local time)
+    start = to_utc(start)
+    end = start + (duration or RESERVATION_DURATION)
+    bucket = start.replace(minute=start.minute - start.minute % SLOT_MINUTES, second=0, microsecond=0)
+    ids = []
+    while bucket < end:
+        ids.append(f"{table_id}_{bucket.strftime('%Y%m%dT%H%M')}")
+        bucket += timedelta(minutes=SLOT_MINUTES)
+    return ids
+
+
+def book_table(db, table_id: str, reservation_data: Dict, party_size: int,
+               reservation_id: Optional[str] = None, table_update: Optional[Dict] = None) -> str:
+    """
+    Create the reservation and claim its slots in one transaction.
+    reservation_data must contain 'date_time'; the date index fields, table_id
+    and the claimed slot ids are added. Raises TableNotFound, SlotUnavailable,
+    or ValueError when the table is too small.
+    """
+    reservation_id = reservation_id or str(uuid.uuid4())
+    data = dict(reservation_data, table_id=table_id, **index_fields(reservation_data['date_time']))
+    duration = timedelta(minutes=int(data.get('duree_minutes', 0) or 0)) or None
+    claimed = slot_ids(table_id, data['slot_start'], duration)
+    data['slot_ids'] = claimed
+
+    table_ref = db.collection('tables').document(table_id)
+    slot_refs = [db.collection(SLOTS_COLLECTION).document(slot_id) for slot_id in claimed]
+    reservation_ref = db.collection('reservations').document(reservation_id)
+
+    @firestore.transactional
+    def claim(transaction):
+        snapshots = {doc.id: doc for doc in db.get_all([table_ref] + slot_refs, transaction=transaction)}
+        table = snapshots.get(table_id)
+        if table is None or not table.exists:
+            raise TableNotFound(table_id)
+        if int(table.to_dict().get('nbrPersonne', 0) or 0) < party_size:
+            raise ValueError('Table capacity is insufficient for the party size')
+        taken = [ref.id for ref in slot_refs if snapshots.get(ref.id) is not None and snapshots[ref.id].exists]
+        if taken:
+            raise SlotUnavailable(', '.join(taken))
+
+        for ref in slot_refs:
+            transaction.create(ref, {
+                'table_id': table_id,
+                'reservation_id': reservation_id,
+                'created_at': firestore.SERVER_TIMESTAMP
+            })
+        transaction.set(reservation_ref, data)
+        if table_update:
+            transaction.update(table_ref, table_update)
+
+    claim(db.transaction(max_attempts=MAX_ATTEMPTS))
+    return reservation_id
+
+
+def cancel_reservation(db, reservation_id: str, updates: Optional[Dict] = None,
+                       cancellable: Optional[Tuple[str, ...]] = None) -> Dict:
+    """
+    Set a reservation to cancelled (plus updates) and release its slot claims in
+    one transaction. Raises ReservationNotFound, or ReservationNotCancellable when
+    it is already cancelled or its status is not in cancellable.
+    Returns the reservation as it was before, with its 'id'.
+    """
+    reservation_ref = db.collection('reservations').document(reservation_id)
+
+    @firestore.transactional
+    def cancel(transaction):
+        snapshot = reservation_ref.get(transaction=transaction)
+        if not snapshot.exists:
+            raise ReservationNotFound(reservation_id)
+        reservation = snapshot.to_dict()
+        current = reservation.get('status', '')
+        if current == 'cancelled' or (cancellable is not None and current not in cancellable):
+            raise ReservationNotCancellable(current)
+
+        slot_refs = [db.collection(SLOTS_COLLECTION).document(slot_id) for slot_id in reservation.get('slot_ids', [])]
+        claims = list(db.get_all(slot_refs, transaction=transaction)) if slot_refs else []
+        transaction.update(reservation_ref, dict(updates or {}, status='cancelled'))
+        for claim in claims:
+            # A claim of another reservation is never released
+            if claim.exists and claim.to_dict().get('reservation_id') == reservation_id:
+                transaction.delete(claim.reference)
+        return dict(reservation, id=reservation_id)
+
+    return cancel(db.transaction(max_attempts=MAX_ATTEMPTS))
+
+
+def claim_existing(db, reservation_id: str, reservation: Dict) -> Tuple[List[str], List[str]]:
+    """
+    Claim the slots of a reservation created without claims. Slots already
+    claimed by another reservation (an existing double booking) are skipped.
+    Returns (claimed slot ids, conflicting slot ids).
+    """
+    start = reservation.get('slot_start') or parse_slot(reservation.get('date_time', ''))
+    duration = timedelta(minutes=int(reservation.get('duree_minutes', 0) or 0)) or None
+    wanted = slot_ids(reservation['table_id'], start, duration)
+    slot_refs = [db.collection(SLOTS_COLLECTION).document(slot_id) for slot_id in wanted]
+    reservation_ref = db.collection('reservations').document(reservation_id)
+
+    @firestore.transactional
+    def claim(transaction):
+        claimed, conflicts = [], []
+        for doc in db.get_all(slot_refs, transaction=transaction):
+            if not doc.exists:
+                transaction.create(doc.reference, {
+                    'table_id': reservation['table_id'],
+                    'reservation_id': reservation_id,
+                    'created_at': firestore.SERVER_TIMESTAMP
+                })
+                claimed.append(doc.id)
+            elif doc.to_dict().get('reservation_id') == reservation_id:
+                claimed.append(doc.id)
+            else:
+                conflicts.append(doc.id)
+        transaction.update(reservation_ref, {'slot_ids': sorted(claimed)})
+        return sorted(claimed), sorted(conflicts)
+
+    return claim(db.transaction(max_attempts=MAX_ATTEMPTS))
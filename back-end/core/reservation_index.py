@@ -0,0 +1,77 @@
+"""
+Date-keyed reservation fields and paged range queries.
+
+Reservations store their slot as a 'YYYY-MM-DDTHH:MM' string ('date_time'),
+in the restaurant's local time (settings.TIME_ZONE). Every reservation also
+carries 'date_key' (local YYYY-MM-DD) and 'slot_start' (the same instant as a
+UTC timestamp), so listings are server-side range queries on slot_start
+instead of downloading the whole collection. After a TIME_ZONE change, run
+backfill_reservation_index --force.
+"""
+from datetime import date, datetime, time as dt_time, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
+from django.utils import timezone as django_timezone
+import logging
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+def to_utc(value: datetime) -> datetime:
+    """Aware UTC datetime; a naive value is the restaurant's local time (settings.TIME_ZONE)"""
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=django_timezone.get_default_timezone())
+    return value.astimezone(timezone.utc)
+
+
+def parse_slot(date_time: str) -> datetime:
+    """'2025-05-10T19:30' local time (or with seconds / offset) -> aware UTC datetime"""
+    return to_utc(datetime.fromisoformat(str(date_time).replace('Z', '+00:00')))
+
+
+def index_fields(date_time: str) -> Dict:
+    """Fields to store with a reservation whose slot is date_time"""
+    slot = parse_slot(date_time)
+    local_day = slot.astimezone(django_timezone.get_default_timezone()).strftime('%Y-%m-%d')
+    return {'date_key': local_day, 'slot_start': slot}
+
+
+def day_bounds(day: date) -> Tuple[datetime, datetime]:
+    """UTC bounds of a local calendar day (23 or 25 hours on DST changes)"""
+    start = to_utc(datetime.combine(day, dt_time.min))
+    return start, to_utc(datetime.combine(day + timedelta(days=1), dt_time.min))
+
+
+def query_reservations(db, start: Optional[datetime] = None, end: Optional[datetime] = None,
+                       status: Optional[str] = None, cursor: Optional[str] = None,
+                       page_size: int = DEFAULT_PAGE_SIZE) -> Tuple[List[Dict], Optional[str]]:
+    """
+    One page of reservations with slot_start in [start, end), ordered by slot.
+    cursor is the id of the last reservation of the previous page.
+    Returns (reservations, next_cursor); next_cursor is None on the last page.
+    """
+    page_size = max(1, min(int(page_size), MAX_PAGE_SIZE))
+    query = db.collection('reservations')
+    if status:
+        query = query.where('status', '==', status)
+    if start:
+        query = query.where('slot_start', '>=', start)
+    if end:
+        query = query.where('slot_start', '<', end)
+    query = query.order_by('slot_start')
+
+    if cursor:
+        cursor_doc = db.collection('reservations').document(cursor).get()
+        if cursor_doc.exists:
+            query = query.start_after(cursor_doc)
+
+    docs = list(query.limit(page_size + 1).stream())
+    reservations = []
+    for doc in docs[:page_size]:
+        reservation = doc.to_dict()
+        reservation['id'] = doc.id
+        reservations.append(reservation)
+    next_cursor = docs[page_size - 1].id if len(docs) > page_size else None
+    return reservations, next_cursor
@@ -0,0 +1,244 @@
+"""
+Incrementally maintained revenue rollups.
+
+Every order adds its montant to one hourly, one daily and one monthly bucket
+document in 'revenus_agreges' with firestore.Increment, in the same batch as
+the order itself. The buckets are those of the order's dateCreation, which
+create_order sets explicitly (not SERVER_TIMESTAMP) so that a cancellation
+later finds the same buckets. Cancelling reverses the order in a transaction
+that re-reads its 'revenue_counted' flag, so concurrent cancellations
+subtract it only once.
+Revenue reads then cost one document per bucket instead of one per order.
+
+backfill_revenue_rollups recounts the buckets; see recount_hour() for how
+it stays consistent with live orders.
+"""
+from datetime import datetime, timedelta, timezone, date
+from typing import Dict, Iterable, List, Optional, Tuple
+from firebase_admin import firestore
+import logging
+
+logger = logging.getLogger(__name__)
+
+ROLLUP_COLLECTION = 'revenus_agreges'
+CANCELLED_STATES = ('annule', 'annulee', 'cancelled')
+GRANULARITIES = ('hour', 'day', 'month')
+
+
+def to_utc(value) -> datetime:
+    """Firestore timestamps are timezone aware, naive datetimes are taken as UTC (settings.TIME_ZONE)"""
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
+
+
+def bucket_keys(moment: datetime) -> Dict[str, str]:
+    moment = to_utc(moment)
+    return {
+        'hour': moment.strftime('%Y-%m-%dT%H'),
+        'day': moment.strftime('%Y-%m-%d'),
+        'month': moment.strftime('%Y-%m'),
+    }
+
+
+def bucket_start(granularity: str, key: str) -> datetime:
+    formats = {'hour': '%Y-%m-%dT%H', 'day': '%Y-%m-%d', 'month': '%Y-%m'}
+    return datetime.strptime(key, formats[granularity]).replace(tzinfo=timezone.utc)
+
+
+def bucket_doc_id(granularity: str, key: str) -> str:
+    return f"{granularity}_{key}"
+
+
+def _add_to_buckets(batch, db, moment: datetime, montant: float, orders: int) -> None:
+    for granularity, key in bucket_keys(moment).items():
+        ref = db.collection(ROLLUP_COLLECTION).document(bucket_doc_id(granularity, key))
+        batch.set(ref, {
+            'granularite': granularity,
+            'periode': key,
+            'debut': bucket_start(granularity, key),
+            'montant': firestore.Increment(montant),
+            'commandes': firestore.Increment(orders),
+            'updated_at': firestore.SERVER_TIMESTAMP
+        }, merge=True)
+
+
+def record_order(batch, db, montant: float, created_at: datetime) -> None:
+    """
+    Add a new order to the rollups. The order document written in the same batch
+    must carry 'revenue_counted': True and created_at as its dateCreation.
+    """
+    _add_to_buckets(batch, db, created_at, float(montant or 0), 1)
+
+
+def reverse_order(db, order_ref) -> bool:
+    """
+    Subtract a cancelled order from the rollups it was counted in, in a
+    transaction that re-reads the order's flag (run it after the cancellation).
+    Returns False (and writes nothing) when the order was never counted or already reversed.
+    """
+    @firestore.transactional
+    def reverse(transaction):
+        snapshot = order_ref.get(transaction=transaction)
+        order_data = snapshot.to_dict() if snapshot.exists else {}
+        if not order_data.get('revenue_counted') or not order_data.get('dateCreation'):
+            return False
+        _add_to_buckets(transaction, db, order_data['dateCreation'], -float(order_data.get('montant', 0) or 0), -1)
+        transaction.update(order_ref, {'revenue_counted': False})
+        return True
+
+    try:
+        return reverse(db.transaction())
+    except Exception as e:
+        # The order stays counted until backfill_revenue_rollups
+        logger.error(f"Failed to reverse revenue of order {order_ref.id}: {str(e)}")
+        return False
+
+
+# ======================
+# Recount (backfill_revenue_rollups)
+# ======================
+
+def is_counted(order_data: Dict) -> bool:
+    """Whether an order belongs in the rollups: dated and not cancelled"""
+    return bool(order_data.get('dateCreation')) and order_data.get('etat') not in CANCELLED_STATES
+
+
+def _bucket_doc(granularity: str, key: str, montant: float, orders: int) -> Dict:
+    return {
+        'granularite': granularity,
+        'periode': key,
+        'debut': bucket_start(granularity, key),
+        'montant': round(montant, 2),
+        'commandes': orders,
+        'updated_at': firestore.SERVER_TIMESTAMP
+    }
+
+
+def recount_hour(db, key: str, order_refs: List) -> Dict:
+    """
+    Recompute an hourly bucket from its orders and set the orders' flags, in one
+    transaction. order_refs are the orders of the hour found by the caller's scan;
+    orders created since are found by a query on dateCreation. The transaction
+    reads the bucket first: a live order of this hour writes the bucket in its
+    batch, so it either commits before (and is seen by the query) or waits and
+    increments the recounted value.
+    """
+    start = bucket_start('hour', key)
+    end = start + timedelta(hours=1)
+    bucket_ref = db.collection(ROLLUP_COLLECTION).document(bucket_doc_id('hour', key))
+
+    @firestore.transactional
+    def recount(transaction):
+        bucket_ref.get(transaction=transaction)
+        orders = {doc.id: doc for doc in db.get_all(order_refs, transaction=transaction) if doc.exists}
+        query = db.collection('commandes').where('dateCreation', '>=', start).where('dateCreation', '<', end)
+        for doc in transaction.get(query):
+            orders.setdefault(doc.id, doc)
+
+        montant, count = 0.0, 0
+        for doc in orders.values():
+            data = doc.to_dict()
+            counted = is_counted(data) and bucket_keys(data['dateCreation'])['hour'] == key
+            if counted:
+                montant += float(data.get('montant', 0) or 0)
+                count += 1
+            if bool(data.get('revenue_counted')) != counted:
+                transaction.update(doc.reference, {'revenue_counted': counted})
+        transaction.set(bucket_ref, _bucket_doc('hour', key, montant, count))
+        return {'montant': round(montant, 2), 'commandes': count}
+
+    return recount(db.transaction())
+
+
+def _hours_of(granularity: str, key: str) -> List[str]:
+    start = bucket_start(granularity, key)
+    if granularity == 'day':
+        end = start + timedelta(days=1)
+    else:
+        end = (start.replace(day=28) + timedelta(days=4)).replace(day=1)
+    hours = int((end - start).total_seconds() // 3600)
+    return [(start + timedelta(hours=i)).strftime('%Y-%m-%dT%H') for i in range(hours)]
+
+
+def recount_from_hours(db, granularity: str, key: str) -> Dict:
+    """
+    Set a daily or monthly bucket to the sum of its hourly buckets, in a
+    transaction reading them (live orders write the hour and the day / month
+    together, so they are serialized with it). Run after recount_hour.
+    """
+    refs = [db.collection(ROLLUP_COLLECTION).document(bucket_doc_id('hour', hour))
+            for hour in _hours_of(granularity, key)]
+    bucket_ref = db.collection(ROLLUP_COLLECTION).document(bucket_doc_id(granularity, key))
+
+    @firestore.transactional
+    def recount(transaction):
+        bucket_ref.get(transaction=transaction)
+        montant, count = 0.0, 0
+        for doc in db.get_all(refs, transaction=transaction):
+            if doc.exists:
+                montant += doc.to_dict().get('montant', 0) or 0
+                count += doc.to_dict().get('commandes', 0) or 0
+        transaction.set(bucket_ref, _bucket_doc(granularity, key, montant, count))
+        return {'montant': round(montant, 2), 'commandes': count}
+
+    return recount(db.transaction())
+
+
+# ======================
+# Reads
+# ======================
+
+def read_buckets(db, granularity: str, keys: Iterable[str]) -> Dict[str, Optional[Dict]]:
+    """Fetch bucket documents in one batched read. Missing buckets map to None."""
+    keys = list(keys)
+    refs = [db.collection(ROLLUP_COLLECTION).document(bucket_doc_id(granularity, key)) for key in keys]
+    found = {doc.id: doc.to_dict() for doc in db.get_all(refs) if doc.exists}
+    result = {}
+    for key in keys:
+        data = found.get(bucket_doc_id(granularity, key))
+        result[key] = {'montant': data.get('montant', 0), 'commandes': data.get('commandes', 0)} if data else None
+    return result
+
+
+def day_keys(start: date, end: date) -> List[str]:
+    """Day keys from start to end inclusive"""
+    return [(start + timedelta(days=i)).strftime('%Y-%m-%d') for i in range((end - start).days + 1)]
+
+
+def plan_range(start: date, end: date) -> List[Tuple[str, str]]:
+    """
+    Cover [start, end] with the fewest buckets: whole calendar months use their
+    monthly document, the partial months at both ends use daily documents.
+    """
+    plan = []
+    current = start
+    while current <= end:
+        if current.day == 1:
+            next_month = (current.replace(day=28) + timedelta(days=4)).replace(day=1)
+            if next_month - timedelta(days=1) <= end:
+                plan.append(('month', current.strftime('%Y-%m')))
+                current = next_month
+                continue
+        plan.append(('day', current.strftime('%Y-%m-%d')))
+        current += timedelta(days=1)
+    return plan
+
+
+def revenue_for_range(db, start: date, end: date) -> Dict:
+    """Total revenue and order count between two dates (inclusive) from the rollups"""
+    plan = plan_range(start, end)
+    totals = {'montant': 0, 'commandes': 0, 'buckets_lus': len(plan)}
+    for granularity in ('month', 'day'):
+        keys = [key for g, key in plan if g == granularity]
+        if not keys:
+            continue
+        for key, bucket in read_buckets(db, granularity, keys).items():
+            if bucket is None:
+                # No bucket: no order in that period
+                continue
+            totals['montant'] += bucket['montant']
+            totals['commandes'] += bucket['commandes']
+    return totals
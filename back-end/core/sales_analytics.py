@@ -0,0 +1,272 @@
+"""
+Columnar sales analytics over the order history.
+
+Orders ('commandes') and their line items ('commandes_plat' and the seed
+'commande_plat') are kept in memory as numpy columns: one row per order
+(timestamp, montant, hour, weekday, cancelled) and one row per line item
+(order row, dish index, quantity). Aggregates are vectorised group-bys
+(np.bincount / np.unique) over those columns.
+
+The cache refreshes incrementally: only orders created after the last one
+seen are fetched, and their line items are fetched with 'in' queries.
+A full reload every FULL_RELOAD_INTERVAL picks up state changes
+(cancellations) of older orders.
+"""
+from datetime import date, datetime, time as dt_time, timedelta, timezone
+from typing import Dict, List, Optional
+from core.catalog import catalog
+from core.firebase_utils import firebase_config
+from core.orders_utils import LINE_ITEM_COLLECTIONS, iter_order_lines
+from core.revenue_rollups import CANCELLED_STATES, to_utc
+import logging
+import numpy as np
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+WEEKDAYS = ['Lundi', 'Mardi', 'Mercredi', 'Jeudi', 'Vendredi', 'Samedi', 'Dimanche']
+
+
+class SalesAnalytics:
+    """In-memory columnar cache of orders and line items"""
+
+    REFRESH_INTERVAL = 60
+    FULL_RELOAD_INTERVAL = 3600
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._last_refresh = 0.0
+        self._last_full_reload = 0.0
+        self._watermark: Optional[datetime] = None
+        self._reset()
+
+    def _reset(self) -> None:
+        self.order_ids: List[str] = []
+        self.order_position: Dict[str, int] = {}
+        self.timestamps = np.zeros(0, dtype=np.float64)
+        self.amounts = np.zeros(0, dtype=np.float64)
+        self.cancelled = np.zeros(0, dtype=bool)
+        self.hours = np.zeros(0, dtype=np.int8)
+        self.weekdays = np.zeros(0, dtype=np.int8)
+        self.dish_ids: List[str] = []
+        self.dish_index: Dict[str, int] = {}
+        self.line_orders = np.zeros(0, dtype=np.int64)
+        self.line_dishes = np.zeros(0, dtype=np.int64)
+        self.line_quantities = np.zeros(0, dtype=np.int64)
+
+    # ======================
+    # Loading
+    # ======================
+    def _dish(self, dish_id: str) -> int:
+        index = self.dish_index.get(dish_id)
+        if index is None:
+            index = len(self.dish_ids)
+            self.dish_index[dish_id] = index
+            self.dish_ids.append(dish_id)
+        return index
+
+    def _append_orders(self, docs) -> List[str]:
+        new_ids, timestamps, amounts, cancelled = [], [], [], []
+        for doc in docs:
+            data = doc.to_dict()
+            if doc.id in self.order_position or not data.get('dateCreation'):
+                continue
+            try:
+                created = to_utc(data['dateCreation'])
+            except (TypeError, ValueError):
+                continue
+            self.order_position[doc.id] = len(self.order_ids) + len(new_ids)
+            new_ids.append(doc.id)
+            timestamps.append(created.timestamp())
+            try:
+                amounts.append(float(data.get('montant', 0) or 0))
+            except (TypeError, ValueError):
+                amounts.append(0.0)
+            cancelled.append(data.get('etat') in CANCELLED_STATES)
+            if self._watermark is None or created > self._watermark:
+                self._watermark = created
+
+        if new_ids:
+            stamps = np.array(timestamps, dtype=np.float64)
+            moments = stamps.astype('datetime64[s]')
+            days = moments.astype('datetime64[D]')
+            self.order_ids.extend(new_ids)
+            self.timestamps = np.concatenate([self.timestamps, stamps])
+            self.amounts = np.concatenate([self.amounts, np.array(amounts, dtype=np.float64)])
+            self.cancelled = np.concatenate([self.cancelled, np.array(cancelled, dtype=bool)])
+            self.hours = np.concatenate([self.hours, ((moments - days).astype(np.int64) // 3600).astype(np.int8)])
+            # 1970-01-01 was a Thursday (weekday 3)
+            self.weekdays = np.concatenate([self.weekdays, ((days.astype(np.int64) + 3) % 7).astype(np.int8)])
+        return new_ids
+
+    def _append_lines(self, docs) -> None:
+        orders, dishes, quantities = [], [], []
+        for doc in docs:
+            line = doc.to_dict()
+            row = self.order_position.get(line.get('idCmd'))
+            if row is None or not line.get('idP'):
+                continue
+            try:
+                quantity = int(line.get('quantité', line.get('quantite', 1)) or 1)
+            except (TypeError, ValueError):
+                quantity = 1
+            orders.append(row)
+            dishes.append(self._dish(str(line['idP'])))
+            quantities.append(quantity)
+
+        if orders:
+            self.line_orders = np.concatenate([self.line_orders, np.array(orders, dtype=np.int64)])
+            self.line_dishes = np.concatenate([self.line_dishes, np.array(dishes, dtype=np.int64)])
+            self.line_quantities = np.concatenate([self.line_quantities, np.array(quantities, dtype=np.int64)])
+
+    def _full_reload(self, db) -> None:
+        self._reset()
+        self._watermark = None
+        self._append_orders(db.collection('commandes').stream())
+        for collection in LINE_ITEM_COLLECTIONS:
+            self._append_lines(db.collection(collection).stream())
+        self._last_full_reload = time.time()
+        logger.info(f"Sales analytics loaded: {len(self.order_ids)} orders, {len(self.line_orders)} lines")
+
+    def _incremental(self, db) -> None:
+        if self._watermark is None:
+            return self._full_reload(db)
+        query = db.collection('commandes').where('dateCreation', '>', self._watermark).order_by('dateCreation')
+        new_ids = self._append_orders(query.stream())
+        self._append_lines(iter_order_lines(db, new_ids))
+
+    def refresh(self, force: bool = False) -> None:
+        now = time.time()
+        if not force and now - self._last_refresh < self.REFRESH_INTERVAL:
+            return
+        with self._lock:
+            if not force and now - self._last_refresh < self.REFRESH_INTERVAL:
+                return
+            try:
+                db = firebase_config.get_db()
+                if force or not self.order_ids or now - self._last_full_reload >= self.FULL_RELOAD_INTERVAL:
+                    self._full_reload(db)
+                else:
+                    self._incremental(db)
+            except Exception as e:
+                logger.error(f"Error refreshing sales analytics: {str(e)}")
+            self._last_refresh = now
+
+    def mark_cancelled(self, order_id: str) -> None:
+        """Exclude an order cancelled since it was loaded"""
+        row = self.order_position.get(order_id)
+        if row is not None:
+            self.cancelled[row] = True
+
+    # ======================
+    # Aggregates
+    # ======================
+    def _order_mask(self, start: Optional[date], end: Optional[date]) -> np.ndarray:
+        """Valid (not cancelled) orders created between start and end (inclusive)"""
+        mask = ~self.cancelled
+        if start:
+            since = datetime.combine(start, dt_time.min, tzinfo=timezone.utc).timestamp()
+            mask &= self.timestamps >= since
+        if end:
+            until = datetime.combine(end + timedelta(days=1), dt_time.min, tzinfo=timezone.utc).timestamp()
+            mask &= self.timestamps < until
+        return mask
+
+    def best_sellers(self, start=None, end=None, limit: int = 10) -> List[Dict]:
+        self.refresh()
+        with self._lock:
+            orders = self._order_mask(start, end)
+            lines = orders[self.line_orders]
+            size = len(self.dish_ids)
+            if not size:
+                return []
+            quantities = np.bincount(self.line_dishes[lines], weights=self.line_quantities[lines], minlength=size)
+            # Distinct (order, dish) pairs: orders containing the dish at least once
+            pairs = np.unique(self.line_orders[lines] * size + self.line_dishes[lines])
+            order_counts = np.bincount(pairs % size, minlength=size)
+
+            snapshot = catalog.snapshot()
+            prices = np.array([float(snapshot.plats.get(d, {}).get('prix', 0) or 0) for d in self.dish_ids])
+            revenue = quantities * prices
+            ranking = np.argsort(-quantities, kind='stable')[:limit]
+            return [{
+                'plat_id': self.dish_ids[i],
+                'nom': snapshot.plats.get(self.dish_ids[i], {}).get('nom', 'Unknown'),
+                'quantite_vendue': int(quantities[i]),
+                'commandes': int(order_counts[i]),
+                'chiffre_affaires_estime': round(float(revenue[i]), 2)
+            } for i in ranking if quantities[i] > 0]
+
+    def hourly_heatmap(self, start=None, end=None) -> Dict:
+        """Orders and revenue per weekday (rows, Monday first) and hour of day (columns), in UTC"""
+        self.refresh()
+        with self._lock:
+            orders = self._order_mask(start, end)
+            cells = self.weekdays[orders].astype(np.int64) * 24 + self.hours[orders]
+            counts = np.bincount(cells, minlength=7 * 24).reshape(7, 24)
+            revenue = np.bincount(cells, weights=self.amounts[orders], minlength=7 * 24).reshape(7, 24)
+            return {
+                'jours': WEEKDAYS,
+                'heures': list(range(24)),
+                'commandes': counts.tolist(),
+                'chiffre_affaires': np.round(revenue, 2).tolist(),
+                'heure_pointe': int(counts.sum(axis=0).argmax()) if counts.any() else None
+            }
+
+    def average_ticket(self, start=None, end=None) -> Dict:
+        self.refresh()
+        with self._lock:
+            orders = self._order_mask(start, end)
+            amounts = self.amounts[orders]
+            lines = orders[self.line_orders]
+            items_per_order = np.bincount(
+                self.line_orders[lines], weights=self.line_quantities[lines], minlength=len(self.order_ids)
+            )[orders]
+            if not len(amounts):
+                return {'commandes': 0, 'ticket_moyen': 0, 'ticket_median': 0, 'articles_par_commande': 0}
+            return {
+                'commandes': int(len(amounts)),
+                'chiffre_affaires': round(float(amounts.sum()), 2),
+                'ticket_moyen': round(float(amounts.mean()), 2),
+                'ticket_median': round(float(np.median(amounts)), 2),
+                'ticket_p90': round(float(np.percentile(amounts, 90)), 2),
+                'articles_par_commande': round(float(items_per_order.mean()), 2)
+            }
+
+    def attach_rates(self, dish_id: str, start=None, end=None, limit: int = 10) -> Dict:
+        """Share of the orders containing dish_id that also contain each other dish"""
+        self.refresh()
+        with self._lock:
+            anchor = self.dish_index.get(dish_id)
+            result = {'plat_id': dish_id, 'commandes_avec_plat': 0, 'associations': []}
+            if anchor is None:
+                return result
+
+            orders = self._order_mask(start, end)
+            lines = orders[self.line_orders]
+            with_anchor = np.zeros(len(self.order_ids), dtype=bool)
+            with_anchor[self.line_orders[lines & (self.line_dishes == anchor)]] = True
+            anchor_orders = int(with_anchor.sum())
+            result['commandes_avec_plat'] = anchor_orders
+            if not anchor_orders:
+                return result
+
+            size = len(self.dish_ids)
+            companions = lines & with_anchor[self.line_orders] & (self.line_dishes != anchor)
+            pairs = np.unique(self.line_orders[companions] * size + self.line_dishes[companions])
+            counts = np.bincount(pairs % size, minlength=size)
+            ranking = np.argsort(-counts, kind='stable')[:limit]
+
+            snapshot = catalog.snapshot()
+            result['associations'] = [{
+                'plat_id': self.dish_ids[i],
+                'nom': snapshot.plats.get(self.dish_ids[i], {}).get('nom', 'Unknown'),
+                'commandes': int(counts[i]),
+                'taux': round(float(counts[i]) / anchor_orders, 4)
+            } for i in ranking if counts[i] > 0]
+            return result
+
+
+# Singleton instance
+sales_analytics = SalesAnalytics()
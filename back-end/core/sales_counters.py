@@ -0,0 +1,239 @@
+"""
+Per-dish sales counters.
+
+Every order increments, for each dish it contains, an all-time, a monthly
+and a daily counter document in 'ventes_plats' (units sold and revenue at
+list price) with firestore.Increment, in the order-creation batch, on the
+periods of the order's dateCreation (as core.revenue_rollups). Cancelling
+reverses them in a transaction that re-reads the order's 'sales_counted'
+flag, so the reversal happens at most once. A leaderboard for a period then
+reads counter documents only (whole months through their monthly documents).
+
+backfill_sales_counters recounts the counters period by period in
+transactions, like the revenue rollups (see recount_day()).
+"""
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, List, Optional
+from firebase_admin import firestore
+from core.orders_utils import LINE_ITEM_COLLECTIONS, IN_QUERY_LIMIT
+from core.revenue_rollups import bucket_keys, bucket_start, is_counted, plan_range, to_utc
+import logging
+
+logger = logging.getLogger(__name__)
+
+SALES_COLLECTION = 'ventes_plats'
+TOTAL_PERIOD = 'total'
+# Firestore limit of a batch or transaction
+MAX_BATCH_WRITES = 500
+
+
+def order_batch_writes(item_count: int, distinct_dishes: int) -> int:
+    """Writes of an order-creation batch: the order, its items, 3 revenue buckets and 3 counters per dish"""
+    return 1 + item_count + 3 + 3 * distinct_dishes
+
+
+def counter_doc_id(period: str, plat_id: str) -> str:
+    return f"{period}_{plat_id}"
+
+
+def _periods(moment: datetime) -> Dict[str, str]:
+    keys = bucket_keys(moment)
+    return {'total': TOTAL_PERIOD, 'month': keys['month'], 'day': keys['day']}
+
+
+def _add_to_counters(batch, db, moment: datetime, lines: Dict[str, Dict], sign: int) -> None:
+    for granularity, period in _periods(moment).items():
+        for plat_id, values in lines.items():
+            ref = db.collection(SALES_COLLECTION).document(counter_doc_id(period, plat_id))
+            batch.set(ref, {
+                'idP': plat_id,
+                'granularite': granularity,
+                'periode': period,
+                'quantite': firestore.Increment(sign * values['quantite']),
+                'chiffre_affaires': firestore.Increment(sign * values['chiffre_affaires']),
+                'updated_at': firestore.SERVER_TIMESTAMP
+            }, merge=True)
+
+
+def _counter_doc(granularity: str, period: str, plat_id: str, values: Dict) -> Dict:
+    return {
+        'idP': plat_id,
+        'granularite': granularity,
+        'periode': period,
+        'quantite': values['quantite'],
+        'chiffre_affaires': round(values['chiffre_affaires'], 2),
+        'updated_at': firestore.SERVER_TIMESTAMP
+    }
+
+
+def _group(items: Iterable[Dict]) -> Dict[str, Dict]:
+    """[{plat_id, quantity, prix}] -> {plat_id: {quantite, chiffre_affaires}} (several lines of the same dish merge)"""
+    grouped = defaultdict(lambda: {'quantite': 0, 'chiffre_affaires': 0.0})
+    for item in items:
+        quantity = int(item.get('quantity', 0) or 0)
+        grouped[item['plat_id']]['quantite'] += quantity
+        grouped[item['plat_id']]['chiffre_affaires'] += quantity * float(item.get('prix', 0) or 0)
+    return dict(grouped)
+
+
+def record_order(batch, db, items: Iterable[Dict], created_at: datetime) -> None:
+    """
+    Add an order's items to the counters. The order document written in the
+    same batch must carry 'sales_counted': True and created_at as its dateCreation.
+    """
+    _add_to_counters(batch, db, created_at, _group(items), 1)
+
+
+def _line_item(line: Dict) -> Dict:
+    return {
+        'plat_id': line.get('idP'),
+        'quantity': line.get('quantité', line.get('quantite', 1)),
+        'prix': line.get('prix_unitaire', 0)
+    }
+
+
+def order_items(db, order_ids: Iterable[str]) -> Dict[str, List[Dict]]:
+    """Order id -> its line items [{plat_id, quantity, prix}], IN_QUERY_LIMIT orders per query"""
+    order_ids = list(order_ids)
+    items = defaultdict(list)
+    for offset in range(0, len(order_ids), IN_QUERY_LIMIT):
+        chunk = order_ids[offset:offset + IN_QUERY_LIMIT]
+        for collection in LINE_ITEM_COLLECTIONS:
+            for doc in db.collection(collection).where('idCmd', 'in', chunk).stream():
+                line = doc.to_dict()
+                if line.get('idP'):
+                    items[line['idCmd']].append(_line_item(line))
+    return items
+
+
+def reverse_order(db, order_ref) -> bool:
+    """
+    Subtract a cancelled order's items from the counters, in a transaction that
+    re-reads the order's flag (run it after the cancellation).
+    Returns False (and writes nothing) when the order was never counted or already reversed.
+    """
+    # Line items never change once the order is written
+    items = order_items(db, [order_ref.id]).get(order_ref.id, [])
+
+    @firestore.transactional
+    def reverse(transaction):
+        snapshot = order_ref.get(transaction=transaction)
+        order_data = snapshot.to_dict() if snapshot.exists else {}
+        if not order_data.get('sales_counted') or not order_data.get('dateCreation'):
+            return False
+        _add_to_counters(transaction, db, to_utc(order_data['dateCreation']), _group(items), -1)
+        transaction.update(order_ref, {'sales_counted': False})
+        return True
+
+    try:
+        return reverse(db.transaction())
+    except Exception as e:
+        # The order stays counted until backfill_sales_counters
+        logger.error(f"Failed to reverse sales counters of order {order_ref.id}: {str(e)}")
+        return False
+
+
+# ======================
+# Recount (backfill_sales_counters)
+# ======================
+
+def recount_day(db, day: str, order_refs: List, plat_ids: Iterable[str],
+                items_by_order: Dict[str, List[Dict]]) -> int:
+    """
+    Recompute the daily counters of plat_ids from the orders of the day and set
+    the orders' flags, in one transaction. order_refs / items_by_order come from
+    the caller's scan; orders created since are found by a query on dateCreation.
+    The counters are read first: a live order writes them in its batch, so it
+    either commits before (and is seen by the query) or waits and increments the
+    recounted values. A dish outside plat_ids only has counters from live orders
+    and is left as is. Returns the number of counters written.
+    """
+    start = bucket_start('day', day)
+    refs = {plat_id: db.collection(SALES_COLLECTION).document(counter_doc_id(day, plat_id)) for plat_id in plat_ids}
+
+    @firestore.transactional
+    def recount(transaction):
+        list(db.get_all(list(refs.values()), transaction=transaction))
+        orders = {doc.id: doc for doc in db.get_all(order_refs, transaction=transaction) if doc.exists}
+        query = db.collection('commandes')\
+            .where('dateCreation', '>=', start).where('dateCreation', '<', start + timedelta(days=1))
+        for doc in transaction.get(query):
+            orders.setdefault(doc.id, doc)
+
+        missing = [order_id for order_id in orders if order_id not in items_by_order]
+        items = dict(items_by_order, **order_items(db, missing)) if missing else items_by_order
+        totals = defaultdict(lambda: {'quantite': 0, 'chiffre_affaires': 0.0})
+        for order_id, doc in orders.items():
+            data = doc.to_dict()
+            counted = is_counted(data) and bucket_keys(data['dateCreation'])['day'] == day
+            if counted:
+                for plat_id, values in _group(items.get(order_id, [])).items():
+                    totals[plat_id]['quantite'] += values['quantite']
+                    totals[plat_id]['chiffre_affaires'] += values['chiffre_affaires']
+            if bool(data.get('sales_counted')) != counted:
+                transaction.update(doc.reference, {'sales_counted': counted})
+        for plat_id, ref in refs.items():
+            transaction.set(ref, _counter_doc('day', day, plat_id, totals[plat_id]))
+        return len(refs)
+
+    return recount(db.transaction())
+
+
+def recount_from(db, granularity: str, period: str, plat_id: str, parts: Iterable[str]) -> Dict:
+    """
+    Set a monthly (or all-time) counter of a dish to the sum of its daily (or
+    monthly) counters for the periods in parts, in a transaction reading them.
+    Run after the finer counters are recounted.
+    """
+    refs = [db.collection(SALES_COLLECTION).document(counter_doc_id(part, plat_id)) for part in parts]
+    ref = db.collection(SALES_COLLECTION).document(counter_doc_id(period, plat_id))
+
+    @firestore.transactional
+    def recount(transaction):
+        ref.get(transaction=transaction)
+        values = {'quantite': 0, 'chiffre_affaires': 0.0}
+        for doc in db.get_all(refs, transaction=transaction):
+            if doc.exists:
+                values['quantite'] += doc.to_dict().get('quantite', 0) or 0
+                values['chiffre_affaires'] += doc.to_dict().get('chiffre_affaires', 0) or 0
+        transaction.set(ref, _counter_doc(granularity, period, plat_id, values))
+        return values
+
+    return recount(db.transaction())
+
+
+# ======================
+# Reads
+# ======================
+
+def leaderboard(db, start: Optional[date] = None, end: Optional[date] = None,
+                limit: int = 10, order_by: str = 'quantite') -> List[Dict]:
+    """
+    Top dishes by units sold (or revenue) between start and end (inclusive),
+    or all time when no period is given.
+    """
+    totals = defaultdict(lambda: {'quantite': 0, 'chiffre_affaires': 0.0})
+    if start and end:
+        periods = [key for _, key in plan_range(start, end)]
+    else:
+        periods = [TOTAL_PERIOD]
+
+    for offset in range(0, len(periods), IN_QUERY_LIMIT):
+        chunk = periods[offset:offset + IN_QUERY_LIMIT]
+        for doc in db.collection(SALES_COLLECTION).where('periode', 'in', chunk).stream():
+            counter = doc.to_dict()
+            totals[counter['idP']]['quantite'] += counter.get('quantite', 0)
+            totals[counter['idP']]['chiffre_affaires'] += counter.get('chiffre_affaires', 0)
+
+    key = 'chiffre_affaires' if order_by == 'chiffre_affaires' else 'quantite'
+    ranked = sorted(
+        ((plat_id, values) for plat_id, values in totals.items() if values['quantite'] > 0),
+        key=lambda entry: entry[1][key],
+        reverse=True
+    )[:limit]
+    return [{
+        'plat_id': plat_id,
+        'quantite': values['quantite'],
+        'chiffre_affaires': round(values['chiffre_affaires'], 2)
+    } for plat_id, values in ranked]
@@ -0,0 +1,152 @@
+"""
+Full-text dish search over the catalog replica.
+
+Dish names, descriptions and ingredient names are accent-folded, stemmed with
+the nltk French Snowball stemmer and put in an inverted index ranked with BM25.
+The last word of a query is also matched as a prefix (type-ahead) through a
+sorted vocabulary and bisect. The index is rebuilt when the catalog version
+changes, so searching never reads Firestore.
+"""
+from bisect import bisect_left
+from collections import Counter, defaultdict
+from typing import Dict, List
+from nltk.stem.snowball import FrenchStemmer
+from core.catalog import catalog, CatalogSnapshot
+from core.text_utils import tokenize
+import math
+import time
+
+FRENCH_STOPWORDS = {
+    'a', 'au', 'aux', 'avec', 'ce', 'ces', 'd', 'dans', 'de', 'des', 'du', 'en', 'et', 'l', 'la', 'le',
+    'les', 'leur', 'ou', 'par', 'pour', 'sans', 'sur', 'un', 'une', 'votre', 'nos', 'notre', 'son', 'sa',
+    'ses', 'est', 'qui', 'que', 'se', 'y',
+}
+
+# Term frequency weight of each field
+FIELD_WEIGHTS = {'nom': 3, 'ingredients': 2, 'description': 1}
+
+_stemmer = FrenchStemmer()
+
+
+def analyze(text) -> List[str]:
+    """Folded, stop-word free, stemmed terms of a text"""
+    return [_stemmer.stem(word) for word in tokenize(text) if word not in FRENCH_STOPWORDS]
+
+
+class SearchIndex:
+    """BM25 inverted index for one catalog version"""
+
+    K1 = 1.2
+    B = 0.75
+
+    def __init__(self, snapshot: CatalogSnapshot):
+        self.dish_ids: List[str] = []
+        self.postings: Dict[str, Dict[int, float]] = defaultdict(dict)
+        self.doc_lengths: List[float] = []
+        surface_to_stem: Dict[str, str] = {}
+
+        for plat_id, plat in snapshot.plats.items():
+            doc = len(self.dish_ids)
+            self.dish_ids.append(plat_id)
+            fields = {
+                'nom': plat.get('nom', ''),
+                'description': plat.get('description', ''),
+                'ingredients': ' '.join(line['nom'] for line in snapshot.dish_ingredients(plat_id)),
+            }
+            frequencies = Counter()
+            for field_name, text in fields.items():
+                for word in tokenize(text):
+                    if word in FRENCH_STOPWORDS:
+                        continue
+                    stem = surface_to_stem.setdefault(word, _stemmer.stem(word))
+                    frequencies[stem] += FIELD_WEIGHTS[field_name]
+            for term, frequency in frequencies.items():
+                self.postings[term][doc] = frequency
+            self.doc_lengths.append(sum(frequencies.values()))
+
+        count = len(self.dish_ids)
+        self.average_length = (sum(self.doc_lengths) / count) if count else 0.0
+        self.idf = {
+            term: math.log(1 + (count - len(docs) + 0.5) / (len(docs) + 0.5))
+            for term, docs in self.postings.items()
+        }
+        # Sorted surface words for prefix lookups
+        self.vocabulary = sorted(surface_to_stem)
+        self.surface_to_stem = surface_to_stem
+
+    def _prefix_terms(self, prefix: str, limit: int = 50) -> List[str]:
+        terms = []
+        index = bisect_left(self.vocabulary, prefix)
+        while index < len(self.vocabulary) and self.vocabulary[index].startswith(prefix) and len(terms) < limit:
+            terms.append(self.surface_to_stem[self.vocabulary[index]])
+            index += 1
+        return terms
+
+    def search(self, query: str, limit: int = 20, prefix: bool = True) -> List[Dict]:
+        """Return [{'id', 'score'}] ranked by BM25, best first"""
+        words = [w for w in tokenize(query) if w not in FRENCH_STOPWORDS]
+        if not words or not self.dish_ids:
+            return []
+
+        # Every word must match; the last one may be an unfinished prefix
+        term_groups = [[_stemmer.stem(w)] for w in words]
+        if prefix and query and not query[-1].isspace():
+            term_groups[-1] = list(dict.fromkeys(term_groups[-1] + self._prefix_terms(words[-1])))
+
+        scores: Dict[int, float] = {}
+        matched_groups: Dict[int, int] = defaultdict(int)
+        for group in term_groups:
+            group_scores: Dict[int, float] = {}
+            for term in group:
+                docs = self.postings.get(term)
+                if not docs:
+                    continue
+                idf = self.idf[term]
+                for doc, frequency in docs.items():
+                    norm = self.K1 * (1 - self.B + self.B * self.doc_lengths[doc] / self.average_length)
+                    score = idf * frequency * (self.K1 + 1) / (frequency + norm)
+                    group_scores[doc] = max(group_scores.get(doc, 0.0), score)
+            for doc, score in group_scores.items():
+                scores[doc] = scores.get(doc, 0.0) + score
+                matched_groups[doc] += 1
+
+        required = len(term_groups)
+        ranked = sorted(
+            (doc for doc in scores if matched_groups[doc] == required),
+            key=lambda doc: scores[doc],
+            reverse=True
+        )[:max(limit, 0)]
+        return [{'id': self.dish_ids[doc], 'score': round(scores[doc], 4)} for doc in ranked]
+
+
+def get_search_index() -> SearchIndex:
+    """Search index for the current catalog version"""
+    return catalog.derived('search', SearchIndex)
+
+
+def search_dishes(query: str, limit: int = 20) -> Dict:
+    """Run a search and attach the dish data from the catalog replica"""
+    started = time.perf_counter()
+    snapshot = catalog.snapshot()
+    hits = get_search_index().search(query, limit=limit)
+
+    results = []
+    for hit in hits:
+        plat = snapshot.plats.get(hit['id'], {})
+        results.append({
+            'id': hit['id'],
+            'nom': plat.get('nom', ''),
+            'description': plat.get('description', ''),
+            'prix': plat.get('prix', 0),
+            'categorie': plat.get('idCat', ''),
+            'sous_categorie': plat.get('idSousCat', ''),
+            'note': plat.get('note', 0),
+            'image_url': plat.get('image_url', ''),
+            'score': hit['score']
+        })
+    return {
+        'query': query,
+        'count': len(results),
+        'results': results,
+        'took_ms': round((time.perf_counter() - started) * 1000, 3)
+    }
@@ -0,0 +1,159 @@
+"""
+Ingredient depletion forecast.
+
+commencer_commande logs every stock decrement in 'consommations_ingredients'
+(one event per ingredient per order, same batch as the decrement). The
+forecast turns the last WINDOW_DAYS of events into an ingredients x days
+matrix, takes moving-average burn rates per ingredient and divides the
+current stock by them, for every ingredient at once with numpy.
+"""
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional
+from firebase_admin import firestore
+from core.firebase_utils import firebase_config
+from core.revenue_rollups import to_utc
+import logging
+import numpy as np
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+CONSUMPTION_COLLECTION = 'consommations_ingredients'
+WINDOW_DAYS = 28
+SHORT_WINDOW_DAYS = 7
+CRITICAL_DAYS = 2
+LOW_DAYS = 7
+CACHE_TTL = 300
+
+
+def log_consumption(batch, db, order_id: str, ingredient_ref, nom: str, quantite: float) -> None:
+    """Add a consumption event to the batch that decrements the stock"""
+    now = datetime.now(timezone.utc)
+    batch.set(db.collection(CONSUMPTION_COLLECTION).document(), {
+        'idIng': ingredient_ref.id,
+        'nom': nom,
+        'quantite': float(quantite),
+        'idCmd': order_id,
+        'jour': now.strftime('%Y-%m-%d'),
+        'date': firestore.SERVER_TIMESTAMP
+    })
+
+
+class _BurnRates:
+    """Burn rates per ingredient id, recomputed at most every CACHE_TTL seconds"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._rates: Dict[str, Dict] = {}
+        self._loaded_at = 0.0
+
+    def invalidate(self) -> None:
+        self._loaded_at = 0.0
+
+    def get(self) -> Dict[str, Dict]:
+        if time.time() - self._loaded_at < CACHE_TTL:
+            return self._rates
+        with self._lock:
+            if time.time() - self._loaded_at < CACHE_TTL:
+                return self._rates
+            try:
+                self._rates = self._compute(firebase_config.get_db())
+                self._loaded_at = time.time()
+            except Exception as e:
+                logger.error(f"Error computing ingredient burn rates: {str(e)}")
+        return self._rates
+
+    @staticmethod
+    def _compute(db) -> Dict[str, Dict]:
+        today = datetime.now(timezone.utc).date()
+        first_day = today - timedelta(days=WINDOW_DAYS - 1)
+        since = datetime.combine(first_day, datetime.min.time(), tzinfo=timezone.utc)
+
+        ingredient_ids, rows, days, quantities = [], [], [], []
+        position = {}
+        for doc in db.collection(CONSUMPTION_COLLECTION).where('date', '>=', since).stream():
+            event = doc.to_dict()
+            if not event.get('date') or not event.get('idIng'):
+                continue
+            row = position.setdefault(event['idIng'], len(ingredient_ids))
+            if row == len(ingredient_ids):
+                ingredient_ids.append(event['idIng'])
+            rows.append(row)
+            days.append((to_utc(event['date']).date() - first_day).days)
+            quantities.append(float(event.get('quantite', 0) or 0))
+
+        if not ingredient_ids:
+            return {}
+
+        # ingredients x days consumption matrix
+        matrix = np.zeros((len(ingredient_ids), WINDOW_DAYS))
+        np.add.at(matrix, (np.array(rows), np.clip(np.array(days), 0, WINDOW_DAYS - 1)), np.array(quantities))
+
+        long_rate = matrix.mean(axis=1)
+        short_rate = matrix[:, -SHORT_WINDOW_DAYS:].mean(axis=1)
+        # Recent trend when there is one, otherwise the whole window
+        burn = np.where(short_rate > 0, short_rate, long_rate)
+        return {
+            ingredient_id: {
+                'consommation_journaliere': float(burn[i]),
+                'consommation_7j': float(matrix[i, -SHORT_WINDOW_DAYS:].sum()),
+                'consommation_28j': float(matrix[i].sum())
+            }
+            for i, ingredient_id in enumerate(ingredient_ids)
+        }
+
+
+burn_rates = _BurnRates()
+
+
+def forecast(db=None, ingredients: Optional[List[Dict]] = None) -> List[Dict]:
+    """
+    Days until depletion of every ingredient, most urgent first.
+    statut: 'rupture' (empty), 'critique' (<= CRITICAL_DAYS), 'bas' (<= LOW_DAYS), 'ok'.
+    Ingredients with no recorded consumption fall back to their seuil_alerte.
+    """
+    if ingredients is None:
+        db = db or firebase_config.get_db()
+        ingredients = []
+        for doc in db.collection('ingredients').stream():
+            data = doc.to_dict()
+            data['id'] = doc.id
+            ingredients.append(data)
+    if not ingredients:
+        return []
+
+    rates = burn_rates.get()
+    stock = np.array([float(i.get('quantite', 0) or 0) for i in ingredients])
+    thresholds = np.array([float(i.get('seuil_alerte', 0) or 0) for i in ingredients])
+    burn = np.array([rates.get(i['id'], {}).get('consommation_journaliere', 0.0) for i in ingredients])
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        days_left = np.where(burn > 0, np.maximum(stock, 0) / burn, np.inf)
+
+    statuses = np.full(len(ingredients), 'ok', dtype=object)
+    statuses[(burn == 0) & (stock <= thresholds)] = 'bas'
+    statuses[days_left <= LOW_DAYS] = 'bas'
+    statuses[days_left <= CRITICAL_DAYS] = 'critique'
+    statuses[stock <= 0] = 'rupture'
+
+    today = datetime.now(timezone.utc).date()
+    result = []
+    for i, ingredient in enumerate(ingredients):
+        finite = bool(np.isfinite(days_left[i]))
+        result.append({
+            'id': ingredient['id'],
+            'nom': ingredient.get('nom', 'Unknown'),
+            'categorie': ingredient.get('categorie', 'Unknown'),
+            'unite': ingredient.get('unite', ''),
+            'quantite_actuelle': float(stock[i]),
+            'seuil_alerte': float(thresholds[i]),
+            'consommation_journaliere': round(float(burn[i]), 3),
+            'jours_restants': round(float(days_left[i]), 1) if finite else None,
+            'date_rupture_estimee': (today + timedelta(days=int(days_left[i]))).isoformat() if finite else None,
+            'statut': statuses[i]
+        })
+
+    urgency = {'rupture': 0, 'critique': 1, 'bas': 2, 'ok': 3}
+    result.sort(key=lambda r: (urgency[r['statut']], r['jours_restants'] if r['jours_restants'] is not None else float('inf')))
+    return result
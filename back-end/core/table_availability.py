@@ -0,0 +1,244 @@
+"""
+Table availability by time slot.
+
+Each table keeps the time intervals of its active reservations sorted by
+start, with a running maximum of their ends: "is the table free between t1
+and t2" is one bisect. Tables are kept sorted by capacity, so the best-fit
+table for a party (smallest one that is large enough) is found by bisect too.
+
+The index is built from 'reservations' and 'tables' and kept current by
+Firestore listeners. Writes made by this process are also applied directly
+(apply_reservation) so they are visible before the listener fires. When the
+listeners cannot be started, the index is rebuilt every RELOAD_INTERVAL.
+"""
+from bisect import bisect_left, insort
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
+from core.firebase_utils import firebase_config
+from core.reservation_index import parse_slot, to_utc
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+RESERVATION_DURATION = timedelta(hours=2)
+ACTIVE_STATUSES = ('en_attente', 'pending', 'confirmed', 'confirmee', 'seated')
+# Reservations that ended before now - HISTORY are not loaded
+HISTORY = timedelta(days=1)
+
+
+class _TableSlots:
+    """Sorted reservation intervals of one table"""
+
+    __slots__ = ('starts', 'intervals', 'max_ends')
+
+    def __init__(self):
+        self.starts: List[float] = []
+        self.intervals: List[Tuple[float, float, str]] = []
+        self.max_ends: List[float] = []
+
+    def _reindex(self) -> None:
+        self.starts = [interval[0] for interval in self.intervals]
+        running, self.max_ends = float('-inf'), []
+        for _, end, _ in self.intervals:
+            running = max(running, end)
+            self.max_ends.append(running)
+
+    def add(self, start: float, end: float, reservation_id: str) -> None:
+        insort(self.intervals, (start, end, reservation_id))
+        self._reindex()
+
+    def remove(self, start: float, end: float, reservation_id: str) -> None:
+        index = bisect_left(self.intervals, (start, end, reservation_id))
+        if index < len(self.intervals) and self.intervals[index] == (start, end, reservation_id):
+            del self.intervals[index]
+            self._reindex()
+
+    def is_free(self, start: float, end: float) -> bool:
+        # Intervals starting before `end`; one of them overlaps iff the largest of their ends is after `start`
+        index = bisect_left(self.starts, end)
+        return index == 0 or self.max_ends[index - 1] <= start
+
+    def overlapping(self, start: float, end: float) -> List[str]:
+        index = bisect_left(self.starts, end)
+        return [rid for s, e, rid in self.intervals[:index] if e > start]
+
+
+class TableAvailability:
+    """In-memory reservation slots of every table"""
+
+    RELOAD_INTERVAL = 300
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._tables: Dict[str, Dict] = {}
+        self._by_capacity: List[Tuple[int, str]] = []
+        self._slots: Dict[str, _TableSlots] = {}
+        self._reservations: Dict[str, Tuple[str, float, float]] = {}
+        self._loaded_at = 0.0
+        self._listening = False
+        self._watches = []
+
+    # ======================
+    # Loading
+    # ======================
+    @staticmethod
+    def reservation_interval(data: Dict) -> Optional[Tuple[str, float, float]]:
+        """(table_id, start, end) of an active reservation, None otherwise"""
+        if data.get('status') not in ACTIVE_STATUSES or not data.get('table_id'):
+            return None
+        try:
+            start = data['slot_start'] if data.get('slot_start') else parse_slot(data.get('date_time', ''))
+        except (KeyError, ValueError):
+            return None
+        start = to_utc(start)
+        duration = timedelta(minutes=int(data.get('duree_minutes', 0) or 0)) or RESERVATION_DURATION
+        return data['table_id'], start.timestamp(), (start + duration).timestamp()
+
+    def _set_table(self, table_id: str, data: Optional[Dict]) -> None:
+        old = self._tables.pop(table_id, None)
+        if old is not None:
+            index = bisect_left(self._by_capacity, (old['capacity'], table_id))
+            if index < len(self._by_capacity) and self._by_capacity[index] == (old['capacity'], table_id):
+                del self._by_capacity[index]
+        if data is None:
+            return
+        table = {
+            'id': table_id,
+            'number': data.get('number'),
+            'capacity': int(data.get('nbrPersonne', 0) or 0),
+            'type': data.get('type', 'Standard'),
+            'etatTable': data.get('etatTable', 'libre')
+        }
+        self._tables[table_id] = table
+        insort(self._by_capacity, (table['capacity'], table_id))
+
+    def _set_reservation(self, reservation_id: str, data: Optional[Dict]) -> None:
+        old = self._reservations.pop(reservation_id, None)
+        if old is not None:
+            self._slots[old[0]].remove(old[1], old[2], reservation_id)
+        interval = self.reservation_interval(data) if data else None
+        if interval is None:
+            return
+        table_id, start, end = interval
+        self._slots.setdefault(table_id, _TableSlots()).add(start, end, reservation_id)
+        self._reservations[reservation_id] = interval
+
+    def _reload(self, db) -> None:
+        with self._lock:
+            self._tables, self._by_capacity, self._slots, self._reservations = {}, [], {}, {}
+            for doc in db.collection('tables').stream():
+                self._set_table(doc.id, doc.to_dict())
+            since = datetime.now(timezone.utc) - HISTORY
+            for doc in db.collection('reservations').where('slot_start', '>=', since).stream():
+                self._set_reservation(doc.id, doc.to_dict())
+            self._loaded_at = time.time()
+
+    def _start_listeners(self, db) -> None:
+        def on_tables(snapshots, changes, read_time):
+            with self._lock:
+                for change in changes:
+                    removed = change.type.name == 'REMOVED'
+                    self._set_table(change.document.id, None if removed else change.document.to_dict())
+
+        def on_reservations(snapshots, changes, read_time):
+            with self._lock:
+                for change in changes:
+                    removed = change.type.name == 'REMOVED'
+                    self._set_reservation(change.document.id, None if removed else change.document.to_dict())
+
+        since = datetime.now(timezone.utc) - HISTORY
+        self._watches = [
+            db.collection('tables').on_snapshot(on_tables),
+            db.collection('reservations').where('slot_start', '>=', since).on_snapshot(on_reservations),
+        ]
+        self._listening = True
+
+    def _ensure_loaded(self) -> None:
+        if self._listening and self._loaded_at:
+            return
+        if time.time() - self._loaded_at < self.RELOAD_INTERVAL:
+            return
+        with self._lock:
+            if self._listening or time.time() - self._loaded_at < self.RELOAD_INTERVAL:
+                return
+            db = firebase_config.get_db()
+            self._reload(db)
+            try:
+                self._start_listeners(db)
+            except Exception as e:
+                logger.warning(f"Table availability listeners unavailable, polling instead: {str(e)}")
+
+    # ======================
+    # Public API
+    # ======================
+    def apply_reservation(self, reservation_id: str, data: Optional[Dict]) -> None:
+        """Register a reservation written by this process (None when deleted)"""
+        self._ensure_loaded()
+        with self._lock:
+            self._set_reservation(reservation_id, data)
+
+    def apply_table(self, table_id: str, data: Optional[Dict]) -> None:
+        self._ensure_loaded()
+        with self._lock:
+            self._set_table(table_id, data)
+
+    def _window(self, start: datetime, duration: Optional[timedelta]) -> Tuple[float, float]:
+        start = to_utc(start)
+        return start.timestamp(), (start + (duration or RESERVATION_DURATION)).timestamp()
+
+    def _busy_now(self, table: Dict, window_start: float, window_end: float) -> bool:
+        # A table occupied right now is not free for a slot that starts soon
+        now = time.time()
+        return table['etatTable'] == 'occupee' and window_start < now + RESERVATION_DURATION.total_seconds()
+
+    def is_free(self, table_id: str, start: datetime, duration: Optional[timedelta] = None) -> bool:
+        self._ensure_loaded()
+        window_start, window_end = self._window(start, duration)
+        with self._lock:
+            table = self._tables.get(table_id)
+            if table is None or self._busy_now(table, window_start, window_end):
+                return False
+            slots = self._slots.get(table_id)
+            return slots is None or slots.is_free(window_start, window_end)
+
+    def find_tables(self, start: datetime, party_size: int = 1, duration: Optional[timedelta] = None,
+                    limit: Optional[int] = None) -> List[Dict]:
+        """Free tables seating party_size for the whole slot, best fit (smallest capacity) first"""
+        self._ensure_loaded()
+        window_start, window_end = self._window(start, duration)
+        result = []
+        with self._lock:
+            for capacity, table_id in self._by_capacity[bisect_left(self._by_capacity, (party_size, '')):]:
+                table = self._tables[table_id]
+                if self._busy_now(table, window_start, window_end):
+                    continue
+                slots = self._slots.get(table_id)
+                if slots is None or slots.is_free(window_start, window_end):
+                    result.append(dict(table))
+                    if limit and len(result) >= limit:
+                        break
+        return result
+
+    def best_fit(self, start: datetime, party_size: int, duration: Optional[timedelta] = None) -> Optional[Dict]:
+        tables = self.find_tables(start, party_size, duration, limit=1)
+        return tables[0] if tables else None
+
+    def table_schedule(self, table_id: str, day_start: datetime, day_end: datetime) -> List[Dict]:
+        """Reservation intervals of a table overlapping [day_start, day_end)"""
+        self._ensure_loaded()
+        with self._lock:
+            slots = self._slots.get(table_id)
+            if slots is None:
+                return []
+            ids = slots.overlapping(day_start.timestamp(), day_end.timestamp())
+            return [{
+                'reservation_id': rid,
+                'debut': datetime.fromtimestamp(self._reservations[rid][1], tz=timezone.utc).isoformat(),
+                'fin': datetime.fromtimestamp(self._reservations[rid][2], tz=timezone.utc).isoformat()
+            } for rid in ids]
+
+
+# Singleton instance
+table_availability = TableAvailability()
@@ -1,3 +1,236 @@
-from django.test import TestCase
+from datetime import date, datetime, timedelta, timezone
+from django.test import SimpleTestCase, override_settings
+from core import catalog_bundle
+from core.catalog import CatalogSnapshot
+from core.catalog_bundle import CatalogBundle, HISTORY_SIZE
+from core.reservation_booking import slot_ids
+from core.revenue_rollups import plan_range
+from core.table_availability import _TableSlots
+import gzip
+import json
 
-# Create your tests here.
+
+class TableSlotsTests(SimpleTestCase):
+    """Interval index of one table (core.table_availability)"""
+
+    def slots(self, *intervals):
+        table = _TableSlots()
+        for interval in intervals:
+            table.add(*interval)
+        return table
+
+    def test_empty_table_is_free(self):
+        table = _TableSlots()
+        self.assertTrue(table.is_free(0, 100))
+        self.assertEqual(table.overlapping(0, 100), [])
+
+    def test_touching_intervals_do_not_overlap(self):
+        table = self.slots((10, 20, 'a'))
+        self.assertTrue(table.is_free(20, 30))
+        self.assertTrue(table.is_free(0, 10))
+        self.assertEqual(table.overlapping(20, 30), [])
+        self.assertEqual(table.overlapping(0, 10), [])
+
+    def test_partial_overlaps(self):
+        table = self.slots((10, 20, 'a'))
+        self.assertFalse(table.is_free(5, 11))
+        self.assertFalse(table.is_free(19, 25))
+        self.assertEqual(table.overlapping(19, 25), ['a'])
+
+    def test_contained_and_containing(self):
+        table = self.slots((10, 20, 'a'))
+        self.assertFalse(table.is_free(12, 15))
+        self.assertFalse(table.is_free(0, 100))
+        self.assertEqual(table.overlapping(0, 100), ['a'])
+
+    def test_long_earlier_interval_hides_behind_shorter_ones(self):
+        # 'a' starts first but ends last: the running maximum of the ends must catch it
+        table = self.slots((0, 100, 'a'), (10, 20, 'b'), (30, 40, 'c'))
+        self.assertFalse(table.is_free(50, 60))
+        self.assertEqual(table.overlapping(50, 60), ['a'])
+        self.assertEqual(table.overlapping(15, 35), ['a', 'b', 'c'])
+
+    def test_gap_between_intervals(self):
+        table = self.slots((30, 40, 'b'), (10, 20, 'a'))
+        self.assertTrue(table.is_free(20, 30))
+        self.assertFalse(table.is_free(20, 31))
+        self.assertEqual(table.overlapping(20, 31), ['b'])
+
+    def test_same_start_different_ends(self):
+        table = self.slots((10, 20, 'a'), (10, 40, 'b'))
+        self.assertFalse(table.is_free(30, 35))
+        self.assertEqual(table.overlapping(30, 35), ['b'])
+
+    def test_remove(self):
+        table = self.slots((0, 100, 'a'), (10, 20, 'b'))
+        table.remove(0, 100, 'a')
+        self.assertTrue(table.is_free(50, 60))
+        self.assertEqual(table.overlapping(0, 100), ['b'])
+        table.remove(10, 20, 'b')
+        self.assertTrue(table.is_free(0, 100))
+        self.assertEqual(table.starts, [])
+        self.assertEqual(table.max_ends, [])
+
+    def test_remove_unknown_interval_is_a_no_op(self):
+        table = self.slots((10, 20, 'a'))
+        table.remove(10, 20, 'other')
+        table.remove(11, 20, 'a')
+        table.remove(50, 60, 'z')
+        self.assertEqual(table.overlapping(0, 100), ['a'])
+
+
+class PlanRangeTests(SimpleTestCase):
+    """Bucket plan of a date range (core.revenue_rollups)"""
+
+    @staticmethod
+    def covered_days(plan):
+        days = []
+        for granularity, key in plan:
+            if granularity == 'day':
+                days.append(date.fromisoformat(key))
+                continue
+            current = date.fromisoformat(f"{key}-01")
+            while current.strftime('%Y-%m') == key:
+                days.append(current)
+                current += timedelta(days=1)
+        return days
+
+    def test_empty_range(self):
+        self.assertEqual(plan_range(date(2025, 3, 2), date(2025, 3, 1)), [])
+
+    def test_single_day(self):
+        self.assertEqual(plan_range(date(2025, 3, 1), date(2025, 3, 1)), [('day', '2025-03-01')])
+
+    def test_whole_month(self):
+        self.assertEqual(plan_range(date(2025, 3, 1), date(2025, 3, 31)), [('month', '2025-03')])
+
+    def test_month_missing_its_last_day_uses_days(self):
+        plan = plan_range(date(2025, 3, 1), date(2025, 3, 30))
+        self.assertEqual(len(plan), 30)
+        self.assertTrue(all(granularity == 'day' for granularity, _ in plan))
+
+    def test_partial_months_at_both_ends(self):
+        self.assertEqual(plan_range(date(2025, 1, 30), date(2025, 3, 2)), [
+            ('day', '2025-01-30'),
+            ('day', '2025-01-31'),
+            ('month', '2025-02'),
+            ('day', '2025-03-01'),
+            ('day', '2025-03-02'),
+        ])
+
+    def test_leap_february(self):
+        self.assertEqual(plan_range(date(2024, 2, 1), date(2024, 2, 29)), [('month', '2024-02')])
+        self.assertEqual(len(plan_range(date(2024, 2, 1), date(2024, 2, 28))), 28)
+
+    def test_across_years(self):
+        self.assertEqual(plan_range(date(2024, 12, 1), date(2025, 1, 31)), [('month', '2024-12'), ('month', '2025-01')])
+
+    def test_every_day_covered_once(self):
+        start, end = date(2024, 11, 17), date(2025, 4, 3)
+        days = self.covered_days(plan_range(start, end))
+        self.assertEqual(days, [start + timedelta(days=i) for i in range((end - start).days + 1)])
+
+
+class CatalogBundleDeltaTests(SimpleTestCase):
+    """Deltas between catalog versions (core.catalog_bundle)"""
+
+    def setUp(self):
+        catalog_bundle._history.clear()
+
+    def tearDown(self):
+        catalog_bundle._history.clear()
+
+    @staticmethod
+    def bundle(version, plats=None, menus=None, menu_plats=None):
+        return CatalogBundle(CatalogSnapshot(
+            version=1, loaded_at=0.0, plats=plats or {}, menus=menus or {},
+            menu_plats=menu_plats or {}, fingerprint=version
+        ))
+
+    def test_unknown_version_gets_the_full_bundle(self):
+        bundle = self.bundle('v1', plats={'p1': {'nom': 'Chorba'}})
+        self.assertIsNone(bundle.delta('unknown'))
+        self.assertEqual(bundle.bodies('unknown'), (bundle.body, bundle.gzip_body))
+        self.assertEqual(bundle.bodies(), (bundle.body, bundle.gzip_body))
+
+    def test_delta_from_the_same_version_is_empty(self):
+        bundle = self.bundle('v1', plats={'p1': {'nom': 'Chorba'}})
+        delta = bundle.delta('v1')
+        self.assertEqual(delta['mode'], 'delta')
+        self.assertTrue(all(not docs for docs in delta['changed'].values()))
+        self.assertTrue(all(not ids for ids in delta['deleted'].values()))
+
+    def test_added_changed_and_deleted_documents(self):
+        self.bundle('v1', plats={'p1': {'nom': 'Chorba', 'prix': 300}, 'p2': {'nom': 'Bourek'}, 'p3': {'nom': 'Tajine'}})
+        bundle = self.bundle('v2', plats={'p1': {'nom': 'Chorba', 'prix': 350}, 'p3': {'nom': 'Tajine'}, 'p4': {'nom': 'Couscous'}})
+        delta = bundle.delta('v1')
+        self.assertEqual(delta['since'], 'v1')
+        self.assertEqual(delta['version'], 'v2')
+        self.assertEqual([plat['id'] for plat in delta['changed']['plats']], ['p1', 'p4'])
+        self.assertEqual(delta['changed']['plats'][0]['prix'], 350)
+        self.assertEqual(delta['deleted']['plats'], ['p2'])
+        self.assertEqual(delta['changed']['menus'], [])
+
+    def test_menu_dish_list_change_is_a_change(self):
+        self.bundle('v1', menus={'m1': {'nom': 'Midi'}}, menu_plats={'m1': ['p1']})
+        bundle = self.bundle('v2', menus={'m1': {'nom': 'Midi'}}, menu_plats={'m1': ['p1', 'p2']})
+        self.assertEqual(bundle.delta('v1')['changed']['menus'], [{'id': 'm1', 'nom': 'Midi', 'plats': ['p1', 'p2']}])
+
+    def test_delta_bodies_are_encoded_once(self):
+        self.bundle('v1', plats={'p1': {'nom': 'Chorba'}})
+        bundle = self.bundle('v2', plats={'p1': {'nom': 'Chorba'}, 'p2': {'nom': 'Bourek'}})
+        body, gzip_body = bundle.bodies('v1')
+        self.assertIs(bundle.bodies('v1')[0], body)
+        payload = json.loads(body)
+        self.assertEqual(payload['mode'], 'delta')
+        self.assertEqual(gzip.decompress(gzip_body), body)
+
+    def test_full_body(self):
+        bundle = self.bundle('v1', plats={'p2': {'nom': 'Bourek'}, 'p1': {'nom': 'Chorba'}})
+        payload = json.loads(gzip.decompress(bundle.gzip_body))
+        self.assertEqual(payload['mode'], 'full')
+        self.assertEqual([plat['id'] for plat in payload['plats']], ['p1', 'p2'])
+
+    def test_oldest_versions_are_forgotten(self):
+        first = self.bundle('v0')
+        for index in range(1, HISTORY_SIZE + 1):
+            latest = self.bundle(f'v{index}')
+        self.assertIsNone(latest.delta(first.version))
+        self.assertIsNotNone(latest.delta('v1'))
+
+
+class SlotIdsTests(SimpleTestCase):
+    """Slot buckets claimed by a reservation (core.reservation_booking)"""
+
+    def test_aligned_start(self):
+        start = datetime(2025, 5, 10, 19, 0, tzinfo=timezone.utc)
+        self.assertEqual(slot_ids('t1', start), [
+            't1_20250510T1900', 't1_20250510T1930', 't1_20250510T2000', 't1_20250510T2030',
+        ])
+
+    def test_unaligned_start_covers_the_partial_buckets(self):
+        start = datetime(2025, 5, 10, 19, 10, tzinfo=timezone.utc)
+        self.assertEqual(slot_ids('t1', start), [
+            't1_20250510T1900', 't1_20250510T1930', 't1_20250510T2000', 't1_20250510T2030', 't1_20250510T2100',
+        ])
+
+    def test_end_on_a_boundary_is_excluded(self):
+        start = datetime(2025, 5, 10, 19, 0, tzinfo=timezone.utc)
+        self.assertEqual(slot_ids('t1', start, timedelta(minutes=30)), ['t1_20250510T1900'])
+        self.assertEqual(slot_ids('t1', start, timedelta(minutes=31)), ['t1_20250510T1900', 't1_20250510T1930'])
+
+    def test_across_midnight(self):
+        start = datetime(2025, 5, 10, 23, 30, tzinfo=timezone.utc)
+        self.assertEqual(slot_ids('t1', start, timedelta(hours=1)), ['t1_20250510T2330', 't1_20250511T0000'])
+
+    def test_ids_are_in_utc(self):
+        start = datetime(2025, 5, 10, 20, 0, tzinfo=timezone(timedelta(hours=1)))
+        self.assertEqual(slot_ids('t1', start, timedelta(minutes=30)), ['t1_20250510T1900'])
+
+    @override_settings(TIME_ZONE='Africa/Algiers')
+    def test_naive_start_is_restaurant_local_time(self):
+        self.assertEqual(slot_ids('t1', datetime(2025, 5, 10, 20, 0), timedelta(minutes=30)), ['t1_20250510T1900'])
+
+    def test_same_slot_on_two_tables_differs(self):
+        start = datetime(2025, 5, 10, 19, 0, tzinfo=timezone.utc)
+        self.assertFalse(set(slot_ids('t1', start)) & set(slot_ids('t2', start)))
@@ -0,0 +1,19 @@
+import re
+import unicodedata
+
+_LIGATURES = str.maketrans({'œ': 'oe', 'Œ': 'oe', 'æ': 'ae', 'Æ': 'ae', '’': "'"})
+_WORD_RE = re.compile(r"[a-z0-9]+")
+
+
+def fold_text(text) -> str:
+    """Lowercase and strip accents: 'Crème Brûlée' -> 'creme brulee', 'Œufs' -> 'oeufs'"""
+    if not text:
+        return ''
+    text = str(text).translate(_LIGATURES)
+    decomposed = unicodedata.normalize('NFKD', text)
+    return ''.join(c for c in decomposed if not unicodedata.combining(c)).lower()
+
+
+def tokenize(text) -> list:
+    """Folded alphanumeric words of a text"""
+    return _WORD_RE.findall(fold_text(text))
@@ -8,6 +8,7 @@ urlpatterns = [
     path('logout/', logout, name='logout'),
     # 1. Ingredients management
     path('ingredients/low-stock/', views.get_low_stock_ingredients, name='get_low_stock_ingredients'),
+    path('ingredients/forecast/', views.get_stock_forecast, name='get_stock_forecast'),
     # 2. Active orders (en_attente + en_preparation)
     path('orders/active/', views.get_active_orders, name='get_active_orders'),
     # 3. All order views (chef-specific)
@@ -24,6 +25,7 @@ urlpatterns = [
     path('profile/update-password/', views.update_password, name='update_password'),
     # 6. Notifications
     path('notifications/', views.get_chef_notifications, name='get_chef_notifications'),
+    path('notifications/unread-count/', views.get_unread_notifications_count, name='get_unread_notifications_count'),
     path('notifications/<str:notification_id>/read/', views.mark_notification_read, name='mark_notification_read'),
 
     #plats
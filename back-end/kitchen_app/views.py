@@ -11,12 +11,19 @@ from core.firebase_utils import firebase_config
 from core.authentication import FirebaseAuthentication
 from core.permissions import IsChef, IsStaff
 from core.orders_utils import get_all_orders, get_orders_by_status
+from core.popularity import popularity_tracker
+from core.catalog import catalog
+from core import notification_dispatcher, notifications, revenue_rollups, sales_counters, stock_forecast
+from core.sales_analytics import sales_analytics
+from core.floor_plan import floor_plan
+from core.conditional import inbox_condition
 from core.permissions import IsServer
 import json
 import logging
 
 logger = logging.getLogger(__name__)
 db = firebase_config.get_db()
+KITCHEN_INBOX = notifications.inbox_id('chef')
 
 # 1. Get ingredients with low stock
 @api_view(['GET'])
@@ -24,36 +31,27 @@ db = firebase_config.get_db()
 @permission_classes([IsStaff])
 def get_low_stock_ingredients(request):
     """
-    Get ingredients that are at or below their alert threshold
-    Returns ingredients with current quantity <= seuil_alerte
+    Get ingredients expected to run out within a week at their current burn rate
+    (core.stock_forecast), or at/below seuil_alerte when no consumption is recorded yet
     """
     try:
-        ingredients_ref = db.collection('ingredients')
-        low_stock_ingredients = []
-        
-        for doc in ingredients_ref.stream():
+        ingredients = {}
+        for doc in db.collection('ingredients').stream():
             ingredient_data = doc.to_dict()
             ingredient_data['id'] = doc.id
-            
-            # Get current quantity and alert threshold
-            current_quantity = ingredient_data.get('quantite', 0)
-            alert_threshold = ingredient_data.get('seuil_alerte', 0)
-            
-            # Check if ingredient is at or below alert threshold
-            if current_quantity <= alert_threshold:
-                low_stock_ingredients.append({
-                    'id': doc.id,
-                    'nom': ingredient_data.get('nom', 'Unknown'),
-                    'categorie': ingredient_data.get('categorie', 'Unknown'),
-                    'quantite_actuelle': current_quantity,
-                    'seuil_alerte': alert_threshold,
-                    'unite': ingredient_data.get('unite', ''),
-                    'date_expiration': ingredient_data.get('date_expiration', ''),
-                    'cout_par_unite': ingredient_data.get('cout_par_unite', 0)
-                })
+            ingredients[doc.id] = ingredient_data
         
-        # Sort by urgency (lowest quantity first)
-        low_stock_ingredients.sort(key=lambda x: x['quantite_actuelle'])
+        low_stock_ingredients = []
+        # Already sorted by urgency (days until depletion)
+        for prevision in stock_forecast.forecast(ingredients=list(ingredients.values())):
+            if prevision['statut'] == 'ok':
+                continue
+            ingredient_data = ingredients[prevision['id']]
+            prevision.update({
+                'date_expiration': ingredient_data.get('date_expiration', ''),
+                'cout_par_unite': ingredient_data.get('cout_par_unite', 0)
+            })
+            low_stock_ingredients.append(prevision)
         
         return JsonResponse(low_stock_ingredients, safe=False)
         
@@ -61,6 +59,26 @@ def get_low_stock_ingredients(request):
         logger.error(f"Error fetching low stock ingredients: {str(e)}", exc_info=True)
         return JsonResponse({'error': str(e)}, status=500)
 
+# Ingredient depletion forecast
+@api_view(['GET'])
+@authentication_classes([FirebaseAuthentication])
+@permission_classes([IsStaff])
+def get_stock_forecast(request):
+    """
+    Burn rate and estimated days until depletion of every ingredient,
+    most urgent first (core.stock_forecast)
+    """
+    try:
+        previsions = stock_forecast.forecast(db)
+        return JsonResponse({
+            'ingredients': previsions,
+            'count': len(previsions),
+            'a_commander': sum(1 for p in previsions if p['statut'] != 'ok')
+        })
+    except Exception as e:
+        logger.error(f"Error computing stock forecast: {str(e)}", exc_info=True)
+        return JsonResponse({'error': str(e)}, status=500)
+
 # 2. Get active orders (en_attente and en_preparation)
 @api_view(['GET'])
 @authentication_classes([FirebaseAuthentication])
@@ -275,57 +293,64 @@ def update_password(request):
 @api_view(['GET'])
 @authentication_classes([FirebaseAuthentication])
 @permission_classes([IsStaff])
+@inbox_condition(lambda request: [KITCHEN_INBOX, notifications.inbox_id('employe', request.user.uid)])
 def get_chef_notifications(request):
     """
-    Get notifications for the authenticated chef
-    Returns notifications where recipient_type is 'cuisinier' or 'chef' and recipient_id matches
+    Get the kitchen inbox and the chef's personal inbox, most recent first, one page at a time
+    Query params: page_size (default 50), cursor (X-Next-Cursor of the previous page), unread=true,
+    since (ISO timestamp, only notifications created after it)
     """
     try:
-        user = request.user
-        user_id = user.uid
-        
-        # Get employee ID from firebase_uid
-        employee_id = None
-        employees_ref = db.collection('employes').where('firebase_uid', '==', user_id).limit(1)
-        employees_docs = list(employees_ref.stream())
-        
-        if employees_docs:
-            employee_id = employees_docs[0].id
-        else:
-            # Fallback: try using user_id directly
-            employee_id = user_id
-        
-        # Query notifications for this chef
-        notifications_ref = db.collection('notifications').where('recipient_type', '==', 'chef' or 'cuisinier' or 'cuisine')
-        notifications = []
-        
-        for doc in notifications_ref.stream():
-            notification_data = doc.to_dict()
-            notification_data['id'] = doc.id
-            
-            # Filter by recipient type (cuisinier or chef)
-            recipient_type = notification_data.get('recipient_type', '')
-            if recipient_type in ['cuisinier', 'chef']:
-                notifications.append({
-                    'id': doc.id,
-                    'title': notification_data.get('title', ''),
-                    'message': notification_data.get('message', ''),
-                    'type': notification_data.get('type', ''),
-                    'priority': notification_data.get('priority', 'normal'),
-                    'read': notification_data.get('read', False),
-                    'created_at': notification_data.get('created_at'),
-                    'related_id': notification_data.get('related_id', '')
-                })
-        
-        # Sort by creation date (most recent first)
-        notifications.sort(key=lambda x: x.get('created_at') or '', reverse=True)
-        
-        return JsonResponse(notifications, safe=False)
+        try:
+            page_size, cursor, unread_only = notifications.page_params(request.query_params)
+            since = notifications.since_param(request.query_params)
+        except ValueError:
+            return JsonResponse({'error': 'Invalid page_size or since parameter'}, status=400)
+        
+        # One indexed query over both inboxes, ordered and limited by Firestore
+        items, next_cursor = notifications.query_inboxes(
+            db,
+            [KITCHEN_INBOX, notifications.inbox_id('employe', request.user.uid)],
+            page_size=page_size,
+            cursor=cursor,
+            unread_only=unread_only,
+            since=since
+        )
+        
+        result = [{
+            'id': item['id'],
+            'title': item.get('title', ''),
+            'message': item.get('message', ''),
+            'type': item.get('type', ''),
+            'priority': item.get('priority', 'normal'),
+            'read': item.get('read', False),
+            'created_at': item.get('created_at'),
+            'related_id': item.get('related_id', item.get('order_id', ''))
+        } for item in items]
+        
+        response = JsonResponse(result, safe=False)
+        if next_cursor:
+            response['X-Next-Cursor'] = next_cursor
+        return response
         
     except Exception as e:
         logger.error(f"Error fetching chef notifications: {str(e)}", exc_info=True)
         return JsonResponse({'error': str(e)}, status=500)
 
+@api_view(['GET'])
+@authentication_classes([FirebaseAuthentication])
+@permission_classes([IsStaff])
+def get_unread_notifications_count(request):
+    """Unread badges of the kitchen inbox and of the chef's personal inbox"""
+    try:
+        return JsonResponse({
+            'unread_count': notifications.unread_count(db, KITCHEN_INBOX),
+            'personal_unread_count': notifications.unread_count(db, notifications.inbox_id('employe', request.user.uid))
+        })
+    except Exception as e:
+        logger.error(f"Error fetching unread notifications count: {str(e)}", exc_info=True)
+        return JsonResponse({'error': str(e)}, status=500)
+
 # Mark notification as read
 @api_view(['PUT'])
 @authentication_classes([FirebaseAuthentication])
@@ -334,15 +359,12 @@ def get_chef_notifications(request):
 def mark_notification_read(request, notification_id):
     """Mark a specific notification as read"""
     try:
-        notification_ref = db.collection('notifications').document(notification_id)
-        notification_doc = notification_ref.get()
-        
-        if not notification_doc.exists:
+        notification = notifications.mark_read(db, KITCHEN_INBOX, notification_id)
+        if notification is None:
+            notification = notifications.mark_read(db, notifications.inbox_id('employe', request.user.uid), notification_id)
+        if notification is None:
             return JsonResponse({'error': 'Notification not found'}, status=404)
         
-        # Update the read status
-        notification_ref.update({'read': True})
-        
         return JsonResponse({'message': 'Notification marked as read'})
         
     except Exception as e:
@@ -695,6 +717,7 @@ def add_plat(request):
         
         plat_ingredients_ref = db.collection('plat_ingredients').document(plat_id)
         plat_ingredients_ref.set(plat_ingredients_data)
+        catalog.invalidate()
         logger.info(f"Ingrédients du plat créés pour l'ID: {plat_id}")
         
         # Retourner la réponse de succès avec les données du plat créé
@@ -772,6 +795,7 @@ def update_plat(request, plat_id):
                     'nom_du_plat': update_data['nom'],
                     'updatedAt': firestore.SERVER_TIMESTAMP
                 })
+        catalog.invalidate()
         
         logger.info(f"Plat {plat_id} mis à jour avec succès")
         
@@ -818,6 +842,8 @@ def delete_plat(request, plat_id):
         
         # Supprimer le plat
         plat_ref.delete()
+        catalog.invalidate()
+        popularity_tracker.forget(plat_id)
         logger.info(f"Plat {plat_id} supprimé avec succès")
         
         return JsonResponse({
@@ -896,6 +922,7 @@ def update_plat_ingredients(request, plat_id):
                 'ingredients': new_ingredients,
                 'updatedAt': firestore.SERVER_TIMESTAMP
             })
+            catalog.invalidate()
             
             return JsonResponse({
                 'message': 'Liste des ingrédients remplacée avec succès',
@@ -953,6 +980,7 @@ def update_plat_ingredients(request, plat_id):
             'ingredients': current_ingredients,
             'updatedAt': firestore.SERVER_TIMESTAMP
         })
+        catalog.invalidate()
         
         logger.info(f"Ingrédients du plat {plat_id} mis à jour: {action} - {ingredient_name}")
         
@@ -1098,7 +1126,7 @@ def commencer_commande(request, order_id):
             plat_data = doc.to_dict()
             plats_commandes.append({
                 'idP': plat_data.get('idP'),
-                'quantite': plat_data.get('quantite', 1)
+                'quantite': plat_data.get('quantité', plat_data.get('quantite', 1))
             })
         
         if not plats_commandes:
@@ -1190,27 +1218,17 @@ def commencer_commande(request, order_id):
                     'quantite': max(0, nouvelle_quantite),  # S'assurer que la quantité ne soit pas négative
                     'updatedAt': firestore.SERVER_TIMESTAMP
                 })
+                # Journal de consommation pour la prévision de rupture
+                stock_forecast.log_consumption(batch, db, order_id, ingredient_ref, nom_ingredient, quantite_necessaire)
         
-        # 6c. Créer une notification pour le client
+        # 6c. Notifier le client, dans le même lot que le changement d'état
         client_id = commande_data.get('idC')  # ID du client depuis la commande
-        
-        if client_id:
-            notification_ref = db.collection('notifications').document()
-            notification_data = {
-                'title': 'Commande en préparation',
-                'message': f'Votre commande est maintenant en cours de préparation. Nos chefs s\'en occupent !',
-                'type': 'order_preparation',
-                'priority': 'normal',
-                'read': False,
-                'recipient_id': client_id,
-                'recipient_type': 'client',
-                'created_at': firestore.SERVER_TIMESTAMP,
-                'order_id': order_id
-            }
-            batch.set(notification_ref, notification_data)
+        dispatch = notification_dispatcher.begin(db, batch)
+        dispatch.notify(notification_dispatcher.client(client_id), 'order_preparing', order_id=order_id)
         
         # 7. Exécuter toutes les opérations
-        batch.commit()
+        dispatch.commit()
+        floor_plan.invalidate()
         
         logger.info(f"Commande {order_id} commencée avec succès")
         
@@ -1268,71 +1286,30 @@ def terminer_commande(request, order_id):
         client_id = commande_data.get('idC')
         table_id = commande_data.get('idTable')
         
-        # 2. Commencer une transaction
-        batch = db.batch()
-        
-        # 2a. Changer l'état de la commande à 'pret'
-        batch.update(commande_ref, {
-            'etat': 'pret',
-            'dateModification': firestore.SERVER_TIMESTAMP
-        })
-        
-        # 2b. Créer une notification pour le client
-        if client_id:
-            client_notification_ref = db.collection('notifications').document()
-            client_notification_data = {
-                'title': 'Commande prête !',
-                'message': f'Votre commande est prête ! Un serveur va bientôt vous l\'apporter.',
-                'type': 'order_ready',
-                'priority': 'high',
-                'read': False,
-                'recipient_id': client_id,
-                'recipient_type': 'client',
-                'created_at': firestore.SERVER_TIMESTAMP,
-                'related_id': order_id
-            }
-            batch.set(client_notification_ref, client_notification_data)
-        
-        # 2c. Créer une notification pour le serveur
-        serveur_notification_ref = db.collection('notifications').document()
-        serveur_notification_data = {
-            'title': 'Commande prête',
-            'message': f'La commande pour la table {table_id} est prête à être servie.',
-            'type': 'order_ready',
-            'priority': 'high',
-            'read': False,
-            'recipient_id': 'employe1',  # Vous pouvez adapter selon votre système
-            'recipient_type': 'serveur',
-            'created_at': firestore.SERVER_TIMESTAMP,
-            'related_id': order_id
-        }
-        batch.set(serveur_notification_ref, serveur_notification_data)
-        
-        # 3. Exécuter la transaction
-        batch.commit()
-        
-        # 4. Vérifier les alertes d'ingrédients après la commande
+        # 2. Vérifier les alertes d'ingrédients (lues avant l'écriture pour tout envoyer en un lot)
         alertes_ingredients = []
         
         # Récupérer tous les ingrédients pour vérification
-        ingredients_query = db.collection('ingredients').stream()
-        
-        for ingredient_doc in ingredients_query:
+        ingredients_stock = []
+        for ingredient_doc in db.collection('ingredients').stream():
             ingredient_data = ingredient_doc.to_dict()
-            nom_ingredient = ingredient_doc.id
-            
-            quantite = ingredient_data.get('quantite', 0)
-            seuil_alerte = ingredient_data.get('seuil_alerte', 1)
-            date_expiration_str = ingredient_data.get('date_expiration')
-            
-            # Vérifier le stock faible
-            if quantite <= seuil_alerte:
+            ingredient_data['id'] = ingredient_doc.id
+            ingredients_stock.append(ingredient_data)
+        
+        # Vérifier le stock faible d'après la prévision de rupture
+        for prevision in stock_forecast.forecast(ingredients=ingredients_stock):
+            if prevision['statut'] != 'ok':
                 alertes_ingredients.append({
-                    'nom': nom_ingredient,
+                    'nom': prevision['id'],
                     'type': 'stock_faible',
-                    'quantite_actuelle': quantite,
-                    'seuil': seuil_alerte
+                    'quantite_actuelle': prevision['quantite_actuelle'],
+                    'seuil': prevision['seuil_alerte'],
+                    'jours_restants': prevision['jours_restants']
                 })
+        
+        for ingredient_data in ingredients_stock:
+            nom_ingredient = ingredient_data['id']
+            date_expiration_str = ingredient_data.get('date_expiration')
             
             # Vérifier la date d'expiration
             if date_expiration_str:
@@ -1359,32 +1336,57 @@ def terminer_commande(request, order_id):
                 except ValueError:
                     pass  # Format de date invalide, ignorer
         
-        # 5. Envoyer des notifications d'alerte au cuisinier si nécessaire
-        if alertes_ingredients:
-            for alerte in alertes_ingredients:
-                alerte_notification_ref = db.collection('notifications').document()
-                
-                if alerte['type'] == 'stock_faible':
-                    message = f"Stock faible pour {alerte['nom']}: {alerte['quantite_actuelle']} restant(s) (seuil: {alerte['seuil']})"
-                    title = "Alerte stock faible"
-                elif alerte['type'] == 'expire':
-                    message = f"Ingrédient expiré: {alerte['nom']} (expiré depuis {alerte['jours_expires']} jour(s))"
-                    title = "Ingrédient expiré"
-                else:  # proche_expiration
-                    message = f"Ingrédient bientôt expiré: {alerte['nom']} (expire dans {alerte['jours_restants']} jour(s))"
-                    title = "Expiration proche"
-                
-                alerte_notification_data = {
-                    'title': title,
-                    'message': message,
-                    'type': 'ingredient_alert',
-                    'priority': 'high' if alerte['type'] == 'expire' else 'normal',
-                    'read': False,
-                    'recipient_id': request.user.uid,  # Le cuisinier actuel
-                    'recipient_type': 'chef',
-                    'created_at': firestore.SERVER_TIMESTAMP
-                }
-                alerte_notification_ref.set(alerte_notification_data)
+        # 3. Un seul lot: état de la commande + notifications du client et du serveur
+        batch = db.batch()
+        
+        # 3a. Changer l'état de la commande à 'pret'
+        batch.update(commande_ref, {
+            'etat': 'pret',
+            'dateModification': firestore.SERVER_TIMESTAMP
+        })
+        
+        # 3b. Notifier le client
+        dispatch = notification_dispatcher.begin(db, batch)
+        dispatch.notify(notification_dispatcher.client(client_id), 'order_ready', related_id=order_id)
+        
+        # 3c. Notifier le serveur de la commande, ou tous les serveurs
+        serveur = notification_dispatcher.employee(commande_data['server_id']) if commande_data.get('server_id') else notification_dispatcher.role('serveur')
+        dispatch.notify(serveur, 'order_ready_server', table_id=table_id, related_id=order_id)
+        
+        # 4. Exécuter le lot
+        dispatch.commit()
+        floor_plan.invalidate()
+        
+        # 5. Alertes d'ingrédients pour les cuisiniers: nombre non borné, envoyées à part par lots
+        contextes_alertes = []
+        for alerte in alertes_ingredients:
+            if alerte['type'] == 'stock_faible' and alerte['jours_restants'] is not None:
+                message = f"Stock faible pour {alerte['nom']}: {alerte['quantite_actuelle']} restant(s), rupture estimée dans {alerte['jours_restants']} jour(s)"
+                title = "Alerte stock faible"
+            elif alerte['type'] == 'stock_faible':
+                message = f"Stock faible pour {alerte['nom']}: {alerte['quantite_actuelle']} restant(s) (seuil: {alerte['seuil']})"
+                title = "Alerte stock faible"
+            elif alerte['type'] == 'expire':
+                message = f"Ingrédient expiré: {alerte['nom']} (expiré depuis {alerte['jours_expires']} jour(s))"
+                title = "Ingrédient expiré"
+            else:  # proche_expiration
+                message = f"Ingrédient bientôt expiré: {alerte['nom']} (expire dans {alerte['jours_restants']} jour(s))"
+                title = "Expiration proche"
+            
+            contextes_alertes.append({
+                'title': title,
+                'message': message,
+                'priority': 'high' if alerte['type'] == 'expire' else 'normal'
+            })
+        
+        if contextes_alertes:
+            try:
+                notification_dispatcher.notify_each(
+                    db, notification_dispatcher.role('chef'), 'ingredient_alert', contextes_alertes
+                )
+            except Exception as e:
+                # La commande est déjà prête: une alerte perdue ne doit pas faire échouer la requête
+                logger.error(f"Erreur lors de l'envoi des alertes d'ingrédients pour la commande {order_id}: {str(e)}")
         
         logger.info(f"Commande {order_id} terminée avec succès")
         
@@ -1437,21 +1439,11 @@ def notifier_commande_annulee(request, order_id):
         table_id = commande_data.get('idTable')
         client_id = commande_data.get('idC')
         
-        # 2. Créer une notification pour le cuisinier
-        notification_ref = db.collection('notifications').document()
-        notification_data = {
-            'title': 'Commande annulée',
-            'message': f'La commande #{order_id} pour la table {table_id} a été annulée par le client.',
-            'type': 'order_cancelled',
-            'priority': 'normal',
-            'read': False,
-            'recipient_id': 'chef1',  # Adapter selon votre système d'identification des chefs
-            'recipient_type': 'chef',
-            'created_at': firestore.SERVER_TIMESTAMP,
-            'related_id': order_id
-        }
-        
-        notification_ref.set(notification_data)
+        # 2. Créer une notification pour les cuisiniers
+        notification_dispatcher.notify(
+            db, notification_dispatcher.role('chef'), 'order_cancelled_notice',
+            order_id=order_id, table_id=table_id, related_id=order_id
+        )
         
         logger.info(f"Notification d'annulation envoyée pour la commande {order_id}")
         
@@ -1568,97 +1560,74 @@ def annuler_commande(request, order_id):
                          'Seules les commandes en attente ou en préparation peuvent être annulées.'
             }, status=400)
         
-        # Mettre à jour le statut de la commande
-        order_ref.update({
+        client_id = order_data.get('idC')
+        table_id = order_data.get('idTable')
+        
+        # Lectures préalables: table associée et ID employé du chef
+        table_ref = None
+        if table_id:
+            table_ref = db.collection('tables').document(table_id)
+            if not table_ref.get().exists:
+                table_ref = None
+        employees_docs = list(db.collection('employes').where('firebase_uid', '==', request.user.uid).limit(1).stream())
+        
+        # Un seul lot: statut, notification, table et journal
+        batch = db.batch()
+        batch.update(order_ref, {
             'etat': 'annulee',
             'date_annulation': firestore.SERVER_TIMESTAMP,
             'motif_annulation': motif_annulation,
             'annulee_par': 'cuisine'
         })
         
-        # Récupérer les informations du client
-        client_id = order_data.get('idC')
-        if not client_id:
-            logger.warning(f"Aucun client trouvé pour la commande {order_id}")
-            return JsonResponse({
-                'message': 'Commande annulée avec succès',
-                'warning': 'Impossible d\'envoyer la notification: client non trouvé'
-            })
-        
-        # Créer la notification pour le client
-        try:
-            notification_data = {
-                'title': 'Commande annulée',
-                'message': f'Votre commande #{order_id} a été annulée par la cuisine. '
-                          f'Motif: {motif_annulation}. '
-                          'Veuillez demander de l\'assistance pour plus d\'informations.',
-                'type': 'order_cancelled',
-                'priority': 'high',
-                'recipient_type': 'client',
-                'recipient_id': client_id,
-                'related_id': order_id,
-                'read': False,
-                'created_at': firestore.SERVER_TIMESTAMP
-            }
-            
-            # Ajouter la notification à la collection
-            db.collection('notifications').add(notification_data)
-            logger.info(f"Notification d'annulation envoyée au client {client_id} pour la commande {order_id}")
-            
-        except Exception as e:
-            logger.error(f"Erreur lors de l'envoi de la notification: {str(e)}")
-            return JsonResponse({
-                'message': 'Commande annulée avec succès',
-                'warning': f'Erreur lors de l\'envoi de la notification: {str(e)}'
-            })
+        # Notification pour le client
+        dispatch = notification_dispatcher.begin(db, batch)
+        notification_sent = dispatch.notify(
+            notification_dispatcher.client(client_id), 'order_cancelled_by_kitchen',
+            order_id=order_id, motif=motif_annulation, related_id=order_id
+        ) is not None
         
         # Libérer la table si elle est associée
-        try:
-            table_id = order_data.get('idTable')
-            if table_id:
-                table_ref = db.collection('tables').document(table_id)
-                table_doc = table_ref.get()
-                if table_doc.exists:
-                    table_ref.update({'etatTable': 'libre'})
-                    logger.info(f"Table {table_id} libérée suite à l'annulation de la commande {order_id}")
-        except Exception as e:
-            logger.warning(f"Erreur lors de la libération de la table: {str(e)}")
+        if table_ref is not None:
+            batch.update(table_ref, {'etatTable': 'libre'})
         
         # Enregistrer l'action du chef
-        try:
-            user = request.user
-            chef_id = user.uid
-            
-            # Récupérer l'ID employé du chef
-            employees_ref = db.collection('employes').where('firebase_uid', '==', chef_id).limit(1)
-            employees_docs = list(employees_ref.stream())
-            
-            if employees_docs:
-                employee_id = employees_docs[0].id
-                
-                # Enregistrer l'action dans un log (optionnel)
-                action_log = {
-                    'action': 'annulation_commande',
-                    'order_id': order_id,
-                    'chef_id': employee_id,
-                    'motif': motif_annulation,
-                    'timestamp': firestore.SERVER_TIMESTAMP,
-                    'previous_status': current_status
-                }
-                db.collection('chef_actions').add(action_log)
-                
-        except Exception as e:
-            logger.warning(f"Erreur lors de l'enregistrement de l'action: {str(e)}")
+        if employees_docs:
+            batch.set(db.collection('chef_actions').document(), {
+                'action': 'annulation_commande',
+                'order_id': order_id,
+                'chef_id': employees_docs[0].id,
+                'motif': motif_annulation,
+                'timestamp': firestore.SERVER_TIMESTAMP,
+                'previous_status': current_status
+            })
+        
+        dispatch.commit()
+        # Agrégats de revenus et compteurs de ventes: transactions qui relisent les drapeaux de la commande
+        revenue_rollups.reverse_order(db, order_ref)
+        sales_counters.reverse_order(db, order_ref)
+        sales_analytics.mark_cancelled(order_id)
+        floor_plan.invalidate()
+        
+        if notification_sent:
+            logger.info(f"Notification d'annulation envoyée au client {client_id} pour la commande {order_id}")
+        else:
+            logger.warning(f"Aucun client trouvé pour la commande {order_id}")
+        if table_ref is not None:
+            logger.info(f"Table {table_id} libérée suite à l'annulation de la commande {order_id}")
         
         # Réponse de succès
-        return JsonResponse({
+        response_data = {
             'message': 'Commande annulée avec succès',
             'order_id': order_id,
             'previous_status': current_status,
             'new_status': 'annulee',
             'motif': motif_annulation,
-            'notification_sent': True
-        })
+            'notification_sent': notification_sent
+        }
+        if not notification_sent:
+            response_data['warning'] = 'Impossible d\'envoyer la notification: client non trouvé'
+        return JsonResponse(response_data)
         
     except json.JSONDecodeError:
         return JsonResponse({'error': 'Format JSON invalide'}, status=400)
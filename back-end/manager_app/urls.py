@@ -11,6 +11,7 @@ urlpatterns = [
     
     # Commandes endopints
     path('commandes/', views.get_all_commandes, name='get_all_commandes'),
+    path('commandes/export/', views.export_commandes, name='export_commandes'),
     path('commandes/en-attente/', views.get_commandes_en_attente, name='get_commandes_en_attente'),
     path('commandes/lancees/', views.get_commandes_lancees, name='get_commandes_lancees'),
     path('commandes/servies/', views.get_commandes_servies, name='get_commandes_servies'),
@@ -21,6 +22,7 @@ urlpatterns = [
     
     #Get commande_plat list
     path('commande-plat/', views.get_commande_plat_list, name='get_commande_plat_list'),
+    path('commande-plat/leaderboard/', views.get_sales_leaderboard, name='get_sales_leaderboard'),
     
     # Categories endpoints
     path('categories/', views.get_categories, name='get_categories'),
@@ -30,6 +32,7 @@ urlpatterns = [
     # Plats endpoints
     path('plats/', views.get_all_plats, name='get_all_plats'),
     path('plats/add/', views.add_plat, name='add_plat'),
+    path('plats/margins/', views.get_menu_margins, name='get_menu_margins'),
     path('plats/<str:plat_id>/', views.update_plat, name='update_plat'),
     path('plats/<str:plat_id>/delete/', views.delete_plat, name='delete_plat'),
     path('plats/<str:plat_id>/cost-details/', views.get_plat_cost_details, name='get_plat_cost_details'),
@@ -37,6 +40,7 @@ urlpatterns = [
     #ingredients endpoints
     path('ingredients/', views.get_all_ingredients, name='get_all_ingredients'),
     path('ingredients/add/', views.add_ingredient, name='add_ingredient'),
+    path('ingredients/forecast/', views.get_stock_forecast, name='get_stock_forecast'),
     path('ingredients/<str:ingredient_id>/restock/', views.restock_ingredient, name='restock_ingredient'),
     
     # Reservation endpoints
@@ -50,6 +54,14 @@ urlpatterns = [
 
     path('revenue/daily/', views.get_daily_revenue, name='get_daily_revenue'),
     path('revenue/weekly/', views.get_weekly_revenue, name='get_weekly_revenue'),
+    path('revenue/monthly/', views.get_monthly_revenue, name='get_monthly_revenue'),
+    path('revenue/range/', views.get_revenue_range, name='get_revenue_range'),
+    
+    # Sales analytics endpoints
+    path('analytics/best-sellers/', views.get_best_sellers, name='get_best_sellers'),
+    path('analytics/heatmap/', views.get_sales_heatmap, name='get_sales_heatmap'),
+    path('analytics/average-ticket/', views.get_average_ticket, name='get_average_ticket'),
+    path('analytics/attach-rates/<str:plat_id>/', views.get_attach_rates, name='get_attach_rates'),
     
     #employees
     path('employes/', views.get_all_employees, name='get_all_employees'),
@@ -6,10 +6,18 @@ from rest_framework.response import Response
 from core.firebase_utils import firebase_config
 from core.orders_utils import get_all_orders, get_orders_by_status, get_order_details
 from core.permissions import IsManager, IsManager, IsServer, IsManagerOrServer, IsStaff, IsManagerOrChef
-from django.http import JsonResponse
+from django.http import JsonResponse, StreamingHttpResponse
 from django.views.decorators.http import require_http_methods
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 from core.firebase_crud import firebase_crud
+from core.popularity import popularity_tracker
+from core.catalog import catalog
+from core.costing import get_costing_engine
+from core import revenue_rollups
+from core.sales_analytics import sales_analytics
+from core.table_availability import table_availability
+from core.floor_plan import floor_plan
+from core import dish_images, notification_dispatcher, order_export, range_query, reservation_booking, reservation_index, sales_counters, stock_forecast
 
 import uuid
 from datetime import datetime
@@ -34,6 +42,37 @@ def get_all_commandes(request):
             status=status.HTTP_500_INTERNAL_SERVER_ERROR
         )
 
+@api_view(['GET'])
+@permission_classes([IsManager])
+def export_commandes(request):
+    """
+    Stream orders and their line items as a file.
+    Query params:
+    - output: csv (default, one line per dish) or jsonl (one order per line)
+    - start, end: YYYY-MM-DD, inclusive
+    """
+    try:
+        output = request.query_params.get('output', 'csv').lower()
+        if output not in ('csv', 'jsonl'):
+            return Response({'error': "output must be 'csv' or 'jsonl'"}, status=status.HTTP_400_BAD_REQUEST)
+        
+        start_str = request.query_params.get('start')
+        end_str = request.query_params.get('end')
+        start = datetime.strptime(start_str, '%Y-%m-%d').replace(tzinfo=timezone.utc) if start_str else None
+        end = (datetime.strptime(end_str, '%Y-%m-%d').replace(tzinfo=timezone.utc) + timedelta(days=1)) if end_str else None
+    except ValueError as e:
+        return Response({'error': f"Invalid date: {str(e)}"}, status=status.HTTP_400_BAD_REQUEST)
+    
+    orders = order_export.iter_orders_with_lines(db, start, end)
+    if output == 'csv':
+        response = StreamingHttpResponse(order_export.csv_rows(orders), content_type='text/csv; charset=utf-8')
+    else:
+        response = StreamingHttpResponse(order_export.jsonl_rows(orders), content_type='application/x-ndjson')
+    
+    filename = f"commandes_{start_str or 'debut'}_{end_str or 'fin'}.{output}"
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
 @api_view(['GET'])
 @permission_classes([IsManager])
 def get_commandes_en_attente(request):
@@ -220,10 +259,16 @@ def add_plat(request):
             'note': request.data.get('note', 0),
             'quantité': request.data.get('quantité', 0)
         }
+        if request.data.get('image_url'):
+            plat_data['image_url'] = request.data['image_url']
         
         # Add to Firestore
         plat_ref = db.collection('plats').document()
         plat_ref.set(plat_data)
+        catalog.invalidate()
+        # Resized variants rendered now, not on the first client request
+        if plat_data.get('image_url'):
+            dish_images.render_in_background(plat_ref.id, plat_data['image_url'])
         
         logger.info(f"Plat created with ID: {plat_ref.id}")
         
@@ -258,7 +303,7 @@ def update_plat(request, plat_id):
         
         # Update fields
         update_data = {}
-        allowed_fields = ['nom', 'description', 'prix', 'idCat', 'ingrédients', 'estimation', 'note', 'quantité']
+        allowed_fields = ['nom', 'description', 'prix', 'idCat', 'ingrédients', 'estimation', 'note', 'quantité', 'image_url']
         
         for field in allowed_fields:
             if field in request.data:
@@ -270,6 +315,10 @@ def update_plat(request, plat_id):
         
         # Update in Firestore
         plat_ref.update(update_data)
+        catalog.invalidate()
+        # Resized variants of the new image rendered now, not on the first client request
+        if update_data.get('image_url'):
+            dish_images.render_in_background(plat_id, update_data['image_url'])
         
         logger.info(f"Plat {plat_id} updated successfully")
         
@@ -304,12 +353,13 @@ def delete_plat(request, plat_id):
         
         # Delete from Firestore
         plat_ref.delete()
-        
+        popularity_tracker.forget(plat_id)
 
         menu_plat_refs = db.collection('menu_plat').where('idP', '==', plat_id)
         for doc in menu_plat_refs.stream():
             doc.reference.delete()
             logger.info(f"Deleted menu_plat reference: {doc.id}")
+        catalog.invalidate()
         
         logger.info(f"Plat {plat_id} deleted successfully")
         
@@ -327,59 +377,17 @@ def delete_plat(request, plat_id):
 @api_view(['GET'])
 @permission_classes([IsManager])
 def get_plat_cost_details(request, plat_id):
-    """Get detailed cost breakdown of a dish"""
+    """Get detailed cost breakdown of a dish (plat_ingredients x ingredients.cout_par_unite)"""
     try:
         logger.info(f"Fetching cost details for plat {plat_id}")
         
-        # Get plat info
-        plat_ref = db.collection('plats').document(plat_id)
-        plat_doc = plat_ref.get()
-        
-        if not plat_doc.exists:
+        cost_details = get_costing_engine().dish_details(plat_id)
+        if not cost_details:
             return Response(
                 {'error': f'Plat with ID {plat_id} not found'},
                 status=status.HTTP_404_NOT_FOUND
             )
         
-        plat_data = plat_doc.to_dict()
-        
-
-        ingredients = plat_data.get('ingrédients', [])
-
-        ingredient_costs = []
-        total_cost = 0
-        
-
-        for ingredient in ingredients:
-            #random data rien de concret since c du front
-            cost = round(float(0.35 + (hash(ingredient) % 100) / 100), 2)  # Random cost between 0.35 and 1.35
-            quantity = round((hash(ingredient) % 10) / 10 + 0.05, 2)  # Random quantity
-            unit = "kg" if hash(ingredient) % 2 == 0 else "l"
-            
-            ingredient_costs.append({
-                "name": ingredient,
-                "quantity": quantity,
-                "unit": unit,
-                "cost": cost
-            })
-            total_cost += cost
-        
-        # Round to 2 decimal places
-        total_cost = round(total_cost, 2)
-        selling_price = float(plat_data.get('prix', 0))
-        margin = round(selling_price - total_cost, 2)
-        margin_percentage = round((margin / selling_price) * 100, 1) if selling_price > 0 else 0
-        
-        cost_details = {
-            "plat_id": plat_id,
-            "nom": plat_data.get('nom', 'Unknown'),
-            "prix_de_vente": selling_price,
-            "cout_total": total_cost,
-            "marge": margin,
-            "marge_percentage": margin_percentage,
-            "ingredients": ingredient_costs
-        }
-        
         logger.info(f"Retrieved cost details for plat {plat_id}")
         return Response(cost_details, status=status.HTTP_200_OK)
     except Exception as e:
@@ -388,6 +396,28 @@ def get_plat_cost_details(request, plat_id):
             {'error': f"Failed to get plat cost details: {str(e)}"},
             status=status.HTTP_500_INTERNAL_SERVER_ERROR
         )
+
+@api_view(['GET'])
+@permission_classes([IsManager])
+def get_menu_margins(request):
+    """
+    Cost, margin and margin % of every dish in the menu.
+    Query params:
+    - order_by: marge_percentage (default), marge, cout_total, prix_de_vente
+    - desc: true to sort descending
+    """
+    try:
+        order_by = request.query_params.get('order_by', 'marge_percentage')
+        descending = request.query_params.get('desc', 'false').lower() == 'true'
+        
+        report = get_costing_engine().report(order_by=order_by, descending=descending)
+        return Response(report, status=status.HTTP_200_OK)
+    except Exception as e:
+        logger.error(f"Error computing menu margins: {str(e)}", exc_info=True)
+        return Response(
+            {'error': f"Failed to compute menu margins: {str(e)}"},
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
         
 @api_view(['GET'])
 @permission_classes([IsManagerOrChef])
@@ -434,6 +464,7 @@ def add_ingredient(request):
 
         # Add to Firestore - FIXED ORDER OF PARAMETERS
         firebase_crud.create_doc('ingredients', ingredient_data, ingredient_id)
+        catalog.invalidate()
         
         # Create corresponding stock entry
         stock_data = {
@@ -454,6 +485,24 @@ def add_ingredient(request):
         
     except Exception as e:
         return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+@api_view(['GET'])
+@permission_classes([IsManagerOrChef])
+def get_stock_forecast(request):
+    """
+    Burn rate and estimated days until depletion of every ingredient,
+    most urgent first (core.stock_forecast).
+    """
+    try:
+        previsions = stock_forecast.forecast(db)
+        return Response({
+            'ingredients': previsions,
+            'count': len(previsions),
+            'a_commander': sum(1 for p in previsions if p['statut'] != 'ok')
+        }, status=status.HTTP_200_OK)
+    except Exception as e:
+        logger.error(f"Error computing stock forecast: {str(e)}", exc_info=True)
+        return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
 # 3. Restock an ingredient
 @api_view(['POST'])
 @permission_classes([IsManagerOrChef])
@@ -515,32 +564,55 @@ def restock_ingredient(request, ingredient_id):
 @permission_classes([IsManagerOrServer])
 def get_all_reservations(request):
     """
-    Get all reservations with optional filters.
+    Get reservations, ordered by slot.
     Query params:
     - date: Filter by date (YYYY-MM-DD)
+    - start, end: Filter by date range (YYYY-MM-DD, inclusive)
     - status: Filter by status (confirmed, pending, cancelled)
+    - page_size: default 50, max 200
+    - cursor: next_cursor of the previous page
+    Without page_size / cursor, every matching reservation is returned as before
+    ({'reservations': [...]}); with them, one page and its next_cursor.
     """
     try:
-        
         date_filter = request.query_params.get('date', None)
         status_filter = request.query_params.get('status', None)
+        start_filter = request.query_params.get('start', date_filter)
+        end_filter = request.query_params.get('end', date_filter)
+        
+        if 'page_size' not in request.query_params and 'cursor' not in request.query_params:
+            # Unpaged listing of the existing clients, including reservations not indexed yet
+            reservations = firebase_crud.get_all_docs('reservations')
+            if start_filter:
+                reservations = [r for r in reservations if r.get('date_time', '')[:10] >= start_filter]
+            if end_filter:
+                reservations = [r for r in reservations if r.get('date_time', '')[:10] <= end_filter]
+            if status_filter:
+                reservations = [r for r in reservations if r.get('status') == status_filter]
+            reservations.sort(key=lambda x: x.get('date_time', ''))
+            return Response({'reservations': reservations}, status=status.HTTP_200_OK)
+        
+        try:
+            start = reservation_index.day_bounds(datetime.strptime(start_filter, '%Y-%m-%d').date())[0] if start_filter else None
+            end = reservation_index.day_bounds(datetime.strptime(end_filter, '%Y-%m-%d').date())[1] if end_filter else None
+            page_size = int(request.query_params.get('page_size', reservation_index.DEFAULT_PAGE_SIZE))
+        except ValueError as e:
+            return Response({'error': f"Invalid parameter: {str(e)}"}, status=status.HTTP_400_BAD_REQUEST)
+        
+        # Range query on slot_start (see core.reservation_index)
+        reservations, next_cursor = reservation_index.query_reservations(
+            db,
+            start=start,
+            end=end,
+            status=status_filter,
+            cursor=request.query_params.get('cursor'),
+            page_size=page_size
+        )
         
-        
-        reservations = firebase_crud.get_all_docs('reservations')
-        
-        
-        if date_filter:
-            
-            reservations = [r for r in reservations if r.get('date_time', '').startswith(date_filter)]
-            
-        if status_filter:
-           
-            reservations = [r for r in reservations if r.get('status') == status_filter]
-            
-        
-        reservations.sort(key=lambda x: x.get('date_time', ''))
-        
-        return Response({'reservations': reservations}, status=status.HTTP_200_OK)
+        return Response({
+            'reservations': reservations,
+            'next_cursor': next_cursor
+        }, status=status.HTTP_200_OK)
     except Exception as e:
         return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
@@ -558,25 +630,19 @@ def confirm_reservation(request, reservation_id):
             return Response({'error': 'Réservation non trouvée'}, status=status.HTTP_404_NOT_FOUND)
             
        
-        firebase_crud.update_doc('reservations', reservation_id, {
+        # Status change and client notification in one batch
+        batch = db.batch()
+        batch.update(db.collection('reservations').document(reservation_id), {
             'status': 'confirmed',
             'updated_at': firestore.SERVER_TIMESTAMP
         })
-        
-        
-        if 'client_id' in reservation:
-            notification_data = {
-                'recipient_id': reservation['client_id'],
-                'recipient_type': 'client',
-                'title': 'Réservation confirmée',
-                'message': f"Votre réservation pour {reservation.get('date_time', 'la date indiquée')} a été confirmée.",
-                'created_at': firestore.SERVER_TIMESTAMP,
-                'read': False,
-                'type': 'reservation_confirmation',
-                'priority': 'normal',
-                'related_id': reservation_id
-            }
-            firebase_crud.add_doc('notifications', notification_data)
+        dispatch = notification_dispatcher.begin(db, batch)
+        dispatch.notify(
+            notification_dispatcher.client(reservation.get('client_id')), 'reservation_confirmed',
+            date_time=reservation.get('date_time', 'la date indiquée'), related_id=reservation_id
+        )
+        dispatch.commit()
+        floor_plan.invalidate()
         
         return Response({
             'success': True,
@@ -593,31 +659,22 @@ def cancel_reservation(request, reservation_id):
     Change a reservation status to cancelled.
     """
     try:
-       
-        reservation = firebase_crud.get_doc('reservations', reservation_id)
-        if not reservation:
+        # Status change and release of the slot claims in one transaction
+        try:
+            reservation = reservation_booking.cancel_reservation(
+                db, reservation_id, {'updated_at': firestore.SERVER_TIMESTAMP}
+            )
+        except reservation_booking.ReservationNotFound:
             return Response({'error': 'Réservation non trouvée'}, status=status.HTTP_404_NOT_FOUND)
-            
-       
-        firebase_crud.update_doc('reservations', reservation_id, {
-            'status': 'cancelled',
-            'updated_at': firestore.SERVER_TIMESTAMP
-        })
-        
-        
-        if 'client_id' in reservation:
-            notification_data = {
-                'recipient_id': reservation['client_id'],
-                'recipient_type': 'client',
-                'title': 'Réservation annulée',
-                'message': f"Votre réservation pour {reservation.get('date_time', 'la date indiquée')} a été annulée.",
-                'created_at': firestore.SERVER_TIMESTAMP,
-                'read': False,
-                'type': 'reservation_cancellation',
-                'priority': 'normal',
-                'related_id': reservation_id
-            }
-            firebase_crud.add_doc('notifications', notification_data)
+        except reservation_booking.ReservationNotCancellable:
+            return Response({'error': 'Réservation déjà annulée'}, status=status.HTTP_409_CONFLICT)
+        table_availability.apply_reservation(reservation_id, None)
+        floor_plan.invalidate()
+        
+        notification_dispatcher.notify(
+            db, notification_dispatcher.client(reservation.get('client_id')), 'reservation_cancelled',
+            date_time=reservation.get('date_time', 'la date indiquée'), related_id=reservation_id
+        )
         
         return Response({
             'success': True,
@@ -645,50 +702,52 @@ def add_reservation(request):
                 
         
         date_time = f"{data['date']}T{data['heure']}"
+        try:
+            reservation_index.parse_slot(date_time)
+        except ValueError:
+            return Response({'error': "Format de date ou d'heure invalide"}, status=status.HTTP_400_BAD_REQUEST)
         
        
         reservation_id = str(uuid.uuid4())
 
-        tables = firebase_crud.query_collection(
-            'tables', 
-            'nbrPersonne', 
-            '>=', 
-            int(data['nombre_personnes'])
-        )
-        
-        # Filter for available tables
-        available_tables = [t for t in tables if t.get('etatTable') == 'libre']
-        
-        # If no available tables
-        if not available_tables:
-            return Response({
-                'error': 'Pas de table disponible pour ce nombre de personnes'
-            }, status=status.HTTP_400_BAD_REQUEST)
-            
-        
-        selected_table = min(available_tables, key=lambda t: t.get('nbrPersonne', 0))
-        table_id = selected_table.get('id')
-        
+        slot_start = reservation_index.parse_slot(date_time)
+        party_size = int(data['nombre_personnes'])
         
         reservation_data = {
             'client_name': data['nom_client'],  
             'telephone': data['telephone'],
-            'party_size': int(data['nombre_personnes']),
+            'party_size': party_size,
             'date_time': date_time,
             'notes': data.get('notes', ''),
             'status': 'pending',  
-            'table_id': table_id,
             'created_at': firestore.SERVER_TIMESTAMP
         }
         
+        # Smallest tables free for the whole slot (core.table_availability), then a
+        # transactional claim of the slot; on a concurrent booking try the next table
+        table_id = None
+        for candidate in table_availability.find_tables(slot_start, party_size, limit=3):
+            try:
+                reservation_booking.book_table(
+                    db, candidate['id'], reservation_data, party_size,
+                    reservation_id=reservation_id,
+                    table_update={'etatTable': 'reservee', 'updatedAt': firestore.SERVER_TIMESTAMP}
+                )
+            except (reservation_booking.SlotUnavailable, reservation_booking.TableNotFound):
+                continue
+            table_id = candidate['id']
+            break
         
-        firebase_crud.create_doc('reservations', reservation_data, reservation_id)
-        
+        # If no available tables
+        if not table_id:
+            return Response({
+                'error': 'Pas de table disponible pour ce nombre de personnes à cet horaire'
+            }, status=status.HTTP_400_BAD_REQUEST)
         
-        firebase_crud.update_doc('tables', table_id, {
-            'etatTable': 'reservee',
-            'updatedAt': firestore.SERVER_TIMESTAMP
-        })
+        table_availability.apply_reservation(reservation_id, dict(
+            reservation_data, table_id=table_id, slot_start=slot_start
+        ))
+        floor_plan.invalidate()
         
         return Response({
             'success': True,
@@ -806,6 +865,21 @@ def get_active_reservations(request):
             'error': str(e)
         }, status=500)
 
+def _revenue_by_day(request, start_date, end_date):
+    """
+    Revenue and order count per day between two dates (inclusive).
+    Reads the daily rollups; recomputes from the orders with parallel shards
+    (core.range_query) when ?source=orders or when no rollup exists yet for the period.
+    """
+    keys = revenue_rollups.day_keys(start_date, end_date)
+    if request.GET.get('source', 'rollups') != 'orders':
+        buckets = revenue_rollups.read_buckets(db, 'day', keys)
+        if any(bucket is not None for bucket in buckets.values()):
+            return {key: buckets[key] or {'montant': 0, 'commandes': 0} for key in keys}, 'rollups'
+    
+    days = range_query.revenue_from_orders(db, start_date, end_date)['jours']
+    return {key: days.get(key, {'montant': 0, 'commandes': 0}) for key in keys}, 'orders'
+
 # 3. Get daily revenue
 @require_http_methods(["GET"])
 def get_daily_revenue(request):
@@ -814,29 +888,27 @@ def get_daily_revenue(request):
         date_str = request.GET.get('date', datetime.now().strftime('%Y-%m-%d'))
         date_obj = datetime.strptime(date_str, '%Y-%m-%d')
         
-        # Create start and end timestamps for the day
-        start_of_day = datetime.combine(date_obj, datetime.min.time())
-        end_of_day = datetime.combine(date_obj, datetime.max.time())
-        
-        # Query commandes within the date range
-        commandes_ref = db.collection('commandes')
-        commandes = commandes_ref.where('dateCreation', '>=', start_of_day).where('dateCreation', '<=', end_of_day).stream()
-        
-        total_revenue = 0
-        orders_count = 0
+        # One rollup document for the day (see core.revenue_rollups)
+        days, source = _revenue_by_day(request, date_obj.date(), date_obj.date())
+        bucket = days[date_obj.strftime('%Y-%m-%d')]
         
-        for commande in commandes:
-            commande_data = commande.to_dict()
-            if 'montant' in commande_data:
-                total_revenue += commande_data['montant']
-                orders_count += 1
-        
-        return JsonResponse({
+        response_data = {
             'success': True,
             'date': date_str,
-            'daily_revenue': total_revenue,
-            'orders_count': orders_count
-        })
+            'daily_revenue': bucket['montant'],
+            'orders_count': bucket['commandes'],
+            'source': source
+        }
+        
+        # Optional hourly breakdown (24 rollup documents)
+        if request.GET.get('hourly', 'false').lower() == 'true':
+            hour_keys = [f"{date_str}T{hour:02d}" for hour in range(24)]
+            hours = revenue_rollups.read_buckets(db, 'hour', hour_keys)
+            response_data['hourly_breakdown'] = {
+                key[-2:]: (hours[key] or {}).get('montant', 0) for key in hour_keys
+            }
+        
+        return JsonResponse(response_data)
     except Exception as e:
         return JsonResponse({
             'success': False,
@@ -862,22 +934,12 @@ def get_weekly_revenue(request):
         week_end = week_start + timedelta(days=6)
         week_end = datetime.combine(week_end, datetime.max.time())
         
-        # Query commandes within the week
-        commandes_ref = db.collection('commandes')
-        commandes = commandes_ref.where('dateCreation', '>=', week_start).where('dateCreation', '<=', week_end).stream()
-        
-        # Initialize dict to store daily revenue
-        daily_revenue = {(week_start + timedelta(days=i)).strftime('%Y-%m-%d'): 0 for i in range(7)}
-        total_weekly_revenue = 0
-        orders_count = 0
+        # Seven daily rollup documents
+        days, source = _revenue_by_day(request, week_start.date(), week_end.date())
         
-        for commande in commandes:
-            commande_data = commande.to_dict()
-            if 'montant' in commande_data and 'dateCreation' in commande_data:
-                order_date = commande_data['dateCreation'].strftime('%Y-%m-%d')
-                daily_revenue[order_date] = daily_revenue.get(order_date, 0) + commande_data['montant']
-                total_weekly_revenue += commande_data['montant']
-                orders_count += 1
+        daily_revenue = {key: bucket['montant'] for key, bucket in days.items()}
+        total_weekly_revenue = sum(daily_revenue.values())
+        orders_count = sum(bucket['commandes'] for bucket in days.values())
         
         return JsonResponse({
             'success': True,
@@ -885,7 +947,85 @@ def get_weekly_revenue(request):
             'week_end': week_end.strftime('%Y-%m-%d'),
             'daily_breakdown': daily_revenue,
             'total_weekly_revenue': total_weekly_revenue,
-            'orders_count': orders_count
+            'orders_count': orders_count,
+            'source': source
+        })
+    except Exception as e:
+        return JsonResponse({
+            'success': False,
+            'error': str(e)
+        }, status=500)
+
+# Get monthly revenue
+@require_http_methods(["GET"])
+def get_monthly_revenue(request):
+    try:
+        # Month as YYYY-MM, current month by default
+        month_str = request.GET.get('month', datetime.now().strftime('%Y-%m'))
+        month_start = datetime.strptime(month_str, '%Y-%m')
+        next_month = (month_start.replace(day=28) + timedelta(days=4)).replace(day=1)
+        month_end = next_month - timedelta(days=1)
+        
+        days, source = _revenue_by_day(request, month_start.date(), month_end.date())
+        
+        return JsonResponse({
+            'success': True,
+            'month': month_str,
+            'monthly_revenue': round(sum(bucket['montant'] for bucket in days.values()), 2),
+            'orders_count': sum(bucket['commandes'] for bucket in days.values()),
+            'daily_breakdown': {key: bucket['montant'] for key, bucket in days.items()},
+            'source': source
+        })
+    except Exception as e:
+        return JsonResponse({
+            'success': False,
+            'error': str(e)
+        }, status=500)
+
+# Get revenue over an arbitrary date range
+@require_http_methods(["GET"])
+def get_revenue_range(request):
+    try:
+        start_str = request.GET.get('start')
+        end_str = request.GET.get('end')
+        if not start_str or not end_str:
+            return JsonResponse({
+                'success': False,
+                'error': "Les paramètres 'start' et 'end' (YYYY-MM-DD) sont requis"
+            }, status=400)
+        
+        start_date = datetime.strptime(start_str, '%Y-%m-%d').date()
+        end_date = datetime.strptime(end_str, '%Y-%m-%d').date()
+        if end_date < start_date:
+            return JsonResponse({
+                'success': False,
+                'error': "'end' doit être postérieur à 'start'"
+            }, status=400)
+        
+        if request.GET.get('source', 'rollups') == 'orders':
+            # Recompute from the orders, day/week shards queried in parallel
+            totals = range_query.revenue_from_orders(db, start_date, end_date)
+            return JsonResponse({
+                'success': True,
+                'start': start_str,
+                'end': end_str,
+                'total_revenue': totals['montant'],
+                'orders_count': totals['commandes'],
+                'daily_breakdown': {key: bucket['montant'] for key, bucket in totals['jours'].items()},
+                'source': 'orders'
+            })
+        
+        # Whole months read their monthly document, the edges read daily documents
+        totals = revenue_rollups.revenue_for_range(db, start_date, end_date)
+        
+        return JsonResponse({
+            'success': True,
+            'start': start_str,
+            'end': end_str,
+            'total_revenue': totals['montant'],
+            'orders_count': totals['commandes'],
+            'buckets_read': totals['buckets_lus'],
+            'source': 'rollups'
         })
     except Exception as e:
         return JsonResponse({
@@ -893,6 +1033,113 @@ def get_weekly_revenue(request):
             'error': str(e)
         }, status=500)
 
+# Sales analytics (core.sales_analytics)
+def _analytics_period(request):
+    """Optional start/end (YYYY-MM-DD) query params as dates"""
+    start = request.query_params.get('start')
+    end = request.query_params.get('end')
+    return (
+        datetime.strptime(start, '%Y-%m-%d').date() if start else None,
+        datetime.strptime(end, '%Y-%m-%d').date() if end else None
+    )
+
+@api_view(['GET'])
+@permission_classes([IsManager])
+def get_best_sellers(request):
+    """
+    Best selling dishes by quantity.
+    Query params: start, end (YYYY-MM-DD), limit (default 10)
+    """
+    try:
+        start, end = _analytics_period(request)
+        limit = min(int(request.query_params.get('limit', 10)), 100)
+        plats = sales_analytics.best_sellers(start, end, limit=limit)
+        return Response({'plats': plats, 'count': len(plats)}, status=status.HTTP_200_OK)
+    except ValueError as e:
+        return Response({'error': f"Invalid parameter: {str(e)}"}, status=status.HTTP_400_BAD_REQUEST)
+    except Exception as e:
+        logger.error(f"Error computing best sellers: {str(e)}", exc_info=True)
+        return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+@api_view(['GET'])
+@permission_classes([IsManager])
+def get_sales_heatmap(request):
+    """
+    Orders and revenue per weekday and hour of day.
+    Query params: start, end (YYYY-MM-DD)
+    """
+    try:
+        start, end = _analytics_period(request)
+        return Response(sales_analytics.hourly_heatmap(start, end), status=status.HTTP_200_OK)
+    except ValueError as e:
+        return Response({'error': f"Invalid parameter: {str(e)}"}, status=status.HTTP_400_BAD_REQUEST)
+    except Exception as e:
+        logger.error(f"Error computing sales heatmap: {str(e)}", exc_info=True)
+        return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+@api_view(['GET'])
+@permission_classes([IsManager])
+def get_average_ticket(request):
+    """
+    Average and median order amount, items per order.
+    Query params: start, end (YYYY-MM-DD)
+    """
+    try:
+        start, end = _analytics_period(request)
+        return Response(sales_analytics.average_ticket(start, end), status=status.HTTP_200_OK)
+    except ValueError as e:
+        return Response({'error': f"Invalid parameter: {str(e)}"}, status=status.HTTP_400_BAD_REQUEST)
+    except Exception as e:
+        logger.error(f"Error computing average ticket: {str(e)}", exc_info=True)
+        return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+@api_view(['GET'])
+@permission_classes([IsManager])
+def get_attach_rates(request, plat_id):
+    """
+    Dishes most often ordered together with plat_id.
+    Query params: start, end (YYYY-MM-DD), limit (default 10)
+    """
+    try:
+        start, end = _analytics_period(request)
+        limit = min(int(request.query_params.get('limit', 10)), 100)
+        return Response(sales_analytics.attach_rates(plat_id, start, end, limit=limit), status=status.HTTP_200_OK)
+    except ValueError as e:
+        return Response({'error': f"Invalid parameter: {str(e)}"}, status=status.HTTP_400_BAD_REQUEST)
+    except Exception as e:
+        logger.error(f"Error computing attach rates: {str(e)}", exc_info=True)
+        return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+@api_view(['GET'])
+@permission_classes([IsManager])
+def get_sales_leaderboard(request):
+    """
+    Top dishes from the per-dish sales counters (core.sales_counters).
+    Query params:
+    - start, end: YYYY-MM-DD, inclusive (all time when omitted)
+    - limit: default 10
+    - order_by: quantite (default) or chiffre_affaires
+    """
+    try:
+        start, end = _analytics_period(request)
+        if bool(start) != bool(end):
+            return Response({'error': "Provide both 'start' and 'end' or neither"}, status=status.HTTP_400_BAD_REQUEST)
+        limit = min(int(request.query_params.get('limit', 10)), 100)
+        order_by = request.query_params.get('order_by', 'quantite')
+        
+        plats = sales_counters.leaderboard(db, start, end, limit=limit, order_by=order_by)
+        snapshot = catalog.snapshot()
+        for rank, plat in enumerate(plats, start=1):
+            plat['rang'] = rank
+            plat['nom'] = snapshot.plats.get(plat['plat_id'], {}).get('nom', 'Unknown')
+        
+        return Response({'plats': plats, 'count': len(plats)}, status=status.HTTP_200_OK)
+    except ValueError as e:
+        return Response({'error': f"Invalid parameter: {str(e)}"}, status=status.HTTP_400_BAD_REQUEST)
+    except Exception as e:
+        logger.error(f"Error computing sales leaderboard: {str(e)}", exc_info=True)
+        return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
 # 5. Get commande_plat list
 @require_http_methods(["GET"])
 def get_commande_plat_list(request):
@@ -38,6 +38,8 @@ MIDDLEWARE = [
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.common.CommonMiddleware',
+    # ETag from the response body + 304 on If-None-Match (see core.conditional)
+    'django.middleware.http.ConditionalGetMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
@@ -102,6 +104,10 @@ USE_TZ = True
 
 # Static files
 STATIC_URL = 'static/'
+
+# Dish images: originals referenced by a relative image_url, and the resized variants (core.dish_images)
+DISH_IMAGE_SOURCE_DIR = BASE_DIR / 'media' / 'plats'
+DISH_IMAGE_CACHE_DIR = BASE_DIR / 'media' / 'image_cache'
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 ALLOWED_HOSTS = ['192.168.100.13',
                  'localhost', '127.0.0.1']
@@ -39,6 +39,7 @@ urlpatterns = [
     
     # Notifications
     path('notifications/', views.get_notifications, name='get_notifications'),
-    path('notifications/<str:notification_id>/', views.get_notification_details, name='get_notification_details'),
+    path('notifications/unread-count/', views.get_unread_notifications_count, name='get_unread_notifications_count'),
     path('notifications/mark-all-read/', views.mark_all_notifications_read, name='mark_all_notifications_read'),
+    path('notifications/<str:notification_id>/', views.get_notification_details, name='get_notification_details'),
 ]
\ No newline at end of file
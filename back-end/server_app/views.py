@@ -1,6 +1,6 @@
 from django.shortcuts import render
 from django.http import JsonResponse
-from django.views.decorators.http import require_http_methods
+from django.views.decorators.http import condition, require_http_methods
 from django.views.decorators.csrf import csrf_exempt
 from rest_framework.decorators import api_view, authentication_classes, permission_classes
 import json
@@ -8,6 +8,10 @@ from firebase_admin import firestore
 from core.firebase_utils import firebase_config
 from core.authentication import authenticate_firebase_user, FirebaseAuthentication
 from core.orders_utils import get_all_orders, get_orders_by_status
+from core import notification_dispatcher, notifications, revenue_rollups, sales_counters
+from core.sales_analytics import sales_analytics
+from core.floor_plan import floor_plan
+from core.conditional import inbox_condition
 from core.permissions import IsServer
 import logging
 from datetime import datetime
@@ -16,6 +20,15 @@ logger = logging.getLogger(__name__)
 
 # Get Firestore db instance
 db = firebase_config.get_db()
+SERVER_INBOX = notifications.inbox_id('serveur')
+
+
+def _server_inboxes(request):
+    """Inboxes listed by get_notifications: the role inbox (unless inbox=personal) and the personal one"""
+    inboxes = [notifications.inbox_id('employe', request.user.uid)]
+    if request.query_params.get('inbox') != 'personal':
+        inboxes.insert(0, SERVER_INBOX)
+    return inboxes
 
 @api_view(['GET'])
 @authentication_classes([FirebaseAuthentication])
@@ -226,8 +239,14 @@ def update_order_status(request, order_id):
         if not new_status:
             return JsonResponse({'error': 'Status is required'}, status=400)
         
-        # Update the order status
+        # Update the order status, a cancellation also leaves the revenue rollups and sales counters
         order_ref.update({'etat': new_status})
+        floor_plan.invalidate()
+        if new_status in revenue_rollups.CANCELLED_STATES:
+            # Transactions re-reading the order's flags: reversed once even on concurrent cancellations
+            revenue_rollups.reverse_order(db, order_ref)
+            sales_counters.reverse_order(db, order_ref)
+            sales_analytics.mark_cancelled(order_id)
         
         # Return success response
         return JsonResponse({'message': 'Order status updated successfully'})
@@ -257,8 +276,12 @@ def cancel_order(request, order_id):
                 'error': 'Only orders with status "en_attente" can be directly cancelled'
             }, status=400)
         
-        # Update the order status to "annulee"
+        # Update the order status to "annulee" and take it out of the revenue rollups
         order_ref.update({'etat': 'annulee'})
+        revenue_rollups.reverse_order(db, order_ref)
+        sales_counters.reverse_order(db, order_ref)
+        sales_analytics.mark_cancelled(order_id)
+        floor_plan.invalidate()
         
         # Log the cancellation
         logger.info(f"Order {order_id} cancelled by server {request.user.uid}")
@@ -295,9 +318,10 @@ def request_cancel_order(request, order_id):
                 'error': 'Only orders with status "en_preparation" or "pret" can request cancellation'
             }, status=400)
         
-        # Create a cancellation request in the DemandeAnnulation collection
+        # Create the cancellation request and notify every manager in one batch
+        batch = db.batch()
         demande_ref = db.collection('DemandeAnnulation').document()
-        demande_ref.set({
+        batch.set(demande_ref, {
             'idClient': order_data.get('idC'),
             'idServeur': request.user.uid,
             'idCommande': order_id,
@@ -306,18 +330,12 @@ def request_cancel_order(request, order_id):
             'createdAt': firestore.SERVER_TIMESTAMP
         })
         
-        # Create notification for manager - nous ciblons tous les managers
-        notification_ref = db.collection('notifications').document()
-        notification_ref.set({
-            'recipient_type': 'manager',  # Tous les managers verront cette notification
-            'title': 'Nouvelle demande d\'annulation',
-            'message': f'Demande d\'annulation pour la commande {order_id}',
-            'created_at': firestore.SERVER_TIMESTAMP,
-            'read': False,
-            'type': 'cancellation_request',
-            'priority': 'high',
-            'related_id': demande_ref.id
-        })
+        dispatch = notification_dispatcher.begin(db, batch)
+        dispatch.notify(
+            notification_dispatcher.role('manager'), 'cancellation_requested_by_server',
+            order_id=order_id, related_id=demande_ref.id
+        )
+        dispatch.commit()
         
         # Log the cancellation request
         logger.info(f"Cancellation request for order {order_id} created by server {request.user.uid}")
@@ -424,9 +442,8 @@ def get_dashboard(request):
         assistance_ref = db.collection('assistance_requests').where('status', '==', 'pending')
         assistance_count = len(list(assistance_ref.stream()))
         
-        # Get notifications count
-        notifications_ref = db.collection('notifications').where('recipient_type', '==', 'serveur').where('read', '==', False)
-        notifications_count = len(list(notifications_ref.stream()))
+        # Get notifications count (unread counter of the server inbox)
+        notifications_count = notifications.unread_count(db, SERVER_INBOX)
         
         # Get ready orders count
         ready_orders_ref = db.collection('commandes').where('etat', '==', 'prete')
@@ -630,70 +647,11 @@ def get_order_details(request, order_id):
 @api_view(['GET'])
 @authentication_classes([FirebaseAuthentication])
 @permission_classes([IsServer])
+@condition(etag_func=floor_plan.etag)
 def get_all_tables(request):
-    """Get all tables with reservation information"""
+    """Get all tables with reservation information (core.floor_plan, cached)"""
     try:
-        tables = []
-        tables_ref = db.collection('tables')
-        
-        for doc in tables_ref.stream():
-            table_data = doc.to_dict()
-            table_data['id'] = doc.id
-            
-            # Get reservation information for this table
-            reservation_info = None
-            if table_data.get('etatTable') == 'reservee':
-                # Find pending reservation for this table
-                reservations_ref = db.collection('reservations').where('table_id', '==', doc.id).where('status', '==', 'en_attente')
-                for res_doc in reservations_ref.stream():
-                    res_data = res_doc.to_dict()
-                    
-                    # Get client information
-                    client_info = None
-                    if res_data.get('client_id'):
-                        client_ref = db.collection('clients').document(res_data['client_id'])
-                        client_doc = client_ref.get()
-                        if client_doc.exists:
-                            client_data = client_doc.to_dict()
-                            client_info = {
-                                'id': res_data['client_id'],
-                                'username': client_data.get('username', 'Unknown'),
-                                'email': client_data.get('email', 'Unknown')
-                            }
-                    
-                    reservation_info = {
-                        'id': res_doc.id,
-                        'date_time': res_data.get('date_time'),
-                        'party_size': res_data.get('party_size'),
-                        'status': res_data.get('status'),
-                        'client': client_info,
-                        'created_at': res_data.get('created_at')
-                    }
-                    break  # Take the first pending reservation
-            
-            # Get active orders for this table (only for occupied tables)
-            orders = []
-            if table_data.get('etatTable') == 'occupee':
-                # Find confirmed reservations for this table to get client orders
-                reservations_ref = db.collection('reservations').where('table_id', '==', doc.id).where('status', '==', 'confirmee')
-                for res_doc in reservations_ref.stream():
-                    res_data = res_doc.to_dict()
-                    if 'client_id' in res_data:
-                        orders_ref = db.collection('commandes').where('idC', '==', res_data['client_id'])
-                        for order_doc in orders_ref.stream():
-                            order_data = order_doc.to_dict()
-                            if order_data.get('etat') not in ['servie', 'annulee']:
-                                orders.append({
-                                    'id': order_doc.id,
-                                    'etat': order_data.get('etat', 'Unknown'),
-                                    'montant': order_data.get('montant', 0)
-                                })
-            
-            table_data['reservation'] = reservation_info
-            table_data['orders'] = orders
-            tables.append(table_data)
-        
-        return JsonResponse(tables, safe=False)
+        return JsonResponse(floor_plan.get(), safe=False)
     except Exception as e:
         logger.error(f"Error fetching tables: {str(e)}")
         return JsonResponse({'error': str(e)}, status=500)
@@ -749,6 +707,7 @@ def update_table_status(request, table_id):
         
         # Update table status
         table_ref.update({'etatTable': new_status})
+        floor_plan.invalidate()
         
         response_message = 'Table status updated successfully'
         if current_status == 'reservee' and new_status == 'occupee':
@@ -789,6 +748,7 @@ def confirm_reservation(request, table_id):
             
             # Update table status to 'occupee'
             table_ref.update({'etatTable': 'occupee'})
+            floor_plan.invalidate()
             break
         
         if not reservation_found:
@@ -843,42 +803,61 @@ def get_table_orders(request, table_id):
 @api_view(['GET'])
 @authentication_classes([FirebaseAuthentication])
 @permission_classes([IsServer])
+@inbox_condition(_server_inboxes)
 def get_notifications(request):
-    """Get all notifications for the server"""
+    """
+    Get the server inbox, most recent first, one page at a time
+    Query params: page_size (default 50), cursor (X-Next-Cursor of the previous page), unread=true,
+    since (ISO timestamp), inbox=personal for the notifications addressed to this server only
+    """
     try:
-        notifications = []
-        notifications_ref = db.collection('notifications').where('recipient_type', '==', 'serveur').order_by('created_at', direction=firestore.Query.DESCENDING)
-        
-        for doc in notifications_ref.stream():
-            notification_data = doc.to_dict()
-            notification_data['id'] = doc.id
-            notifications.append(notification_data)
-        
-        return JsonResponse(notifications, safe=False)
+        try:
+            page_size, cursor, unread_only = notifications.page_params(request.query_params)
+            since = notifications.since_param(request.query_params)
+        except ValueError:
+            return JsonResponse({'error': 'Invalid page_size or since parameter'}, status=400)
+        
+        # Role inbox and personal inbox merged by one indexed query
+        items, next_cursor = notifications.query_inboxes(
+            db, _server_inboxes(request), page_size=page_size, cursor=cursor, unread_only=unread_only, since=since
+        )
+        
+        response = JsonResponse(items, safe=False)
+        if next_cursor:
+            response['X-Next-Cursor'] = next_cursor
+        return response
     except Exception as e:
         logger.error(f"Error fetching notifications: {str(e)}")
         return JsonResponse({'error': str(e)}, status=500)
 
+@api_view(['GET'])
+@authentication_classes([FirebaseAuthentication])
+@permission_classes([IsServer])
+def get_unread_notifications_count(request):
+    """Unread badges of the server inbox and of this server's personal inbox"""
+    try:
+        return JsonResponse({
+            'unread_count': notifications.unread_count(db, SERVER_INBOX),
+            'personal_unread_count': notifications.unread_count(db, notifications.inbox_id('employe', request.user.uid))
+        })
+    except Exception as e:
+        logger.error(f"Error fetching unread notifications count: {str(e)}")
+        return JsonResponse({'error': str(e)}, status=500)
+
 @api_view(['GET'])
 @authentication_classes([FirebaseAuthentication])
 @permission_classes([IsServer])
 def get_notification_details(request, notification_id):
     """Get detailed information about a specific notification"""
     try:
-        notification_ref = db.collection('notifications').document(notification_id)
-        notification_doc = notification_ref.get()
+        # Mark as read if not already (role inbox first, then the personal one)
+        notification_data = notifications.mark_read(db, SERVER_INBOX, notification_id)
+        if notification_data is None:
+            notification_data = notifications.mark_read(db, notifications.inbox_id('employe', request.user.uid), notification_id)
         
-        if not notification_doc.exists:
+        if notification_data is None:
             return JsonResponse({'error': 'Notification not found'}, status=404)
         
-        notification_data = notification_doc.to_dict()
-        notification_data['id'] = notification_doc.id
-        
-        # Mark as read if not already
-        if not notification_data.get('read', False):
-            notification_ref.update({'read': True})
-            notification_data['read'] = True
-        
         # Get related entity details if it exists
         if 'related_id' in notification_data and notification_data.get('type') == 'order_ready':
             order_ref = db.collection('commandes').document(notification_data['related_id'])
@@ -904,27 +883,9 @@ def get_notification_details(request, notification_id):
 def mark_all_notifications_read(request):
     """Mark all notifications as read for the current server"""
     try:
-        # Get server ID from authenticated user
-        server_id = request.user.uid
-        
-        # Get all unread notifications for this server
-        notifications_ref = db.collection('notifications')\
-            .where('recipient_type', '==', 'serveur')\
-            .where('read', '==', False)\
-            .stream()
-        
-        batch = db.batch()
-        count = 0
-        
-        for doc in notifications_ref:
-            batch.update(doc.reference, {
-                'read': True,
-                'read_at': datetime.now().isoformat()
-            })
-            count += 1
-        
-        # Execute batch update
-        batch.commit()
+        # Role inbox shared by every server, then this server's personal inbox
+        count = notifications.mark_all_read(db, SERVER_INBOX)
+        count += notifications.mark_all_read(db, notifications.inbox_id('employe', request.user.uid))
         
         return JsonResponse({
             'success': True,